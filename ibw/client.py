@@ -7,6 +7,7 @@ import urllib
 import urllib3
 import certifi
 import logging
+import random
 import pathlib
 import requests
 import textwrap
@@ -18,6 +19,16 @@ from typing import Dict
 
 from urllib3.exceptions import InsecureRequestWarning
 from ibw.clientportal import ClientPortal
+from ibw.transport import RequestsTransport
+from ibw.transport import RecordingTransport
+from ibw.metrics import MetricsRegistry
+from ibw.metrics import request_body_size
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional, without it the responses are decoded by the standard library
+    orjson = None
 
 urllib3.disable_warnings(category=InsecureRequestWarning)
 # http = urllib3.PoolManager(cert_reqs='CERT_REQUIRED', ca_certs=certifi.where())
@@ -41,7 +52,7 @@ logging.basicConfig(
 
 class IBClient():
 
-    def __init__(self, username: str, account: str, client_gateway_path: str = None, is_server_running: bool = True) -> None:
+    def __init__(self, username: str, account: str, client_gateway_path: str = None, is_server_running: bool = True, transport: object = None, metrics: object = None) -> None:
         #Changed the "client_gatewat_path: str = None" to "client_gatewat_path: str = gateway_path " where "gateway_path = pathlib.Path('clientportal.gw').resolve()" as defined above
         
         """Initalizes a new instance of the IBClient Object.
@@ -56,6 +67,12 @@ class IBClient():
         ----
         password {str} -- Your IB account password for either your paper or regular account. (default:{""})
 
+        transport {object} -- The transport the requests are sent through, e.g. a `ReplayTransport` to serve
+            a recorded session back without a gateway. (default:{RequestsTransport()})
+
+        metrics {object} -- The sink the latency, size and outcome of every request are reported to, any
+            object with `request_started()` and `request_finished()` methods. (default:{MetricsRegistry()})
+
         Usage:
         ----
             >>> ib_paper_session = IBClient(
@@ -79,6 +96,12 @@ class IBClient():
         self.session_state_path: pathlib.Path = pathlib.Path(__file__).parent.joinpath('server_session.json').resolve()
         self.authenticated = False
         self._is_server_running = is_server_running
+        self.transport = transport if transport is not None else RequestsTransport()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+
+        # Response bodies are only logged for a sample of the requests and cut to a limit
+        self.log_body_sample_rate = 0.01
+        self.log_body_limit = 2048
 
         # Define URL Components
         ib_gateway_host = r"https://localhost"
@@ -680,13 +703,29 @@ class IBClient():
         # Define the headers.
         headers = self._headers(mode=headers)
 
-        # Make the request.
-        if req_type == 'POST':
-            response = requests.post(url=url, headers=headers, params=params, json=json, verify=False)
-        elif req_type == 'GET':
-            response = requests.get(url=url, headers=headers, params=params, json=json, verify=False)
-        elif req_type == 'DELETE':
-            response = requests.delete(url=url, headers=headers, params=params, json=json, verify=False)
+        # Make the request, timing it for the metrics.
+        self.metrics.request_started(method=req_type, endpoint=endpoint)
+        start_time = time.perf_counter()
+        try:
+            response = self.transport.request(method=req_type, url=url, headers=headers, params=params, json=json)
+        except Exception:
+            self.metrics.request_finished(
+                method=req_type,
+                endpoint=endpoint,
+                latency=time.perf_counter() - start_time,
+                error=True
+            )
+            raise
+
+        latency = time.perf_counter() - start_time
+        self.metrics.request_finished(
+            method=req_type,
+            endpoint=endpoint,
+            latency=latency,
+            bytes_sent=request_body_size(response),
+            bytes_received=len(response.content),
+            error=not response.ok
+        )
 
         # grab the status code
         status_code = response.status_code
@@ -697,34 +736,84 @@ class IBClient():
         # Check to see if it was successful
         if response.ok:
 
-            if response_headers.get('Content-Type','null') == 'application/json;charset=utf-8':
-                data = response.json()
-            else:
-                data = response.json()
-
-            # Log it.
-            logging.debug('''
-            Response Text: {resp_text}
-            Response URL: {resp_url}
-            Response Code: {resp_code}
-            Response JSON: {resp_json}
-            Response Headers: {resp_headers}
-            '''.format(
-                    resp_text=response.text,
-                    resp_url=response.url,
-                    resp_code=status_code,
-                    resp_json=data,
-                    resp_headers=response_headers
-                )
-            )
+            data = _decode_json(content=response.content)
+
+            # Log it, nothing is formatted unless debug logging is on.
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                self._log_response(req_type=req_type, endpoint=endpoint, response=response, latency=latency)
 
             return data
 
         # if it was a bad request print it out.
         elif not response.ok and url != 'https://localhost:5000/v1/portal/iserver/account':
+            self._log_response(req_type=req_type, endpoint=endpoint, response=response, latency=latency, level=logging.WARNING)
             print(url)
             raise requests.HTTPError()
 
+    def _log_response(self, req_type: str, endpoint: str, response: requests.Response, latency: float, level: int = logging.DEBUG) -> None:
+        """Logs the timing of a request, along with a capped sample of the response body.
+
+        Arguments:
+        ----
+        req_type {str} -- The HTTP method of the request.
+
+        endpoint {str} -- The endpoint of the request.
+
+        response {requests.Response} -- The response of the gateway.
+
+        latency {float} -- The time the request took in seconds.
+
+        level {int} -- The logging level. Failed requests always log their body. (default: {logging.DEBUG})
+        """
+
+        logging.log(
+            level,
+            'method=%s endpoint=%s status=%s latency_ms=%.1f bytes=%d',
+            req_type,
+            endpoint,
+            response.status_code,
+            latency * 1000,
+            len(response.content)
+        )
+
+        if level > logging.DEBUG or random.random() < self.log_body_sample_rate:
+            body = response.text
+            if len(body) > self.log_body_limit:
+                body = '{head}... ({size} more characters)'.format(
+                    head=body[:self.log_body_limit],
+                    size=len(body) - self.log_body_limit
+                )
+            logging.log(level, 'method=%s endpoint=%s body=%s', req_type, endpoint, body)
+
+    def start_recording(self, record_path: str) -> None:
+        """Starts recording every request and response to a file.
+
+        The recording can be served back later with a `ReplayTransport`, so a trading
+        session can be replayed without a gateway or outside of market hours.
+
+        Arguments:
+        ----
+        record_path {str} -- The file the requests and responses are appended to.
+
+        Usage:
+        ----
+            >>> ib_client.start_recording(record_path='recordings/2021-04-15.jsonl')
+            >>> ib_client.market_data_history(conid='265598', period='1d', bar='1min')
+            >>> ib_client.stop_recording()
+        """
+
+        if isinstance(self.transport, RecordingTransport):
+            self.stop_recording()
+
+        self.transport = RecordingTransport(record_path=record_path, transport=self.transport)
+
+    def stop_recording(self) -> None:
+        """Stops recording and goes back to the transport used before the recording started."""
+
+        if isinstance(self.transport, RecordingTransport):
+            self.transport.close()
+            self.transport = self.transport.transport
+
     def _prepare_arguments_list(self, parameter_list: List[str]) -> str:
         """Prepares the arguments for the request.
 
@@ -1465,7 +1554,7 @@ class IBClient():
         """
 
         # define request components
-        endpoint = r'​portfolio/subaccounts'
+        endpoint = r'portfolio/subaccounts'
         req_type = 'GET'
         content = self._make_request(
             endpoint=endpoint,
@@ -2161,3 +2250,20 @@ class IBClient():
         )
 
         return content
+
+
+def _decode_json(content: bytes) -> Union[Dict,List]:
+    """Decodes a response body, with orjson when it is installed.
+
+    orjson is several times faster than the standard library on large responses,
+    e.g. the candles of a long market data history. Bodies it rejects, such as
+    ones holding NaN, are handed to the standard library.
+    """
+
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(content)
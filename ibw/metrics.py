@@ -0,0 +1,336 @@
+import re
+import math
+import threading
+import http.server
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Optional
+
+# The upper bounds of the latency buckets in seconds, from 1ms doubling every two buckets up to about 65s
+LATENCY_BUCKETS = tuple(0.001 * 2 ** (i / 2) for i in range(33))
+
+# Path segments holding an id, e.g. an account, a conid or an order id
+_ID_SEGMENT = re.compile(r'[^/]*\d[^/]*')
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Turns an endpoint into a metric label, replacing the segments which hold an id with `{id}`.
+
+    Arguments:
+    ----
+    endpoint {str} -- The endpoint of the request, e.g. 'portfolio/U1234567/positions/0'.
+
+    Returns:
+    ----
+    {str} -- The label, e.g. 'portfolio/{id}/positions/{id}'.
+    """
+
+    return _ID_SEGMENT.sub('{id}', endpoint.split('?', 1)[0].strip('/'))
+
+
+class EndpointMetrics():
+
+    def __init__(self) -> None:
+        """The metrics of the requests made to one endpoint."""
+
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float, bytes_sent: int, bytes_received: int, error: bool) -> None:
+        """Adds a finished request to the metrics."""
+
+        self.requests += 1
+        self.errors += int(error)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+        # The buckets double every two steps, so the bucket can be computed rather than searched
+        if latency <= LATENCY_BUCKETS[0]:
+            bucket = 0
+        else:
+            bucket = min(math.ceil(2 * math.log2(latency / LATENCY_BUCKETS[0]) - 1e-9), len(LATENCY_BUCKETS))
+        self.latency_buckets[bucket] += 1
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Estimates a latency percentile from the histogram.
+
+        Arguments:
+        ----
+        percentile {float} -- The percentile, between 0 and 100.
+
+        Returns:
+        ----
+        {Optional[float]} -- The latency in seconds, interpolated within its bucket, or None
+            if there have been no requests.
+        """
+
+        if self.requests == 0:
+            return None
+
+        rank = percentile / 100.0 * self.requests
+        cumulative = 0
+        for bucket, count in enumerate(self.latency_buckets):
+            if count and cumulative + count >= rank:
+                lower = LATENCY_BUCKETS[bucket - 1] if bucket > 0 else 0.0
+                upper = LATENCY_BUCKETS[bucket] if bucket < len(LATENCY_BUCKETS) else self.latency_max
+                upper = min(upper, self.latency_max)
+                return lower + (upper - lower) * max(rank - cumulative, 0) / count
+            cumulative += count
+
+        return self.latency_max
+
+
+class MetricsRegistry():
+
+    def __init__(self) -> None:
+        """Collects the metrics of every request the IBClient makes, per method and endpoint.
+
+        The registry is the default metrics sink of the IBClient. Any object with the
+        `request_started()` and `request_finished()` methods can be used instead, to
+        forward the metrics to another system.
+
+        Usage:
+        ----
+            >>> ib_client = IBClient(username='IB_PAPER_USERNAME', account='IB_PAPER_ACCOUNT')
+            >>> ib_client.market_data_history(conid='265598', period='1d', bar='1min')
+            >>> ib_client.metrics.snapshot()
+            {
+                ('GET', 'iserver/marketdata/history'): {
+                    'requests': 1,
+                    'errors': 0,
+                    'in_flight': 0,
+                    'bytes_sent': 0,
+                    'bytes_received': 41934,
+                    'latency_p50': 0.25,
+                    'latency_p95': 0.25,
+                    'latency_p99': 0.25,
+                    'latency_max': 0.2573
+                }
+            }
+        """
+
+        self._endpoints: Dict[Tuple[str,str], EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint_metrics(self, method: str, endpoint: str) -> EndpointMetrics:
+        key = (method, endpoint_label(endpoint))
+        if key not in self._endpoints:
+            self._endpoints[key] = EndpointMetrics()
+
+        return self._endpoints[key]
+
+    def request_started(self, method: str, endpoint: str) -> None:
+        """Counts a request as in flight.
+
+        Arguments:
+        ----
+        method {str} -- The HTTP method of the request.
+
+        endpoint {str} -- The endpoint of the request.
+        """
+
+        with self._lock:
+            self._endpoint_metrics(method, endpoint).in_flight += 1
+
+    def request_finished(self, method: str, endpoint: str, latency: float, bytes_sent: int = 0, bytes_received: int = 0, error: bool = False) -> None:
+        """Records a finished request.
+
+        Arguments:
+        ----
+        method {str} -- The HTTP method of the request.
+
+        endpoint {str} -- The endpoint of the request.
+
+        latency {float} -- The time the request took in seconds.
+
+        bytes_sent {int} -- The size of the request payload. (default: {0})
+
+        bytes_received {int} -- The size of the response body. (default: {0})
+
+        error {bool} -- Whether the request failed. (default: {False})
+        """
+
+        with self._lock:
+            endpoint_metrics = self._endpoint_metrics(method, endpoint)
+            endpoint_metrics.in_flight -= 1
+            endpoint_metrics.observe(latency=latency, bytes_sent=bytes_sent, bytes_received=bytes_received, error=error)
+
+    def snapshot(self) -> Dict[Tuple[str,str], Dict]:
+        """Returns the current metrics of every endpoint.
+
+        Returns:
+        ----
+        {Dict[Tuple[str,str], Dict]} -- The metrics keyed by the method and the endpoint label.
+        """
+
+        with self._lock:
+            return {
+                key: {
+                    'requests': endpoint_metrics.requests,
+                    'errors': endpoint_metrics.errors,
+                    'in_flight': endpoint_metrics.in_flight,
+                    'bytes_sent': endpoint_metrics.bytes_sent,
+                    'bytes_received': endpoint_metrics.bytes_received,
+                    'latency_p50': endpoint_metrics.latency_percentile(50),
+                    'latency_p95': endpoint_metrics.latency_percentile(95),
+                    'latency_p99': endpoint_metrics.latency_percentile(99),
+                    'latency_max': endpoint_metrics.latency_max
+                }
+                for key, endpoint_metrics in self._endpoints.items()
+            }
+
+    def reset(self) -> None:
+        """Clears the metrics of every endpoint, the requests still in flight are kept."""
+
+        with self._lock:
+            for key, endpoint_metrics in list(self._endpoints.items()):
+                self._endpoints[key] = EndpointMetrics()
+                self._endpoints[key].in_flight = endpoint_metrics.in_flight
+
+    def to_text(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format.
+
+        Returns:
+        ----
+        {str} -- The metrics, one sample per line.
+        """
+
+        counters = [
+            ('ibw_requests_total', 'counter', 'The number of requests made.', 'requests'),
+            ('ibw_request_errors_total', 'counter', 'The number of requests which failed.', 'errors'),
+            ('ibw_request_bytes_sent_total', 'counter', 'The bytes sent in request payloads.', 'bytes_sent'),
+            ('ibw_response_bytes_received_total', 'counter', 'The bytes received in response bodies.', 'bytes_received'),
+            ('ibw_requests_in_flight', 'gauge', 'The number of requests waiting for a response.', 'in_flight')
+        ]
+
+        with self._lock:
+            endpoints = sorted(
+                (method, endpoint, _labels(method=method, endpoint=endpoint), endpoint_metrics)
+                for (method, endpoint), endpoint_metrics in self._endpoints.items()
+            )
+
+            lines: List[str] = []
+            for name, metric_type, description, attribute in counters:
+                lines.append('# HELP {name} {description}'.format(name=name, description=description))
+                lines.append('# TYPE {name} {metric_type}'.format(name=name, metric_type=metric_type))
+                for _, _, labels, endpoint_metrics in endpoints:
+                    lines.append('{name}{{{labels}}} {value}'.format(name=name, labels=labels, value=getattr(endpoint_metrics, attribute)))
+
+            name = 'ibw_request_duration_seconds'
+            lines.append('# HELP {name} The time the requests took.'.format(name=name))
+            lines.append('# TYPE {name} histogram'.format(name=name))
+            for _, _, labels, endpoint_metrics in endpoints:
+                cumulative = 0
+                for upper, count in zip(LATENCY_BUCKETS, endpoint_metrics.latency_buckets):
+                    cumulative += count
+                    lines.append('{name}_bucket{{{labels},le="{upper:.6g}"}} {count}'.format(name=name, labels=labels, upper=upper, count=cumulative))
+                lines.append('{name}_bucket{{{labels},le="+Inf"}} {count}'.format(name=name, labels=labels, count=endpoint_metrics.requests))
+                lines.append('{name}_sum{{{labels}}} {value:.6f}'.format(name=name, labels=labels, value=endpoint_metrics.latency_sum))
+                lines.append('{name}_count{{{labels}}} {count}'.format(name=name, labels=labels, count=endpoint_metrics.requests))
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer():
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9464) -> None:
+        """Serves the metrics of a registry in the Prometheus text format on a local port.
+
+        Arguments:
+        ----
+        registry {MetricsRegistry} -- The registry to serve.
+
+        host {str} -- The address to listen on. (default: {'127.0.0.1'})
+
+        port {int} -- The port to listen on, 0 picks a free port. (default: {9464})
+
+        Usage:
+        ----
+            >>> metrics_server = MetricsServer(registry=ib_client.metrics, port=9464)
+            >>> metrics_server.start()
+            >>> # curl http://127.0.0.1:9464/metrics
+            >>> metrics_server.stop()
+        """
+
+        self.registry = registry
+        self.host = host
+        self.port = port
+
+        self._server = None
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts serving the metrics from a background thread."""
+
+        if self._server is not None:
+            return
+
+        registry = self.registry
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = registry.to_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ibw-metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving the metrics."""
+
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+        self._server = None
+        self._thread = None
+
+
+def _labels(**labels: str) -> str:
+    """Formats the labels of a sample, escaping the values."""
+
+    return ','.join(
+        '{name}="{value}"'.format(name=name, value=value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+
+
+def request_body_size(response: object) -> int:
+    """Returns the size in bytes of the body of the request a response answers, as `requests` sent it.
+    A response without a prepared request, e.g. one served from a recording, counts 0 bytes.
+    """
+
+    body = getattr(getattr(response, 'request', None), 'body', None)
+    if body is None:
+        return 0
+
+    return len(body)
@@ -0,0 +1,239 @@
+import json
+import time
+import pathlib
+import requests
+import threading
+import collections
+
+from typing import Union
+from typing import Dict
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+class RequestsTransport():
+
+    """Sends the requests of the IBClient to the gateway with the `requests` library."""
+
+    def request(self, method: str, url: str, headers: Dict = None, params: Dict = None, json: Union[Dict,list] = None) -> requests.Response:
+        """Sends a request.
+
+        Arguments:
+        ----
+        method {str} -- The HTTP method, can be one of ['GET','POST','DELETE'].
+
+        url {str} -- The full URL of the endpoint.
+
+        headers {Dict} -- The headers of the request.
+
+        params {Dict} -- The query parameters of the request.
+
+        json {Union[Dict,list]} -- The JSON payload of the request.
+
+        Returns:
+        ----
+        {requests.Response} -- The response of the gateway.
+        """
+
+        return requests.request(method=method, url=url, headers=headers, params=params, json=json, verify=False)
+
+
+class RecordingTransport():
+
+    def __init__(self, record_path: Union[str,pathlib.Path], transport: object = None) -> None:
+        """Records every request and response that goes through another transport.
+
+        Every exchange is appended as one line of compact JSON to the record file, along
+        with the time it was sent relative to the start of the recording, so the session
+        can be served back later by a `ReplayTransport`.
+
+        Arguments:
+        ----
+        record_path {Union[str,pathlib.Path]} -- The file the exchanges are appended to.
+
+        transport {object} -- The transport that actually sends the requests. (default: {RequestsTransport()})
+
+        Usage:
+        ----
+            >>> ib_client.start_recording(record_path='recordings/2021-04-15.jsonl')
+        """
+
+        self.record_path = pathlib.Path(record_path)
+        self.record_path.parent.mkdir(parents=True, exist_ok=True)
+        self.transport = transport if transport is not None else RequestsTransport()
+
+        self._start_time = time.monotonic()
+        self._lock = threading.Lock()
+        self._record_file = open(self.record_path, mode='a', encoding='utf-8')
+
+    def request(self, method: str, url: str, headers: Dict = None, params: Dict = None, json: Union[Dict,list] = None) -> requests.Response:
+        """Sends a request through the wrapped transport and records the exchange."""
+
+        sent_at = time.monotonic() - self._start_time
+        response = self.transport.request(method=method, url=url, headers=headers, params=params, json=json)
+        elapsed = time.monotonic() - self._start_time - sent_at
+
+        record = {
+            't': round(sent_at, 6),
+            'elapsed': round(elapsed, 6),
+            'method': method,
+            'path': urlsplit(url).path,
+            'params': params,
+            'json': json,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'body': response.content.decode('utf-8', errors='replace')
+        }
+
+        with self._lock:
+            self._record_file.write(_dumps(record) + '\n')
+            self._record_file.flush()
+
+        return response
+
+    def close(self) -> None:
+        """Closes the record file."""
+
+        with self._lock:
+            self._record_file.close()
+
+
+class ReplayResponse():
+
+    def __init__(self, url: str, status_code: int, content_type: Optional[str], body: str) -> None:
+        """A response served from a recording, it has the parts of `requests.Response` the IBClient uses."""
+
+        self.url = url
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {'Content-Type': content_type} if content_type else {}
+        self.text = body
+        self.content = body.encode('utf-8')
+
+    def json(self) -> Union[Dict,list]:
+        return json.loads(self.text)
+
+
+class ReplayTransport():
+
+    def __init__(self, record_path: Union[str,pathlib.Path], speed: Optional[float] = 1.0, match: str = 'exact') -> None:
+        """Serves the responses of a recording back instead of sending the requests to the gateway.
+
+        A request is answered with the next recorded response for the same method, path,
+        parameters and payload, so the replay can't diverge from the recording without an error.
+
+        Arguments:
+        ----
+        record_path {Union[str,pathlib.Path]} -- The file written by a `RecordingTransport`.
+
+        speed {Optional[float]} -- How fast the recording is played back. 1.0 holds every response
+            until the time it was recorded at, 10.0 plays back ten times faster and None serves
+            every response immediately. (default: {1.0})
+
+        match {str} -- Either 'exact', or 'path' to fall back on the next recorded response for the
+            same method and path when there is no exact match, e.g. when order ids change between
+            runs. The fallback can serve a response recorded for other parameters. (default: {'exact'})
+
+        Raises:
+        ----
+        ValueError: If `match` isn't 'exact' or 'path'.
+
+        Usage:
+        ----
+            >>> replay_client = IBClient(
+                username='IB_PAPER_USERNAME',
+                account='IB_PAPER_ACCOUNT',
+                transport=ReplayTransport(record_path='recordings/2021-04-15.jsonl', speed=None)
+            )
+        """
+
+        if match not in ('exact', 'path'):
+            raise ValueError("match must be 'exact' or 'path', not {match!r}.".format(match=match))
+
+        self.record_path = pathlib.Path(record_path)
+        self.speed = speed
+        self.match = match
+
+        # Both queues hold the position of the records, a record served from one is skipped in the other
+        self._records = []
+        self._served = []
+        self._exact_queues = collections.defaultdict(collections.deque)
+        self._path_queues = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._start_time = None
+
+        with open(self.record_path, mode='r', encoding='utf-8') as record_file:
+            for line in record_file:
+                # A line can be cut short if the recording process was killed while writing it
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                position = len(self._records)
+                self._records.append(record)
+                self._served.append(False)
+                self._exact_queues[self._exact_key(record['method'], record['path'], record['params'], record['json'])].append(position)
+                self._path_queues[(record['method'], record['path'])].append(position)
+
+    @staticmethod
+    def _exact_key(method: str, path: str, params: Optional[Dict], payload: Optional[Union[Dict,list]]) -> tuple:
+        return (method, path, _dumps(params, sort_keys=True), _dumps(payload, sort_keys=True))
+
+    def _next_unserved(self, queue: collections.deque) -> Optional[int]:
+        """Drops the records which have already been served from the front of a queue and pops the next one."""
+
+        while queue and self._served[queue[0]]:
+            queue.popleft()
+
+        return queue.popleft() if queue else None
+
+    def request(self, method: str, url: str, headers: Dict = None, params: Dict = None, json: Union[Dict,list] = None) -> ReplayResponse:
+        """Serves the recorded response for a request.
+
+        Raises:
+        ----
+        LookupError: If there are no more recorded responses for the request, or for its method and
+            path with match='path'.
+        """
+
+        path = urlsplit(url).path
+
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+
+            # Prefer an exact match, then fall back on the next response for the same endpoint if allowed
+            position = self._next_unserved(self._exact_queues[self._exact_key(method, path, params, json)])
+            if position is None and self.match == 'path':
+                position = self._next_unserved(self._path_queues[(method, path)])
+            if position is None:
+                raise LookupError("There are no more recorded responses for {method} {path} with params {params} and payload {payload}.".format(
+                    method=method,
+                    path=path,
+                    params=_dumps(params, sort_keys=True),
+                    payload=_dumps(json, sort_keys=True)
+                ))
+
+            self._served[position] = True
+            record = self._records[position]
+
+            wait_time = 0.0
+            if self.speed:
+                wait_time = self._start_time + (record['t'] + record['elapsed']) / self.speed - time.monotonic()
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+        return ReplayResponse(
+            url=url,
+            status_code=record['status'],
+            content_type=record['content_type'],
+            body=record['body']
+        )
+
+
+def _dumps(obj: object, sort_keys: bool = False) -> str:
+    """Dumps an object to compact JSON."""
+
+    return json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys, default=str)
@@ -0,0 +1,298 @@
+import os
+import ssl
+import base64
+import socket
+import struct
+import hashlib
+
+from typing import Dict
+from typing import Tuple
+from typing import Optional
+from urllib.parse import urlsplit
+
+# The GUID every server appends to the handshake key, see RFC 6455
+HANDSHAKE_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def accept_key(key: bytes) -> bytes:
+    """Returns the `Sec-WebSocket-Accept` value the server answers a handshake key with."""
+
+    return base64.b64encode(hashlib.sha1(key + HANDSHAKE_GUID).digest())
+
+
+def encode_frame(payload: bytes, opcode: int = OPCODE_TEXT, mask: bool = True) -> bytes:
+    """Encodes a single, final frame. Frames sent by a client must be masked, frames sent by a server must not.
+
+    Arguments:
+    ----
+    payload {bytes} -- The payload of the frame.
+
+    opcode {int} -- The opcode of the frame. (default: {OPCODE_TEXT})
+
+    mask {bool} -- Mask the payload. (default: {True})
+
+    Returns:
+    ----
+    {bytes} -- The frame.
+    """
+
+    length = len(payload)
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0x00
+
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 2 ** 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+
+    if not mask:
+        return bytes(header) + payload
+
+    masking_key = os.urandom(4)
+    return bytes(header) + masking_key + _apply_mask(payload=payload, masking_key=masking_key)
+
+
+def decode_frame(buffer: bytearray) -> Optional[Tuple[bool, int, bytes, int]]:
+    """Decodes the frame at the start of a buffer.
+
+    Arguments:
+    ----
+    buffer {bytearray} -- The bytes received so far.
+
+    Returns:
+    ----
+    {Optional[Tuple[bool, int, bytes, int]]} -- Whether the frame is final, its opcode, its unmasked
+        payload and its size in the buffer, or None if the buffer doesn't hold the whole frame yet.
+    """
+
+    if len(buffer) < 2:
+        return None
+
+    is_final = bool(buffer[0] & 0x80)
+    opcode = buffer[0] & 0x0F
+    is_masked = bool(buffer[1] & 0x80)
+    length = buffer[1] & 0x7F
+    position = 2
+
+    if length == 126:
+        if len(buffer) < position + 2:
+            return None
+        length = struct.unpack_from('!H', buffer, position)[0]
+        position += 2
+    elif length == 127:
+        if len(buffer) < position + 8:
+            return None
+        length = struct.unpack_from('!Q', buffer, position)[0]
+        position += 8
+
+    masking_key = None
+    if is_masked:
+        if len(buffer) < position + 4:
+            return None
+        masking_key = bytes(buffer[position:position + 4])
+        position += 4
+
+    if len(buffer) < position + length:
+        return None
+
+    payload = bytes(buffer[position:position + length])
+    if masking_key is not None:
+        payload = _apply_mask(payload=payload, masking_key=masking_key)
+
+    return is_final, opcode, payload, position + length
+
+
+def _apply_mask(payload: bytes, masking_key: bytes) -> bytes:
+    """XORs a payload with a masking key, a whole integer at a time rather than byte by byte."""
+
+    length = len(payload)
+    if length == 0:
+        return payload
+
+    repeated_key = (masking_key * (length // 4 + 1))[:length]
+    masked = int.from_bytes(payload, 'big') ^ int.from_bytes(repeated_key, 'big')
+
+    return masked.to_bytes(length, 'big')
+
+
+class WebSocketConnection():
+
+    def __init__(self, url: str, headers: Dict[str,str] = None, timeout: float = 10.0) -> None:
+        """A minimal websocket client, enough for the Client Portal streaming endpoint.
+
+        The gateway serves a self signed certificate, so like the requests made by the
+        IBClient, the certificate isn't verified.
+
+        Arguments:
+        ----
+        url {str} -- The websocket URL, e.g. 'wss://localhost:5000/v1/api/ws'.
+
+        headers {Dict[str,str]} -- Extra headers for the handshake, e.g. a session cookie. (default: {None})
+
+        timeout {float} -- The timeout of the socket in seconds. `recv()` raises `socket.timeout`
+            when no frame arrives in time, without losing a partly received frame. (default: {10.0})
+
+        Usage:
+        ----
+            >>> connection = WebSocketConnection(url='wss://localhost:5000/v1/api/ws')
+            >>> connection.connect()
+            >>> connection.send('smd+265598+{"fields":["31","84","86"]}')
+            >>> connection.recv()
+        """
+
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+
+        self._socket = None
+        self._buffer = bytearray()
+        self._fragments = []
+
+    @property
+    def connected(self) -> bool:
+        return self._socket is not None
+
+    def connect(self) -> None:
+        """Opens the connection and performs the handshake.
+
+        Raises:
+        ----
+        ConnectionError: If the server doesn't accept the handshake.
+        """
+
+        url_parts = urlsplit(self.url)
+        is_secure = url_parts.scheme == 'wss'
+        port = url_parts.port or (443 if is_secure else 80)
+        path = url_parts.path or '/'
+        if url_parts.query:
+            path += '?' + url_parts.query
+
+        raw_socket = socket.create_connection((url_parts.hostname, port), timeout=self.timeout)
+        raw_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if is_secure:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+            raw_socket = ssl_context.wrap_socket(raw_socket, server_hostname=url_parts.hostname)
+
+        key = base64.b64encode(os.urandom(16))
+        request_lines = [
+            'GET {path} HTTP/1.1'.format(path=path),
+            'Host: {host}:{port}'.format(host=url_parts.hostname, port=port),
+            'Upgrade: websocket',
+            'Connection: Upgrade',
+            'Sec-WebSocket-Key: {key}'.format(key=key.decode('ascii')),
+            'Sec-WebSocket-Version: 13'
+        ]
+        request_lines += ['{name}: {value}'.format(name=name, value=value) for name, value in self.headers.items()]
+        raw_socket.sendall(('\r\n'.join(request_lines) + '\r\n\r\n').encode('utf-8'))
+
+        # Read the response headers, anything after them is already part of the first frames
+        response = bytearray()
+        while b'\r\n\r\n' not in response:
+            chunk = raw_socket.recv(4096)
+            if not chunk:
+                raw_socket.close()
+                raise ConnectionError("The connection was closed during the websocket handshake.")
+            response += chunk
+
+        header_block, _, remainder = bytes(response).partition(b'\r\n\r\n')
+        status_line, *header_lines = header_block.decode('latin-1').split('\r\n')
+        response_headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        status_parts = status_line.split()
+        if len(status_parts) < 2 or status_parts[1] != '101' or response_headers.get('sec-websocket-accept') != accept_key(key).decode('ascii'):
+            raw_socket.close()
+            raise ConnectionError("The websocket handshake was refused: {status}".format(status=status_line))
+
+        self._socket = raw_socket
+        self._buffer = bytearray(remainder)
+        self._fragments = []
+
+    def send(self, message: str) -> None:
+        """Sends a text message."""
+
+        self._send_frame(payload=message.encode('utf-8'), opcode=OPCODE_TEXT)
+
+    def _send_frame(self, payload: bytes, opcode: int) -> None:
+        if self._socket is None:
+            raise ConnectionError("The websocket is not connected.")
+
+        self._socket.sendall(encode_frame(payload=payload, opcode=opcode, mask=True))
+
+    def recv(self) -> str:
+        """Waits for the next message. Pings are answered on the way.
+
+        Returns:
+        ----
+        {str} -- The message, binary messages are decoded as UTF-8 as the gateway sends its JSON both ways.
+
+        Raises:
+        ----
+        ConnectionError: If the connection is closed.
+
+        socket.timeout: If no message arrives within the timeout.
+        """
+
+        while True:
+            frame = decode_frame(self._buffer)
+            if frame is None:
+                if self._socket is None:
+                    raise ConnectionError("The websocket is not connected.")
+
+                chunk = self._socket.recv(65536)
+                if not chunk:
+                    self.close()
+                    raise ConnectionError("The websocket was closed by the server.")
+                self._buffer += chunk
+                continue
+
+            is_final, opcode, payload, frame_size = frame
+            del self._buffer[:frame_size]
+
+            if opcode == OPCODE_PING:
+                self._send_frame(payload=payload, opcode=OPCODE_PONG)
+            elif opcode == OPCODE_PONG:
+                continue
+            elif opcode == OPCODE_CLOSE:
+                self.close()
+                raise ConnectionError("The websocket was closed by the server.")
+            else:
+                # Text, binary and continuation frames are joined until the final frame of the message
+                self._fragments.append(payload)
+
+                if is_final:
+                    message = b''.join(self._fragments)
+                    self._fragments = []
+                    return message.decode('utf-8', errors='replace')
+
+    def close(self) -> None:
+        """Closes the connection."""
+
+        if self._socket is None:
+            return
+
+        try:
+            self._socket.sendall(encode_frame(payload=b'', opcode=OPCODE_CLOSE, mask=True))
+        except OSError:
+            pass
+
+        try:
+            self._socket.close()
+        finally:
+            self._socket = None
@@ -0,0 +1,381 @@
+import numpy as np
+import pandas as pd
+
+from typing import List
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import robot.stock_frame as stock_frame
+import robot.indicator as indicator
+
+# The number of trading days in a year and the length of a regular trading session, used to annualise the stats
+TRADING_DAYS_PER_YEAR = 252
+TRADING_SESSION = pd.Timedelta(hours=6, minutes=30)
+
+
+class FillModel():
+
+    def __init__(self, fill_on: str = 'next_open', slippage_bps: float = 0.0, commission_per_share: float = 0.0,
+    min_commission: float = 0.0) -> None:
+        """Initalizes a new instance of the FillModel object.
+        Arguments:
+        ----
+        fill_on {str} -- The price an order is filled at, can be one of the following:
+            'next_open' fills at the open of the bar after the signal, 'close' fills at the
+            close of the bar which generated the signal. Default is 'next_open'.
+
+        slippage_bps {float} -- The slippage in basis points, buys are filled above and sells
+            below the price. Default is 0.0.
+
+        commission_per_share {float} -- The commission charged for every share. Default is 0.0.
+
+        min_commission {float} -- The minimum commission charged for an order. Default is 0.0.
+        """
+        if fill_on not in ['next_open','close']:
+            raise ValueError("fill_on must be either 'next_open' or 'close'.")
+
+        self.fill_on = fill_on
+        self.slippage_bps = slippage_bps
+        self.commission_per_share = commission_per_share
+        self.min_commission = min_commission
+
+    def fill_prices(self, prices: np.ndarray, side: str) -> np.ndarray:
+        """Applies the slippage to the prices orders are filled at.
+        Arguments:
+        ----
+        prices {np.ndarray} -- The prices before slippage.
+        side {str} -- The side of the orders, either 'BUY' or 'SELL'.
+        Returns:
+        ----
+        {np.ndarray} -- The fill prices.
+        """
+        slippage = self.slippage_bps / 10000.0
+        if side == 'BUY':
+            return prices * (1.0 + slippage)
+        else:
+            return prices * (1.0 - slippage)
+
+    def commissions(self, quantities: np.ndarray) -> np.ndarray:
+        """Returns the commission charged for orders of the given quantities."""
+        return np.maximum(np.abs(quantities) * self.commission_per_share, self.min_commission)
+
+
+class Backtester():
+
+    def __init__(self, price_df: stock_frame.StockFrame, indicator_client: indicator.Indicators, fill_model: FillModel = None,
+    initial_cash: float = 100000.0) -> None:
+        """Initalizes a new instance of the Backtester object.
+        Overview:
+        ----
+        The backtester evaluates the signals registered on an Indicators object over the whole
+        history of a StockFrame at once, instead of replaying it bar by bar. It follows the
+        rules of `Trader.process_signal()` and `Trader.process_ticker_signal()` for every symbol:
+        a buy signal opens a position when the symbol isn't in the portfolio, a sell signal closes
+        the whole position when it is, and a buy signal wins when both are met on the same bar.
+        Signals set with `set_indicator_signal()` buy 1 share, signals set with
+        `set_ticker_indicator_signal()` buy `buy_cash_quantity` worth of shares at the signal close.
+        Ticker comparison signals and the `buy_max`/`sell_max` thresholds aren't evaluated, so
+        `run()` raises a ValueError for a strategy which uses them rather than backtesting a
+        different one.
+        Arguments:
+        ----
+        price_df {stock_frame.StockFrame} -- The StockFrame holding the history, the indicators
+            must have been calculated on it already.
+
+        indicator_client {indicator.Indicators} -- The Indicators object holding the signals.
+
+        fill_model {FillModel} -- The model used to fill the orders. Default is `FillModel()`.
+
+        initial_cash {float} -- The cash the portfolio starts with. Default is 100000.0.
+        Usage:
+        ----
+            >>> indicator_client = Indicators(price_df=stock_frame_client)
+            >>> indicator_client.rsi(period=14)
+            >>> indicator_client.set_indicator_signal(indicator='rsi', buy=30.0, sell=70.0,
+                condition_buy=operator.le, condition_sell=operator.ge)
+            >>> backtester = Backtester(price_df=stock_frame_client, indicator_client=indicator_client)
+            >>> results = backtester.run()
+            >>> results['stats']
+        """
+        self._stock_frame = price_df
+        self._indicator_client = indicator_client
+        self.fill_model = fill_model if fill_model is not None else FillModel()
+        self.initial_cash = initial_cash
+
+    def run(self) -> Dict:
+        """Runs the backtest.
+        Returns:
+        ----
+        {dict} -- A dictionary with keys 'trades', a pd.DataFrame with a row for every round trip,
+            'equity_curve', a pd.Series of the portfolio value at every timestamp, and 'stats',
+            a dictionary of summary statistics.
+
+        Raises:
+        ----
+        ValueError: If the strategy uses ticker comparison signals or `buy_max`/`sell_max` thresholds.
+        """
+        self._check_supported_signals()
+
+        frame = self._stock_frame.frame
+        symbol_slices = self._stock_frame.symbol_slices
+        row_count = len(frame)
+
+        # The bounds of the symbol every row belongs to
+        group_starts = np.repeat(
+            [symbol_slice.start for symbol_slice in symbol_slices.values()],
+            [symbol_slice.stop - symbol_slice.start for symbol_slice in symbol_slices.values()]
+        )
+        group_ends = np.repeat(
+            [symbol_slice.stop - 1 for symbol_slice in symbol_slices.values()],
+            [symbol_slice.stop - symbol_slice.start for symbol_slice in symbol_slices.values()]
+        )
+        row_positions = np.arange(row_count)
+
+        closes = frame['close'].to_numpy(dtype=np.float64)
+        opens = frame['open'].to_numpy(dtype=np.float64)
+
+        buys, sells, buy_cash = self._evaluate_signals(frame=frame, symbol_slices=symbol_slices)
+
+        # With next bar fills, a signal on the last bar of a symbol can't be filled
+        if self.fill_model.fill_on == 'next_open':
+            fill_offset = 1
+            fill_base_prices = opens
+            can_fill = row_positions < group_ends
+            buys &= can_fill
+            sells &= can_fill
+        else:
+            fill_offset = 0
+            fill_base_prices = closes
+
+        # +1 for a buy, -1 for a sell, a buy wins if both are met as in process_signal()
+        events = np.where(buys, 1, np.where(sells, -1, 0))
+
+        # Carry the last event forward within every symbol, the rows before the first event are flat
+        last_event_position = np.maximum.accumulate(np.where((events != 0) | (row_positions == group_starts), row_positions, 0))
+        is_long = events[last_event_position] == 1
+
+        was_long = np.zeros(row_count, dtype=bool)
+        was_long[1:] = is_long[:-1]
+        was_long[row_positions == group_starts] = False
+
+        entry_positions = np.flatnonzero(is_long & ~was_long)
+        exit_positions = np.flatnonzero(~is_long & was_long)
+
+        # Pair every entry with the next exit of the same symbol, if there is one
+        next_exit = np.searchsorted(exit_positions, entry_positions)
+        matched_exit = np.full(len(entry_positions), -1)
+        has_exit = next_exit < len(exit_positions)
+        matched_exit[has_exit] = exit_positions[next_exit[has_exit]]
+        has_exit &= matched_exit <= group_ends[entry_positions]
+        matched_exit[~has_exit] = -1
+
+        entry_fills = entry_positions + fill_offset
+        exit_fills = np.where(has_exit, matched_exit + fill_offset, -1)
+
+        entry_prices = self.fill_model.fill_prices(prices=fill_base_prices[entry_fills], side='BUY')
+        exit_prices = np.where(
+            has_exit,
+            self.fill_model.fill_prices(prices=fill_base_prices[np.maximum(exit_fills, 0)], side='SELL'),
+            np.nan
+        )
+
+        # Ticker signals size the order from the cash allocated and the close of the signal bar
+        cash_allocated = buy_cash[entry_positions]
+        quantities = np.where(
+            np.isnan(cash_allocated),
+            1.0,
+            np.round(cash_allocated / closes[entry_positions], 2)
+        )
+
+        entry_commissions = self.fill_model.commissions(quantities=quantities)
+        exit_commissions = np.where(has_exit, self.fill_model.commissions(quantities=quantities), 0.0)
+
+        trades_df = self._build_trades(
+            frame=frame,
+            entry_fills=entry_fills,
+            exit_fills=exit_fills,
+            has_exit=has_exit,
+            quantities=quantities,
+            entry_prices=entry_prices,
+            exit_prices=exit_prices,
+            commissions=entry_commissions + exit_commissions,
+            last_closes=closes[group_ends[entry_positions]]
+        )
+
+        equity_curve = self._build_equity_curve(
+            frame=frame,
+            closes=closes,
+            group_starts=group_starts,
+            entry_fills=entry_fills,
+            exit_fills=exit_fills[has_exit],
+            quantities=quantities,
+            exit_quantities=quantities[has_exit],
+            entry_cash=-(quantities * entry_prices) - entry_commissions,
+            exit_cash=quantities[has_exit] * exit_prices[has_exit] - exit_commissions[has_exit]
+        )
+
+        return {
+            'trades': trades_df,
+            'equity_curve': equity_curve,
+            'stats': self._summary_stats(trades_df=trades_df, equity_curve=equity_curve)
+        }
+
+    def _check_supported_signals(self) -> None:
+        """Raises a ValueError for the signals of the Indicators object that the backtester can't evaluate."""
+        unsupported = [
+            "the ticker comparison signal {comp_key} of {ticker}".format(ticker=ticker, comp_key=comp_key)
+            for ticker, comp_key in self._indicator_client._ticker_indicators_comp_key
+        ]
+
+        signals = [(indicator_key, self._indicator_client._indicator_signals[indicator_key]) for indicator_key in self._indicator_client._indicators_key]
+        signals += [
+            ("{indicator_key} of {ticker}".format(indicator_key=indicator_key, ticker=ticker), self._indicator_client._ticker_indicator_signals[ticker][indicator_key])
+            for ticker, indicator_key in self._indicator_client._ticker_indicators_key
+        ]
+        for name, signal in signals:
+            for threshold in ['buy_max', 'sell_max']:
+                if signal.get(threshold) is not None:
+                    unsupported.append("the {threshold} threshold of {name}".format(threshold=threshold, name=name))
+
+        if unsupported:
+            raise ValueError("The backtester can't evaluate {unsupported}.".format(unsupported=', '.join(unsupported)))
+
+    def _evaluate_signals(self, frame: pd.DataFrame, symbol_slices: Dict[str,slice]) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+        """Evaluates every registered signal on every bar.
+        Returns:
+        ----
+        {Tuple[np.ndarray,np.ndarray,np.ndarray]} -- The buy mask, the sell mask and the cash allocated
+            to the buys of ticker signals, NaN where a buy is for 1 share.
+        """
+        row_count = len(frame)
+        buys = np.zeros(row_count, dtype=bool)
+        sells = np.zeros(row_count, dtype=bool)
+        buy_cash = np.full(row_count, np.nan)
+
+        indicator_signals = self._indicator_client._indicator_signals
+
+        # Indicators compared to a numerical threshold, for every symbol
+        for indicator_key in self._indicator_client._indicators_key:
+            signal = indicator_signals[indicator_key]
+            column = frame[indicator_key]
+            buys |= signal['buy_operator'](column, signal['buy']).to_numpy(dtype=bool)
+            sells |= signal['sell_operator'](column, signal['sell']).to_numpy(dtype=bool)
+
+        # Indicators compared to another indicator, for every symbol
+        for comp_key in self._indicator_client._indicators_comp_key:
+            signal = indicator_signals[comp_key]
+            column_1 = frame[signal['indicator_1']]
+            column_2 = frame[signal['indicator_2']]
+            if signal['buy_operator']:
+                buys |= signal['buy_operator'](column_1, column_2).to_numpy(dtype=bool)
+            if signal['sell_operator']:
+                sells |= signal['sell_operator'](column_1, column_2).to_numpy(dtype=bool)
+
+        # Ticker indicators only apply to the rows of their ticker
+        ticker_signals = self._indicator_client._ticker_indicator_signals
+        for ticker, indicator_key in self._indicator_client._ticker_indicators_key:
+            if ticker not in symbol_slices:
+                continue
+
+            ticker_slice = symbol_slices[ticker]
+            signal = ticker_signals[ticker][indicator_key]
+            column = frame[indicator_key].iloc[ticker_slice]
+
+            ticker_buys = signal['buy_operator'](column, signal['buy']).to_numpy(dtype=bool)
+            buys[ticker_slice] |= ticker_buys
+            sells[ticker_slice] |= signal['sell_operator'](column, signal['sell']).to_numpy(dtype=bool)
+            buy_cash[ticker_slice] = np.where(ticker_buys, signal['buy_cash_quantity'], buy_cash[ticker_slice])
+
+        return buys, sells, buy_cash
+
+    def _build_trades(self, frame: pd.DataFrame, entry_fills: np.ndarray, exit_fills: np.ndarray, has_exit: np.ndarray,
+    quantities: np.ndarray, entry_prices: np.ndarray, exit_prices: np.ndarray, commissions: np.ndarray,
+    last_closes: np.ndarray) -> pd.DataFrame:
+        """Builds a frame with a row for every round trip, open positions are marked at the last close."""
+        symbols = frame.index.get_level_values('symbol')
+        time_stamps = frame.index.get_level_values('datetime')
+
+        mark_prices = np.where(has_exit, exit_prices, last_closes)
+        pnl = quantities * (mark_prices - entry_prices) - commissions
+
+        trades_df = pd.DataFrame({
+            'symbol': np.asarray(symbols[entry_fills]),
+            'entry_time': time_stamps[entry_fills],
+            'entry_price': entry_prices,
+            'exit_time': pd.DatetimeIndex(np.where(has_exit, time_stamps[np.maximum(exit_fills, 0)], np.datetime64('NaT'))),
+            'exit_price': exit_prices,
+            'quantity': quantities,
+            'commission': commissions,
+            'pnl': pnl,
+            'return': pnl / (quantities * entry_prices),
+            'is_open': ~has_exit
+        })
+
+        return trades_df
+
+    def _build_equity_curve(self, frame: pd.DataFrame, closes: np.ndarray, group_starts: np.ndarray, entry_fills: np.ndarray,
+    exit_fills: np.ndarray, quantities: np.ndarray, exit_quantities: np.ndarray, entry_cash: np.ndarray,
+    exit_cash: np.ndarray) -> pd.Series:
+        """Builds the value of the portfolio at every timestamp, without unstacking the frame by symbol."""
+        row_count = len(frame)
+
+        # The change in the shares held and in the cash on every row
+        share_changes = np.zeros(row_count)
+        np.add.at(share_changes, entry_fills, quantities)
+        np.add.at(share_changes, exit_fills, -exit_quantities)
+
+        cash_changes = np.zeros(row_count)
+        np.add.at(cash_changes, entry_fills, entry_cash)
+        np.add.at(cash_changes, exit_fills, exit_cash)
+
+        # The shares held after every row, restarting at every symbol
+        cumulative_shares = np.cumsum(share_changes)
+        shares_held = cumulative_shares - (cumulative_shares[group_starts] - share_changes[group_starts])
+
+        # The change in the market value of every symbol from one of its bars to the next
+        market_values = shares_held * closes
+        market_value_changes = np.diff(market_values, prepend=0.0)
+        is_group_start = np.arange(row_count) == group_starts
+        market_value_changes[is_group_start] = market_values[is_group_start]
+
+        # Sum the changes of all the symbols at every timestamp, then accumulate them over time
+        time_stamps = frame.index.get_level_values('datetime')
+        time_codes, unique_times = pd.factorize(time_stamps, sort=True)
+        value_changes = np.bincount(time_codes, weights=cash_changes + market_value_changes, minlength=len(unique_times))
+
+        equity_curve = pd.Series(
+            data=self.initial_cash + np.cumsum(value_changes),
+            index=pd.DatetimeIndex(unique_times, name='datetime'),
+            name='equity'
+        )
+
+        return equity_curve
+
+    def _summary_stats(self, trades_df: pd.DataFrame, equity_curve: pd.Series) -> Dict:
+        """Calculates the summary statistics of a backtest."""
+        bar_returns = equity_curve.pct_change().dropna()
+        drawdowns = equity_curve / equity_curve.cummax() - 1.0
+
+        # Annualise using the number of bars in a trading year
+        bar_width = stock_frame.TIMEFRAMES[self._stock_frame.timeframe]
+        if bar_width >= pd.Timedelta(days=1):
+            bars_per_year = TRADING_DAYS_PER_YEAR * pd.Timedelta(days=1) / bar_width
+        else:
+            bars_per_year = TRADING_DAYS_PER_YEAR * TRADING_SESSION / bar_width
+
+        return_std = bar_returns.std()
+        closed_trades = trades_df[~trades_df['is_open']]
+
+        return {
+            'initial_cash': self.initial_cash,
+            'final_equity': float(equity_curve.iloc[-1]) if len(equity_curve) else self.initial_cash,
+            'total_return': float(equity_curve.iloc[-1] / self.initial_cash - 1.0) if len(equity_curve) else 0.0,
+            'max_drawdown': float(drawdowns.min()) if len(drawdowns) else 0.0,
+            'sharpe_ratio': float(bar_returns.mean() / return_std * np.sqrt(bars_per_year)) if return_std > 0 else 0.0,
+            'trades': len(trades_df),
+            'open_trades': int(trades_df['is_open'].sum()),
+            'win_rate': float((closed_trades['pnl'] > 0).mean()) if len(closed_trades) else 0.0,
+            'average_trade_pnl': float(closed_trades['pnl'].mean()) if len(closed_trades) else 0.0,
+            'total_commission': float(trades_df['commission'].sum())
+        }
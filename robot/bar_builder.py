@@ -0,0 +1,278 @@
+import time
+import logging
+import threading
+import collections
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+
+import robot.stock_frame as stock_frame
+
+
+class BarBuilder():
+
+    def __init__(self, price_df: stock_frame.StockFrame = None, timeframe: str = None, grace_period: float = 2.0,
+    on_bar: Callable[[Dict], None] = None, clock: Callable[[], float] = time.time) -> None:
+        """Aggregates trades into OHLCV bars on exact wall clock boundaries.
+
+        Overview:
+        ----
+        Trades from the market data stream or from snapshot polling are added with `add_tick()`.
+        A bar stays open for `grace_period` seconds after its end, so trades which arrive late are
+        still counted in the bar they belong to, and trades which are sent twice are only counted
+        once. Once the grace period is over the bar is finished: it is added to the StockFrame and
+        handed to `on_bar`. With `start()`, a background thread finishes every bar as soon as its
+        grace period is over, rather than waiting for the next trade to arrive.
+
+        Arguments:
+        ----
+        price_df {stock_frame.StockFrame} -- The StockFrame the finished bars are added to. (default: {None})
+
+        timeframe {str} -- The bar size, one of ['1min','5min','15min','1h','1d']. Default is the
+            timeframe of `price_df`, or '1min' without one.
+
+        grace_period {float} -- How long in seconds a bar waits for late trades after it ends. (default: {2.0})
+
+        on_bar {Callable[[Dict], None]} -- Called with every finished bar. (default: {None})
+
+        clock {Callable[[], float]} -- Returns the current epoch time in seconds. (default: {time.time})
+
+        Usage:
+        ----
+            >>> bar_builder = BarBuilder(price_df=stock_frame_client, grace_period=2.0)
+            >>> bar_builder.start()
+            >>> bar_builder.add_tick(conid='265598', symbol='AAPL', price=133.11, size=100, timestamp=1618493401012)
+            >>> finished_bars = bar_builder.wait_for_bars(timeout=90)
+        """
+
+        if timeframe is None:
+            timeframe = price_df.timeframe if price_df is not None else '1min'
+
+        self.price_df = price_df
+        self.timeframe = timeframe
+        self.bar_width = int(stock_frame.TIMEFRAMES[timeframe].total_seconds() * 1000)
+        self.grace_period = grace_period
+        self.on_bar = on_bar
+        self.clock = clock
+
+        # Held while bars are added to the StockFrame, hold it while reading the StockFrame from another thread
+        self.frame_lock = threading.Lock()
+
+        self.ticks = 0
+        self.duplicate_ticks = 0
+        self.late_ticks = 0
+
+        # The open bars keyed by conid and bar start, with the keys of the trades already counted in them
+        self._open_bars: Dict[Tuple[str,int], Dict] = {}
+        self._tick_keys: Dict[Tuple[str,int], set] = {}
+
+        # The start of the newest finished bar of every conid, trades before it are too late
+        self._finished_until: Dict[str,int] = {}
+
+        # The finished bars waiting to be picked up by wait_for_bars(), the oldest are dropped if nobody does
+        self._finished_bars = collections.deque(maxlen=10000)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_tick(self, conid: str, symbol: str, price: float, size: float, timestamp: int, tick_id: object = None) -> bool:
+        """Adds a trade to the bar it falls in.
+
+        Arguments:
+        ----
+        conid {str} -- The conid of the trade.
+
+        symbol {str} -- The symbol the bar is stored under in the StockFrame.
+
+        price {float} -- The price of the trade.
+
+        size {float} -- The size of the trade.
+
+        timestamp {int} -- The epoch ms of the trade.
+
+        tick_id {object} -- Identifies the trade. Trades with the same id in the same bar are only counted
+            once. Default is the timestamp, price and size of the trade.
+
+        Returns:
+        ----
+        {bool} -- False if the trade was dropped as a duplicate or for arriving after its bar was finished.
+        """
+
+        conid = str(conid)
+        timestamp = int(timestamp)
+        bar_start = timestamp - timestamp % self.bar_width
+        key = (conid, bar_start)
+
+        with self._condition:
+            self.ticks += 1
+
+            if bar_start <= self._finished_until.get(conid, -1):
+                self.late_ticks += 1
+                return False
+
+            tick_keys = self._tick_keys.setdefault(key, set())
+            tick_key = tick_id if tick_id is not None else (timestamp, price, size)
+            if tick_key in tick_keys:
+                self.duplicate_ticks += 1
+                return False
+            tick_keys.add(tick_key)
+
+            bar = self._open_bars.get(key)
+            if bar is None:
+                self._open_bars[key] = {
+                    'symbol': symbol,
+                    'datetime': bar_start,
+                    'open': price,
+                    'close': price,
+                    'high': price,
+                    'low': price,
+                    'volume': size,
+                    '_first': timestamp,
+                    '_last': timestamp
+                }
+            else:
+                # Late trades can arrive out of order, so the open and close follow the trade times
+                if timestamp < bar['_first']:
+                    bar['open'] = price
+                    bar['_first'] = timestamp
+                if timestamp >= bar['_last']:
+                    bar['close'] = price
+                    bar['_last'] = timestamp
+                bar['high'] = max(bar['high'], price)
+                bar['low'] = min(bar['low'], price)
+                bar['volume'] += size
+
+            return True
+
+    def flush(self, now: float = None) -> List[Dict]:
+        """Finishes every bar whose grace period is over.
+
+        Arguments:
+        ----
+        now {float} -- The current epoch time in seconds. Default is the clock of the builder.
+
+        Returns:
+        ----
+        {List[Dict]} -- The finished bars, in the order of their start.
+        """
+
+        now_ms = int((now if now is not None else self.clock()) * 1000)
+        grace_ms = int(self.grace_period * 1000)
+
+        with self._condition:
+            due_keys = sorted(
+                (key for key in self._open_bars if key[1] + self.bar_width + grace_ms <= now_ms),
+                key=lambda key: key[1]
+            )
+
+            finished_bars = []
+            for conid, bar_start in due_keys:
+                bar = self._open_bars.pop((conid, bar_start))
+                del self._tick_keys[(conid, bar_start)]
+                self._finished_until[conid] = max(self._finished_until.get(conid, -1), bar_start)
+
+                del bar['_first']
+                del bar['_last']
+                finished_bars.append(bar)
+
+        if finished_bars:
+            self._emit_bars(bars=finished_bars)
+
+        return finished_bars
+
+    def open_bar(self, conid: str) -> Optional[Dict]:
+        """Returns the newest bar of a conid which hasn't been finished yet, or None if there is none."""
+
+        conid = str(conid)
+        with self._condition:
+            bar_starts = [bar_start for open_conid, bar_start in self._open_bars if open_conid == conid]
+            if not bar_starts:
+                return None
+
+            bar = dict(self._open_bars[(conid, max(bar_starts))])
+
+        del bar['_first']
+        del bar['_last']
+        return bar
+
+    def next_flush_time(self) -> Optional[float]:
+        """Returns the epoch time in seconds at which the next open bar is finished, or None if no bar is open."""
+
+        with self._condition:
+            if not self._open_bars:
+                return None
+            first_start = min(bar_start for _, bar_start in self._open_bars)
+
+        return (first_start + self.bar_width) / 1000 + self.grace_period
+
+    def wait_for_bars(self, timeout: float = None) -> List[Dict]:
+        """Waits until bars are finished and returns them. Every finished bar is returned once.
+
+        Arguments:
+        ----
+        timeout {float} -- The longest time to wait in seconds. (default: {None})
+
+        Returns:
+        ----
+        {List[Dict]} -- The bars finished since the last call, empty if the timeout ran out.
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._finished_bars, timeout=timeout)
+            finished_bars = list(self._finished_bars)
+            self._finished_bars.clear()
+
+        return finished_bars
+
+    def start(self) -> None:
+        """Starts finishing the bars from a background thread as soon as their grace period is over."""
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='bar-builder', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stops the background thread."""
+
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            next_flush_time = self.next_flush_time()
+
+            # Without an open bar there is nothing to finish before the next boundary
+            if next_flush_time is None:
+                now = self.clock()
+                next_flush_time = now - now % (self.bar_width / 1000) + self.bar_width / 1000
+
+            if self._stop_event.wait(max(next_flush_time - self.clock(), 0.0)):
+                break
+
+            try:
+                self.flush()
+            except Exception:
+                logging.exception('The bar builder failed to finish the bars.')
+
+    def _emit_bars(self, bars: List[Dict]) -> None:
+        """Adds the finished bars to the StockFrame in one go and hands them to the callback."""
+
+        if self.price_df is not None:
+            with self.frame_lock:
+                self.price_df.add_rows(data=bars)
+
+        if self.on_bar is not None:
+            for bar in bars:
+                self.on_bar(bar)
+
+        with self._condition:
+            self._finished_bars.extend(bars)
+            self._condition.notify_all()
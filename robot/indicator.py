@@ -11,10 +11,32 @@ from typing import Tuple
 
 import robot.stock_frame as stock_frame
 
+
+def _symbol_bounds(index: pd.MultiIndex) -> Tuple[np.ndarray,np.ndarray]:
+    """Returns the first and the last row of every symbol, the rows being sorted by symbol."""
+    if len(index) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    new_symbol_rows = np.flatnonzero(np.diff(index.codes[0])) + 1
+    return np.append(0, new_symbol_rows), np.append(new_symbol_rows - 1, len(index) - 1)
+
 class Indicators():
-    def __init__(self, price_df: stock_frame.StockFrame) -> None:
-        
+    def __init__(self, price_df: stock_frame.StockFrame, timeframe: str = None) -> None:
+        """Initalizes the Indicators Object.
+        Arguments:
+        ----
+        price_df {stock_frame.StockFrame} -- The StockFrame the indicators are calculated on.
+
+        timeframe {str} -- Optional, the bar size the indicators should be calculated on, e.g. '5min'.
+            The bars are aggregated from `price_df` and kept up to date as new rows are added to it.
+            If left blank, the indicators are calculated on the bars of `price_df` itself.
+        """
+        # Target the derived timeframe of the StockFrame if one has been specified
+        if timeframe is not None:
+            price_df = price_df.add_timeframe(timeframe=timeframe)
+
         self._stock_frame: stock_frame.StockFrame = price_df
+        self.timeframe = price_df.timeframe
         self._price_groups = self._stock_frame.symbol_groups
         self._current_indicators = {}        #Instead of asking the user to call all the functions again when a new data row comes in, a wrapper is used to update each column
                                              #Indicators that user has assigned to the stock frame
@@ -29,6 +51,12 @@ class Indicators():
         self._ticker_indicators_comp_key = []
         self._ticker_indicators_key = []
 
+        # The exponentially weighted sums of the bars trimmed off the StockFrame, keyed by series, and the
+        # last trimmed close of every symbol, keyed by rsi column. They are carried over by _carry_trimmed_bars()
+        self._ewm_states: Dict[str,pd.DataFrame] = {}
+        self._trimmed_closes: Dict[str,pd.Series] = {}
+        self._stock_frame.add_trim_listener(listener=self._carry_trimmed_bars)
+
     def set_indicator_signal(self, indicator:str, buy: float, sell: float, condition_buy: Any, condition_sell: Any, buy_max: float = None, sell_max: float = None
     , condition_buy_max: Any = None, condition_sell_max: Any = None):
         #Each indicator has a buy signal and a sell signal, numeric threshold and operator (e.g. <,>)
@@ -250,6 +278,7 @@ class Indicators():
         self._current_indicators[column_name]['args'] = locals_data      #Create a new dictionary with key 'args' to be placed in our _current_indicators[column_name] dict
                                                                          #The values are the arguments passed to the function, so it saves all our arguments passed to an object
         self._current_indicators[column_name]['func'] = self.change_in_price   #Storing the function so it can be called again
+        self._stock_frame.register_lookback(column_name=column_name, lookback=2)
 
         #Calculating the actual indicator
         self._frame[column_name] = self._frame['close'].transform(
@@ -278,39 +307,46 @@ class Indicators():
         self._current_indicators[column_name] = {}
         self._current_indicators[column_name]['args'] = locals_data
         self._current_indicators[column_name]['func'] = self.rsi
-
-        #Since RSI indicator require change in price, check whether change in price column exists first, if not, create it by calling change_in_price()
-        if 'change_in_price' not in self._frame.columns:
-            self.change_in_price()
-        
-        self._frame['up_day'] = self._price_groups['change_in_price'].transform(
-            lambda x: np.where(x>=0,x,0)        #Return elements chosen from x or y depending on condition, if x>=0, x=x, elif x < 0, return 0, only keep positive values
+        self._current_indicators[column_name]['carry'] = lambda close: self._relative_strength_index(
+            close=close,
+            period=period,
+            column_name=column_name,
+            carry=True
         )
+        self._stock_frame.register_lookback(column_name=column_name, lookback=1)
 
-        self._frame['down_day'] = self._price_groups['change_in_price'].transform(
-            lambda x: np.where(x<0,x.abs(),0)        #Return elements chosen from x or y depending on condition, if x<=0, x=x.abs(), elif x > 0, return 0, only keep negative values
-        )
+        self._frame[column_name] = self._relative_strength_index(close=self._frame['close'], period=period, column_name=column_name)
 
-        self._frame['ewma_up'] = self._price_groups['up_day'].transform(
-            lambda x: x.ewm(com = period-1).mean()        #Give rolling average on up_day
-        )
+        return self._frame
 
-        self._frame['ewma_down'] = self._price_groups['down_day'].transform(
-            lambda x: x.ewm(com = period-1).mean()        #Give rolling average on up_day
-        )
-        relative_strength = self._frame['ewma_up']/self._frame['ewma_down']
-        relative_strength_index = 100.0 - (100.0/ (1.0 + relative_strength))   #Using RSI formula
+    def _relative_strength_index(self, close: pd.Series, period: int, column_name: str, carry: bool = False) -> np.ndarray:
+        """Calculates the RSI of every symbol, continuing from the bars trimmed off the StockFrame.
+        With `carry`, `close` holds the bars being trimmed and their state is carried over instead."""
+        first_rows, last_rows = _symbol_bounds(index=close.index)
+        symbols = close.index.get_level_values('symbol')
 
-        self._frame[column_name] = np.where(relative_strength_index==0,100, relative_strength_index)   # Deal with cases when rsi = 0
+        #The first bar of a symbol changes from the last close trimmed off, if there is one
+        previous_close = np.roll(close.to_numpy(dtype=float), 1)
+        if column_name in self._trimmed_closes:
+            previous_close[first_rows] = self._trimmed_closes[column_name].reindex(symbols[first_rows]).to_numpy()
+        else:
+            previous_close[first_rows] = np.nan
 
-        # Clean up before sending back. Delete all the unnessary columns and just leave 'rsi' in place
-        self._frame.drop(
-            labels=['ewma_up', 'ewma_down', 'down_day', 'up_day', 'change_in_price'],
-            axis=1,
-            inplace=True
-        )
+        change_in_price = close.to_numpy(dtype=float) - previous_close
+        up_day = pd.Series(np.where(change_in_price >= 0, change_in_price, 0.0), index=close.index)     #Only keep the rises
+        down_day = pd.Series(np.where(change_in_price < 0, -change_in_price, 0.0), index=close.index)     #Only keep the falls
 
-        return self._frame
+        ewma_up = self._ewm_mean(values=up_day, alpha=1.0/period, state_key=column_name + '_up', carry=carry)
+        ewma_down = self._ewm_mean(values=down_day, alpha=1.0/period, state_key=column_name + '_down', carry=carry)
+
+        if carry:
+            last_close = pd.Series(close.to_numpy()[last_rows], index=symbols[last_rows])
+            self._trimmed_closes[column_name] = last_close.combine_first(self._trimmed_closes.get(column_name, last_close))
+
+        relative_strength = ewma_up / ewma_down
+        relative_strength_index = 100.0 - (100.0 / (1.0 + relative_strength))   #Using RSI formula
+
+        return np.where(relative_strength_index == 0, 100, relative_strength_index)    # Deal with cases when rsi = 0
 
     # Simple moving average
     def sma(self, period:int,column_name:str = 'sma') -> pd.DataFrame:
@@ -330,6 +366,7 @@ class Indicators():
         self._current_indicators[column_name] = {}
         self._current_indicators[column_name]['args'] = locals_data
         self._current_indicators[column_name]['func'] = self.sma
+        self._stock_frame.register_lookback(column_name=column_name, lookback=period)
 
         self._frame[column_name] = self._price_groups['close'].transform(
             lambda x: x.rolling(window=period).mean()
@@ -355,15 +392,20 @@ class Indicators():
         self._current_indicators[column_name] = {}
         self._current_indicators[column_name]['args'] = locals_data
         self._current_indicators[column_name]['func'] = self.ema
-
-        self._frame[column_name] = self._price_groups['close'].transform(
-            lambda x: x.ewm(span=period).mean()
+        self._current_indicators[column_name]['carry'] = lambda close: self._ewm_mean(
+            values=close,
+            alpha=2.0/(period + 1),
+            state_key=column_name,
+            carry=True
         )
+        self._stock_frame.register_lookback(column_name=column_name, lookback=1)
+
+        self._frame[column_name] = self._ewm_mean(values=self._frame['close'], alpha=2.0/(period + 1), state_key=column_name)
 
         return self._frame
 
     # MACD
-    def macd(self,fast_period:int = 12,slow_period:int = 26,column_name:str = 'macd') -> pd.DataFrame:
+    def macd(self,fast_period:int = 12,slow_period:int = 26,signal_period:int = 9,column_name:str = 'macd') -> pd.DataFrame:
         """MACD(Moving Average Convergence Divergence) is a trend following momentum indicator that shows the
         relationships between 2 moving averages, tpically ema. Traders may buy the security when 'macd' crosses
         above the 'macd_signal' line and sell when 'macd' goes below the 'macd_signal' line.
@@ -372,6 +414,7 @@ class Indicators():
         Args:
             fast_period (int, optional): The period used to calculate the ema of a small window. Defaults to 12.
             slow_period (int, optional): The period used to calculate the ema of a long window. Defaults to 26.
+            signal_period (int, optional): The period used to calculate the ema of the macd, the signal line. Defaults to 9.
             column_name (str, optional): The name of column. Defaults to 'macd'.
 
         Returns:
@@ -383,27 +426,97 @@ class Indicators():
         self._current_indicators[column_name] = {}
         self._current_indicators[column_name]['args'] = locals_data
         self._current_indicators[column_name]['func'] = self.macd
-
-        # Calculate fast moving macd
-        self._frame['macd_fast'] = self._frame['close'].transform(
-            lambda x: x.ewm(span = fast_period, min_periods = fast_period).mean()
+        self._current_indicators[column_name]['carry'] = lambda close: self._moving_average_convergence_divergence(
+            close=close,
+            fast_period=fast_period,
+            slow_period=slow_period,
+            signal_period=signal_period,
+            column_name=column_name,
+            carry=True
         )
-
-        # Calculate slow moving macd
-        self._frame['macd_slow'] = self._frame['close'].transform(
-            lambda x: x.ewm(span = slow_period, min_periods = slow_period).mean()
+        self._stock_frame.register_lookback(column_name=column_name, lookback=1)
+
+        macd_columns = self._moving_average_convergence_divergence(
+            close=self._frame['close'],
+            fast_period=fast_period,
+            slow_period=slow_period,
+            signal_period=signal_period,
+            column_name=column_name
         )
+        for macd_column, values in macd_columns.items():
+            self._frame[macd_column] = values
+
+        return self._frame
+
+    def _moving_average_convergence_divergence(self, close: pd.Series, fast_period: int, slow_period: int, signal_period: int,
+    column_name: str, carry: bool = False) -> Dict[str,pd.Series]:
+        """Calculates the MACD columns of every symbol, continuing from the bars trimmed off the StockFrame.
+        With `carry`, `close` holds the bars being trimmed and their state is carried over instead."""
+        # Calculate fast and slow moving averages
+        macd_fast = self._ewm_mean(values=close, alpha=2.0/(fast_period + 1), state_key=column_name + '_fast', min_periods=fast_period, carry=carry)
+        macd_slow = self._ewm_mean(values=close, alpha=2.0/(slow_period + 1), state_key=column_name + '_slow', min_periods=slow_period, carry=carry)
 
         # Calculate the difference between fast and slow macd
-        self._frame['macd'] = self._frame['macd_fast'] - self._frame['macd_slow']
+        macd = macd_fast - macd_slow
 
         # Calculate the exponential moving average of the macd_diff
-        self._frame['macd_signal'] = self._frame['macd'].transform(
-            lambda x: x.ewm(span=9,min_periods=8).mean()
-        )
+        macd_signal = self._ewm_mean(values=macd, alpha=2.0/(signal_period + 1), state_key=column_name + '_signal', min_periods=signal_period - 1, carry=carry)
+
+        return {'macd_fast': macd_fast, 'macd_slow': macd_slow, 'macd': macd, 'macd_signal': macd_signal}
+
+    def _ewm_mean(self, values: pd.Series, alpha: float, state_key: str, min_periods: int = 0, carry: bool = False) -> pd.Series:
+        """Returns the exponentially weighted mean of every symbol, the same as `ewm(alpha=alpha).mean()`
+        over the whole history of the symbol, including the bars trimmed off the StockFrame.
+
+        The mean is the sum of the weighted values over the sum of the weights. Both sums of the trimmed
+        bars are kept in `_ewm_states`, along with their count, and decay with every later bar. With `carry`,
+        `values` are the bars being trimmed, and their sums are added to the state.
+        """
+        symbols = values.index.get_level_values('symbol')
+        first_rows, last_rows = _symbol_bounds(index=values.index)
+
+        #A missing value adds nothing but the older weights still decay, as with ignore_na=False
+        weights = values.notna().to_numpy(dtype=float)
+        weighted_values = np.where(weights > 0, values.to_numpy(dtype=float), 0.0)
+
+        numerator = np.empty(len(values))
+        denominator = np.empty(len(values))
+        count = np.empty(len(values))
+        bars = np.empty(len(values))
+        for first_row, last_row in zip(first_rows, last_rows):
+            symbol_rows = slice(first_row, last_row + 1)
+            sums = pd.DataFrame({'numerator': weighted_values[symbol_rows], 'denominator': weights[symbol_rows]}).ewm(alpha=alpha).sum()
+            numerator[symbol_rows] = sums['numerator'].to_numpy()
+            denominator[symbol_rows] = sums['denominator'].to_numpy()
+            count[symbol_rows] = np.cumsum(weights[symbol_rows])
+            bars[symbol_rows] = np.arange(1, last_row - first_row + 2)
+
+        if state_key in self._ewm_states:
+            carried_state = self._ewm_states[state_key].reindex(symbols, fill_value=0.0)
+            decay = (1.0 - alpha) ** bars
+            numerator += decay * carried_state['numerator'].to_numpy()
+            denominator += decay * carried_state['denominator'].to_numpy()
+            count += carried_state['count'].to_numpy()
+
+        if carry:
+            state = pd.DataFrame(
+                data={'numerator': numerator[last_rows], 'denominator': denominator[last_rows], 'count': count[last_rows]},
+                index=symbols[last_rows]
+            )
+            self._ewm_states[state_key] = state.combine_first(self._ewm_states.get(state_key, state))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count >= max(min_periods, 1), numerator / denominator, np.nan)
+
+        return pd.Series(mean, index=values.index)
+
+    def _carry_trimmed_bars(self, trimmed_df: pd.DataFrame) -> None:
+        """Carries the state of the indicators based on exponentially weighted means over from the
+        bars being trimmed off the StockFrame, so trimming doesn't change their values."""
+        for indicator in self._current_indicators.values():
+            if 'carry' in indicator:
+                indicator['carry'](trimmed_df['close'])
 
-        return self._frame
-    
     # VWAP
     def vwap(self,column_name='vwap') -> pd.DataFrame:
         """VWAP is the volumn weighted average price, typically used to calculate 
@@ -419,6 +532,8 @@ class Indicators():
         self._current_indicators[column_name] = {}
         self._current_indicators[column_name]['args'] = locals_data
         self._current_indicators[column_name]['func'] = self.vwap
+        # VWAP is cumulative, so it depends on the whole history and stops the StockFrame from being trimmed
+        self._stock_frame.register_lookback(column_name=column_name, lookback=None)
 
         high = self._frame['high']
         low = self._frame['low']
@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import atexit
+import logging
+import pathlib
+import threading
+import collections
+
+from typing import List
+from typing import Dict
+from typing import Union
+from typing import Iterator
+from typing import Callable
+from typing import Optional
+from datetime import datetime
+from datetime import timezone
+
+# Where the orders are journaled unless the Trader is given another journal
+DEFAULT_JOURNAL_PATH = 'order_record/orders.jsonl'
+
+# The attributes of a Trade which are journaled with every order
+ORDER_FIELDS = [
+    'local_trade_id', 'trade_id', 'account', 'symbol', 'conid', 'side', 'quantity',
+    'price', 'order_type', 'asset_type', 'order_status', 'total_cost'
+]
+
+_default_journal = None
+_default_journal_lock = threading.Lock()
+
+
+def default_journal() -> 'OrderJournal':
+    """Returns the journal at `DEFAULT_JOURNAL_PATH`, opening it the first time and closing it when Python exits."""
+
+    global _default_journal
+
+    with _default_journal_lock:
+        if _default_journal is None:
+            _default_journal = OrderJournal(path=DEFAULT_JOURNAL_PATH)
+            atexit.register(_default_journal.close)
+
+    return _default_journal
+
+
+class OrderJournal():
+
+    def __init__(self, path: Union[str,pathlib.Path] = DEFAULT_JOURNAL_PATH, flush_interval: float = 0.2,
+    fsync_interval: float = 1.0) -> None:
+        """An append-only journal of orders and fills, written by a background thread.
+
+        Overview:
+        ----
+        Every record is one compact JSON object per line, with the epoch ms it was journaled at
+        (`ts`) and its `event`, e.g. 'order' or 'fill'. `append()` only queues the record, so no
+        file I/O happens on the order path. The background thread writes the queued records in
+        batches every `flush_interval` seconds and syncs the file to disk at most every
+        `fsync_interval` seconds, or straight away when `flush()` is called. A crash can at worst
+        tear the last line, which is skipped when the journal is read back.
+
+        Arguments:
+        ----
+        path {Union[str,pathlib.Path]} -- The journal file, created with its folder if it doesn't exist.
+            (default: {DEFAULT_JOURNAL_PATH})
+
+        flush_interval {float} -- How often in seconds the queued records are written. (default: {0.2})
+
+        fsync_interval {float} -- How often in seconds the file is synced to disk. (default: {1.0})
+
+        Usage:
+        ----
+            >>> order_journal = OrderJournal(path='order_record/orders.jsonl')
+            >>> order_journal.record_order(trade_obj=trade_obj)
+            >>> order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=133.11, trade_id='1234')
+            >>> order_journal.query(symbol='AAPL', event='fill')
+            [{'ts': 1618493401012, 'event': 'fill', 'symbol': 'AAPL', 'side': 'BUY', 'quantity': 10, 'price': 133.11, ...}]
+            >>> order_journal.replay(portfolio=trader_portfolio)
+        """
+
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+
+        self.records_written = 0
+        self.fsyncs = 0
+
+        self._file = open(self.path, mode='ab')
+
+        # A crash can leave a torn last line, the next record starts on a line of its own
+        if self._file.tell() > 0:
+            with open(self.path, mode='rb') as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                if journal_file.read(1) != b'\n':
+                    self._file.write(b'\n')
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._appended = 0
+        self._synced = 0
+        self._sync_requested = False
+        self._closed = False
+        self._listeners: List[Callable[[List[Dict]], None]] = []
+
+        self._thread = threading.Thread(target=self._run, name='order-journal', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'OrderJournal':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def append(self, event: str, **fields: object) -> None:
+        """Queues a record for the background writer.
+
+        Arguments:
+        ----
+        event {str} -- The kind of record, e.g. 'order' or 'fill'.
+
+        fields {object} -- The fields of the record, anything which isn't JSON is written as a string.
+        """
+
+        record = {'ts': int(time.time() * 1000), 'event': event}
+        record.update(fields)
+
+        with self._condition:
+            if self._closed:
+                raise ValueError("The order journal {path} is closed.".format(path=self.path))
+
+            self._queue.append(record)
+            self._appended += 1
+
+    def add_listener(self, listener: Callable[[List[Dict]], None]) -> None:
+        """Hands every batch of records to a listener once it is written, e.g. `OrderStore.ingest`.
+        The listener is called from the background thread, before `flush()` returns.
+        """
+
+        self._listeners.append(listener)
+
+    def record_order(self, trade_obj: object, event: str = 'order') -> None:
+        """Journals the order of a Trade, without its client."""
+
+        self.append(event, **{field: getattr(trade_obj, field, None) for field in ORDER_FIELDS})
+
+    def record_fill(self, symbol: str, side: str, quantity: float, price: Optional[float], trade_id: str = None,
+    asset_type: str = 'STK', order_status: str = 'Filled', account: str = None) -> None:
+        """Journals a fill, which is what `replay()` rebuilds the positions from.
+
+        Arguments:
+        ----
+        symbol {str} -- The symbol.
+
+        side {str} -- 'BUY' or 'SELL'.
+
+        quantity {float} -- The filled quantity.
+
+        price {Optional[float]} -- The fill price, None if it isn't known.
+
+        trade_id {str} -- The order id given by IB. (default: {None})
+
+        asset_type {str} -- The asset type of the symbol. (default: {'STK'})
+
+        order_status {str} -- The status of the order after the fill. (default: {'Filled'})
+
+        account {str} -- The account the order was placed for, so `replay()` rebuilds the positions
+            of every account apart. (default: {None})
+        """
+
+        self.append(
+            'fill',
+            symbol=symbol,
+            side=side,
+            quantity=quantity,
+            price=price,
+            trade_id=trade_id,
+            asset_type=asset_type,
+            order_status=order_status,
+            account=account
+        )
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every record appended so far is written and synced to disk.
+
+        Returns:
+        ----
+        {bool} -- False if the timeout ran out first.
+        """
+
+        with self._condition:
+            target = self._appended
+            self._sync_requested = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._synced >= target or not self._thread.is_alive(), timeout=timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Writes the queued records, syncs them and closes the file."""
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        self._thread.join(timeout=timeout)
+        self._file.close()
+
+    def _run(self) -> None:
+        """Writes the queued records in batches until the journal is closed."""
+
+        last_fsync = time.monotonic()
+        written = 0
+        synced = 0
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or self._sync_requested, timeout=self.flush_interval)
+                records = list(self._queue)
+                self._queue.clear()
+                sync_now = self._sync_requested or self._closed
+                self._sync_requested = False
+                closed = self._closed
+
+            try:
+                if records:
+                    lines = [json.dumps(record, separators=(',', ':'), default=str) for record in records]
+                    self._file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                    self._file.flush()
+                    written += len(records)
+                    self.records_written = written
+
+                # The records are synced in batches, a flush() or close() syncs them straight away
+                if written > synced and (sync_now or time.monotonic() - last_fsync >= self.fsync_interval):
+                    os.fsync(self._file.fileno())
+                    self.fsyncs += 1
+                    last_fsync = time.monotonic()
+                    synced = written
+            except OSError:
+                logging.exception('The order journal failed to write to %s.', self.path)
+
+            if records:
+                for listener in self._listeners:
+                    try:
+                        listener(records)
+                    except Exception:
+                        logging.exception('A listener of the order journal failed.')
+
+            if sync_now:
+                with self._condition:
+                    self._synced = synced
+                    self._condition.notify_all()
+
+            if closed:
+                return
+
+    @staticmethod
+    def read(path: Union[str,pathlib.Path] = DEFAULT_JOURNAL_PATH) -> Iterator[Dict]:
+        """Reads the records of a journal file in the order they were written, skipping a line torn by a crash."""
+
+        path = pathlib.Path(path)
+        if not path.exists():
+            return
+
+        with open(path, mode='rb') as journal_file:
+            for line_number, line in enumerate(journal_file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning('Skipped the unreadable line %d of the order journal %s.', line_number, path)
+
+    def query(self, event: str = None, symbol: str = None, trade_id: str = None, start: Union[int,datetime] = None,
+    end: Union[int,datetime] = None) -> List[Dict]:
+        """Returns the records matching every filter given, after writing the queued records.
+
+        Arguments:
+        ----
+        event {str} -- Only records of this event, e.g. 'fill'. (default: {None})
+
+        symbol {str} -- Only records of this symbol. (default: {None})
+
+        trade_id {str} -- Only records of this order id. (default: {None})
+
+        start {Union[int,datetime]} -- Only records journaled at or after this epoch ms or time. (default: {None})
+
+        end {Union[int,datetime]} -- Only records journaled before this epoch ms or time. (default: {None})
+
+        Returns:
+        ----
+        {List[Dict]} -- The records, oldest first.
+        """
+
+        self.flush(timeout=10.0)
+        start = _epoch_ms(start)
+        end = _epoch_ms(end)
+
+        return [
+            record for record in self.read(self.path)
+            if (event is None or record.get('event') == event)
+            and (symbol is None or record.get('symbol') == symbol)
+            and (trade_id is None or str(record.get('trade_id')) == str(trade_id))
+            and (start is None or record.get('ts', 0) >= start)
+            and (end is None or record.get('ts', 0) < end)
+        ]
+
+    def replay(self, portfolio: object, portfolios: Dict[str,object] = None) -> object:
+        """Rebuilds the positions of a Portfolio from the fills in the journal, e.g. after a restart.
+
+        Arguments:
+        ----
+        portfolio {Portfolio} -- The portfolio the positions are added to.
+
+        portfolios {Dict[str,Portfolio]} -- The portfolio of every account. A fill journaled with an
+            account goes to the portfolio of its account and is skipped if the account isn't one of
+            them. Only the fills without an account go to `portfolio`. (default: {every fill goes to `portfolio`})
+
+        Returns:
+        ----
+        {Portfolio} -- The portfolio.
+        """
+
+        self.flush(timeout=10.0)
+
+        for record in self.read(self.path):
+            symbol = record.get('symbol')
+            if record.get('event') != 'fill' or symbol is None:
+                continue
+
+            fill_portfolio = portfolio
+            if portfolios is not None and record.get('account'):
+                if record['account'] not in portfolios:
+                    continue
+                fill_portfolio = portfolios[record['account']]
+
+            signed_quantity = float(record['quantity']) * (1 if record['side'] == 'BUY' else -1)
+            price = record.get('price')
+
+            if not fill_portfolio.in_portfolio(symbol=symbol):
+                fill_portfolio.add_position(
+                    symbol=symbol,
+                    asset_type=record.get('asset_type') or 'STK',
+                    purchase_date=datetime.fromtimestamp(record['ts'] / 1000, tz=timezone.utc).replace(microsecond=0).isoformat(),
+                    order_status=record.get('order_status') or 'Filled',
+                    quantity=signed_quantity,
+                    purchase_price=price if price is not None else 0.0
+                )
+            else:
+                fill_portfolio.update_position(
+                    symbol=symbol,
+                    quantity=fill_portfolio.positions[symbol]['quantity'] + signed_quantity,
+                    price=price,
+                    order_status=record.get('order_status')
+                )
+
+            fill_portfolio.set_ownership_status(symbol=symbol, ownership=fill_portfolio.positions[symbol]['quantity'] != 0)
+
+        return portfolio
+
+
+def _epoch_ms(moment: Union[int,datetime,None]) -> Optional[int]:
+    if isinstance(moment, datetime):
+        return int(moment.timestamp() * 1000)
+
+    return moment
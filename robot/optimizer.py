@@ -0,0 +1,256 @@
+import os
+import operator
+import itertools
+import traceback
+import numpy as np
+import pandas as pd
+
+from typing import Any
+from typing import List
+from typing import Dict
+from typing import Union
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import robot.stock_frame as stock_frame
+import robot.indicator as indicator
+import robot.backtester as backtester
+
+# The columns of the StockFrame that are shared with the workers
+SHARED_COLUMNS = ['open','close','high','low','volume']
+
+# The state of a worker process, set up once by _init_worker() and reused by every evaluation
+_worker_state = {}
+
+
+def rsi_strategy(indicator_client: indicator.Indicators, period: int = 14, buy: float = 30.0, sell: float = 70.0) -> None:
+    """A strategy which buys when the RSI drops to `buy` and sells when it climbs to `sell`.
+
+    Arguments:
+    ----
+    indicator_client {indicator.Indicators} -- The Indicators object to set the strategy on.
+    period {int} -- The period of the RSI. Default is 14.
+    buy {float} -- The buy threshold. Default is 30.0.
+    sell {float} -- The sell threshold. Default is 70.0.
+    """
+    indicator_client.rsi(period=period)
+    indicator_client.set_indicator_signal(
+        indicator='rsi',
+        buy=buy,
+        sell=sell,
+        condition_buy=operator.le,
+        condition_sell=operator.ge
+    )
+
+
+def _init_worker(shared_arrays: Dict[str,Tuple[str,str,int]], symbols: List[str], timeframe: str, strategy: Callable,
+fill_model: backtester.FillModel, initial_cash: float) -> None:
+    """Attaches a worker process to the shared price arrays and rebuilds the price frame from them."""
+    arrays = {}
+    for column, (shm_name, dtype, length) in shared_arrays.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arrays[column] = np.ndarray(shape=(length,), dtype=dtype, buffer=shm.buf)
+        # Shared by every worker, so they must never be written to
+        arrays[column].flags.writeable = False
+
+        # Keep the block referenced, otherwise it is closed along with the SharedMemory object
+        _worker_state.setdefault('shared_memory', []).append(shm)
+
+    unique_times = np.unique(arrays['datetime'])
+    multi_index = pd.MultiIndex(
+        levels=[pd.Index(symbols), pd.DatetimeIndex(unique_times)],
+        codes=[arrays['symbol_code'], np.searchsorted(unique_times, arrays['datetime'])],
+        names=['symbol','datetime'],
+        verify_integrity=False
+    )
+
+    # Built without copying, every column stays a block of its own backed by the shared memory
+    _worker_state['frame'] = pd.DataFrame(
+        data={column: arrays[column] for column in SHARED_COLUMNS},
+        index=multi_index,
+        copy=False
+    )
+    _worker_state['timeframe'] = timeframe
+    _worker_state['strategy'] = strategy
+    _worker_state['fill_model'] = fill_model
+    _worker_state['initial_cash'] = initial_cash
+
+
+def _release_worker() -> None:
+    """Drops the frame of the worker and closes its handles on the shared price arrays.
+
+    The handles are only closed once nothing refers to the frame, reading a view of a
+    closed block crashes the process.
+    """
+    attached_blocks = _worker_state.get('shared_memory', [])
+    _worker_state.clear()
+
+    for shm in attached_blocks:
+        shm.close()
+
+
+def _evaluate_parameters(parameters: Dict) -> Dict:
+    """Runs a backtest of the strategy with one set of parameters inside a worker process."""
+    # Every evaluation adds its own indicator columns to a shallow copy of the frame,
+    # the price columns stay in shared memory
+    price_df = stock_frame.StockFrame(
+        data=_worker_state['frame'].copy(deep=False),
+        timeframe=_worker_state['timeframe']
+    )
+    indicator_client = indicator.Indicators(price_df=price_df)
+    _worker_state['strategy'](indicator_client, **parameters)
+
+    results = backtester.Backtester(
+        price_df=price_df,
+        indicator_client=indicator_client,
+        fill_model=_worker_state['fill_model'],
+        initial_cash=_worker_state['initial_cash']
+    ).run()
+
+    evaluation = dict(parameters)
+    evaluation.update(results['stats'])
+
+    return evaluation
+
+
+class ParameterSweep():
+
+    def __init__(self, price_df: stock_frame.StockFrame, strategy: Callable = rsi_strategy, fill_model: backtester.FillModel = None,
+    initial_cash: float = 100000.0, max_workers: Optional[int] = None) -> None:
+        """Initalizes a new instance of the ParameterSweep object.
+        Overview:
+        ----
+        A parameter sweep backtests a strategy for every combination of parameters and ranks
+        the results. The combinations are spread over a pool of processes. The price columns
+        of the StockFrame are copied into shared memory once and every worker builds its
+        frame from there, instead of the StockFrame being pickled for every combination.
+        Arguments:
+        ----
+        price_df {stock_frame.StockFrame} -- The StockFrame holding the history.
+
+        strategy {Callable} -- A function which takes an Indicators object and the parameters as
+            keyword arguments, and adds the indicators and signals to it. It must be defined at the
+            top level of a module so it can be sent to the workers. Default is `rsi_strategy`.
+
+        fill_model {backtester.FillModel} -- The model used to fill the orders. Default is `FillModel()`.
+
+        initial_cash {float} -- The cash the portfolio starts with. Default is 100000.0.
+
+        max_workers {Optional[int]} -- The number of processes, 1 runs in the current process.
+            Default is the number of CPUs.
+        Usage:
+        ----
+            >>> sweep = ParameterSweep(price_df=stock_frame_client)
+            >>> parameters = sweep.grid(parameter_grid={
+                'period': [7, 14, 21],
+                'buy': [20.0, 25.0, 30.0],
+                'sell': [70.0, 75.0, 80.0]
+            })
+            >>> ranked_df = sweep.run(parameters=parameters, rank_by='sharpe_ratio')
+        """
+        self._stock_frame = price_df
+        self.strategy = strategy
+        self.fill_model = fill_model if fill_model is not None else backtester.FillModel()
+        self.initial_cash = initial_cash
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+
+    def grid(self, parameter_grid: Dict[str,List[Any]]) -> List[Dict]:
+        """Returns every combination of the parameter values.
+        Arguments:
+        ----
+        parameter_grid {Dict[str,List[Any]]} -- The parameter names mapped to the values to try.
+        Returns:
+        ----
+        {List[Dict]} -- A list of the parameters of every combination.
+        """
+        names = list(parameter_grid.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*parameter_grid.values())]
+
+    def random_sample(self, parameter_space: Dict[str,Union[List[Any],Tuple]], samples: int, seed: Optional[int] = None) -> List[Dict]:
+        """Returns a random sample of parameter combinations.
+        Arguments:
+        ----
+        parameter_space {Dict[str,Union[List[Any],Tuple]]} -- The parameter names mapped to either a list
+            of values to choose from, or a tuple (low, high) to draw from uniformly. Integers are drawn
+            if both bounds are integers.
+        samples {int} -- The number of combinations.
+        seed {Optional[int]} -- The seed of the random generator. (default: {None})
+        Returns:
+        ----
+        {List[Dict]} -- A list of the parameters of every combination.
+        """
+        random_generator = np.random.default_rng(seed)
+        parameters = []
+
+        for _ in range(samples):
+            combination = {}
+            for name, space in parameter_space.items():
+                if isinstance(space, tuple):
+                    low, high = space
+                    if isinstance(low, int) and isinstance(high, int):
+                        combination[name] = int(random_generator.integers(low, high, endpoint=True))
+                    else:
+                        combination[name] = float(random_generator.uniform(low, high))
+                else:
+                    combination[name] = space[random_generator.integers(len(space))]
+            parameters.append(combination)
+
+        return parameters
+
+    def run(self, parameters: List[Dict], rank_by: str = 'sharpe_ratio', ascending: bool = False) -> pd.DataFrame:
+        """Backtests the strategy for every combination of parameters.
+        Arguments:
+        ----
+        parameters {List[Dict]} -- The parameter combinations, e.g. from `grid()` or `random_sample()`.
+        rank_by {str} -- The stat the results are ranked by, see `Backtester.run()`. Default is 'sharpe_ratio'.
+        ascending {bool} -- Rank the lowest value first. Default is False.
+        Returns:
+        ----
+        {pd.DataFrame} -- A row for every combination with its parameters and stats, best first.
+        """
+        frame = self._stock_frame.frame
+        symbol_codes = frame.index.codes[0]
+
+        columns = {column: frame[column].to_numpy(dtype=np.float64) for column in SHARED_COLUMNS}
+        columns['symbol_code'] = np.asarray(symbol_codes, dtype=np.int32)
+        columns['datetime'] = frame.index.get_level_values('datetime').to_numpy(dtype='datetime64[ns]')
+        symbols = list(frame.index.levels[0])
+
+        shared_blocks = []
+        try:
+            # Copy every column into its own block of shared memory
+            shared_arrays = {}
+            for column, values in columns.items():
+                shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                np.ndarray(shape=values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+                shared_blocks.append(shm)
+                shared_arrays[column] = (shm.name, values.dtype.str, len(values))
+
+            init_arguments = (shared_arrays, symbols, self._stock_frame.timeframe, self.strategy, self.fill_model, self.initial_cash)
+
+            if self.max_workers == 1:
+                try:
+                    _init_worker(*init_arguments)
+                    evaluations = [_evaluate_parameters(combination) for combination in parameters]
+                except BaseException as error:
+                    # The frames of the failed evaluation still hold views on the shared arrays
+                    traceback.clear_frames(error.__traceback__)
+                    raise
+                finally:
+                    _release_worker()
+            else:
+                with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=init_arguments) as executor:
+                    evaluations = list(executor.map(_evaluate_parameters, parameters, chunksize=max(1, len(parameters) // (self.max_workers * 4))))
+        finally:
+            for shm in shared_blocks:
+                shm.close()
+                shm.unlink()
+
+        results_df = pd.DataFrame(evaluations)
+        if not results_df.empty:
+            results_df = results_df.sort_values(by=rank_by, ascending=ascending).reset_index(drop=True)
+
+        return results_df
@@ -0,0 +1,311 @@
+import sqlite3
+import pathlib
+import threading
+
+from typing import List
+from typing import Dict
+from typing import Union
+from typing import Iterable
+from typing import Optional
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from datetime import timedelta
+
+import robot.journal as journal
+
+# Where the order history is kept unless the Trader is given another path
+DEFAULT_STORE_PATH = 'order_record/orders.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS orders (
+    local_trade_id TEXT PRIMARY KEY,
+    trade_id TEXT,
+    account TEXT,
+    symbol TEXT,
+    conid TEXT,
+    side TEXT,
+    quantity REAL,
+    price REAL,
+    order_type TEXT,
+    asset_type TEXT,
+    order_status TEXT,
+    total_cost REAL,
+    created INTEGER,
+    updated INTEGER
+);
+CREATE INDEX IF NOT EXISTS orders_symbol_created ON orders (symbol, created);
+CREATE INDEX IF NOT EXISTS orders_created ON orders (created);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (order_status);
+CREATE INDEX IF NOT EXISTS orders_trade_id ON orders (trade_id);
+
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    trade_id TEXT NOT NULL DEFAULT '',
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    price REAL,
+    asset_type TEXT,
+    order_status TEXT,
+    UNIQUE (ts, trade_id, symbol, side, quantity)
+);
+CREATE INDEX IF NOT EXISTS fills_symbol_ts ON fills (symbol, ts);
+CREATE INDEX IF NOT EXISTS fills_ts ON fills (ts);
+CREATE INDEX IF NOT EXISTS fills_trade_id ON fills (trade_id);
+'''
+
+ORDER_COLUMNS = [
+    'local_trade_id', 'trade_id', 'account', 'symbol', 'conid', 'side', 'quantity',
+    'price', 'order_type', 'asset_type', 'order_status', 'total_cost', 'created', 'updated'
+]
+
+FILL_COLUMNS = ['ts', 'trade_id', 'symbol', 'side', 'quantity', 'price', 'asset_type', 'order_status']
+
+
+class OrderStore():
+
+    def __init__(self, path: Union[str,pathlib.Path] = DEFAULT_STORE_PATH) -> None:
+        """An indexed history of the orders and fills, kept in SQLite.
+
+        Overview:
+        ----
+        The orders are keyed by their local trade id and updated as their status changes, the
+        fills are appended. Both are indexed by symbol, time, status and trade id, so the history
+        of a day or of a symbol is a query rather than a scan of the journal. The database runs in
+        WAL mode, so reports can read it while the journal writes to it. Attach it to an
+        OrderJournal with `journal.add_listener(store.ingest)`, and fill it from an existing
+        journal file with `load_journal()`.
+
+        Arguments:
+        ----
+        path {Union[str,pathlib.Path]} -- The database file, created with its folder if it doesn't
+            exist. ':memory:' keeps it in memory. (default: {DEFAULT_STORE_PATH})
+
+        Usage:
+        ----
+            >>> order_store = OrderStore(path='order_record/orders.db')
+            >>> order_store.load_journal(path='order_record/orders.jsonl')
+            >>> order_store.orders(symbol='AAPL', status='Filled', start=datetime(2021, 4, 15))
+            >>> order_store.daily_report(day=date(2021, 4, 15))
+        """
+
+        if str(path) != ':memory:':
+            pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def ingest(self, records: Iterable[Dict]) -> None:
+        """Adds a batch of journal records in one transaction. Records which are already in the store are skipped.
+
+        Arguments:
+        ----
+        records {Iterable[Dict]} -- The records, as written by the OrderJournal.
+        """
+
+        order_rows = []
+        fill_rows = []
+
+        for record in records:
+            if record.get('event') == 'fill':
+                fill_rows.append((
+                    record['ts'],
+                    str(record.get('trade_id') or ''),
+                    record['symbol'],
+                    record['side'],
+                    record['quantity'],
+                    record.get('price'),
+                    record.get('asset_type'),
+                    record.get('order_status')
+                ))
+            elif record.get('local_trade_id') is not None:
+                order_rows.append((
+                    record['local_trade_id'],
+                    str(record['trade_id']) if record.get('trade_id') not in (None, '') else None,
+                    record.get('account'),
+                    record.get('symbol'),
+                    str(record['conid']) if record.get('conid') is not None else None,
+                    record.get('side'),
+                    record.get('quantity'),
+                    record.get('price'),
+                    record.get('order_type'),
+                    record.get('asset_type'),
+                    record.get('order_status'),
+                    record.get('total_cost'),
+                    record['ts'],
+                    record['ts']
+                ))
+
+        with self._lock, self._connection:
+            # A later record of an order only updates what can change, the order keeps its creation time
+            self._connection.executemany('''
+                INSERT INTO orders VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT (local_trade_id) DO UPDATE SET
+                    trade_id = COALESCE(excluded.trade_id, trade_id),
+                    order_status = COALESCE(excluded.order_status, order_status),
+                    total_cost = COALESCE(excluded.total_cost, total_cost),
+                    updated = MAX(updated, excluded.updated)
+            ''', order_rows)
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO fills (ts, trade_id, symbol, side, quantity, price, asset_type, order_status) VALUES (?,?,?,?,?,?,?,?)',
+                fill_rows
+            )
+
+    def load_journal(self, path: Union[str,pathlib.Path] = journal.DEFAULT_JOURNAL_PATH, batch_size: int = 5000) -> int:
+        """Adds the records of a journal file, e.g. the orders journaled before the store existed.
+
+        Returns:
+        ----
+        {int} -- The number of records read.
+        """
+
+        count = 0
+        batch = []
+        for record in journal.OrderJournal.read(path):
+            batch.append(record)
+            if len(batch) == batch_size:
+                self.ingest(batch)
+                count += len(batch)
+                batch = []
+
+        self.ingest(batch)
+        return count + len(batch)
+
+    def orders(self, symbol: str = None, status: str = None, trade_id: str = None, start: Union[int,datetime] = None,
+    end: Union[int,datetime] = None, limit: int = None) -> List[Dict]:
+        """Queries the orders, every filter given has to match.
+
+        Arguments:
+        ----
+        symbol {str} -- The symbol. (default: {None})
+
+        status {str} -- The order status, e.g. 'Filled'. (default: {None})
+
+        trade_id {str} -- The order id given by IB, or the local trade id. (default: {None})
+
+        start {Union[int,datetime]} -- Orders created at or after this epoch ms or time. (default: {None})
+
+        end {Union[int,datetime]} -- Orders created before this epoch ms or time. (default: {None})
+
+        limit {int} -- The most orders returned, the newest first. (default: {None})
+
+        Returns:
+        ----
+        {List[Dict]} -- The orders, oldest first unless a limit is given.
+        """
+
+        conditions, parameters = self._time_conditions(column='created', start=start, end=end)
+        if symbol is not None:
+            conditions.append('symbol = ?')
+            parameters.append(symbol)
+        if status is not None:
+            conditions.append('order_status = ?')
+            parameters.append(status)
+        if trade_id is not None:
+            conditions.append('(trade_id = ? OR local_trade_id = ?)')
+            parameters += [str(trade_id), str(trade_id)]
+
+        return self._select(table='orders', time_column='created', conditions=conditions, parameters=parameters, limit=limit)
+
+    def fills(self, symbol: str = None, trade_id: str = None, start: Union[int,datetime] = None,
+    end: Union[int,datetime] = None, limit: int = None) -> List[Dict]:
+        """Queries the fills, every filter given has to match. The arguments are the same as `orders()`."""
+
+        conditions, parameters = self._time_conditions(column='ts', start=start, end=end)
+        if symbol is not None:
+            conditions.append('symbol = ?')
+            parameters.append(symbol)
+        if trade_id is not None:
+            conditions.append('trade_id = ?')
+            parameters.append(str(trade_id))
+
+        return self._select(table='fills', time_column='ts', conditions=conditions, parameters=parameters, limit=limit)
+
+    def daily_report(self, day: date = None) -> List[Dict]:
+        """Sums up the fills of a day by symbol, for reconciliation against the account.
+
+        Arguments:
+        ----
+        day {date} -- The UTC day. (default: {today})
+
+        Returns:
+        ----
+        {List[Dict]} -- For every symbol traded: the quantity and value bought and sold, the net
+            quantity, the cash flow and the number of fills.
+        """
+
+        day = day if day is not None else datetime.now(tz=timezone.utc).date()
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+        with self._lock:
+            rows = self._connection.execute('''
+                SELECT
+                    symbol,
+                    SUM(CASE WHEN side = 'BUY' THEN quantity ELSE 0 END) AS bought,
+                    SUM(CASE WHEN side = 'SELL' THEN quantity ELSE 0 END) AS sold,
+                    SUM(CASE WHEN side = 'BUY' THEN quantity * price ELSE 0 END) AS bought_value,
+                    SUM(CASE WHEN side = 'SELL' THEN quantity * price ELSE 0 END) AS sold_value,
+                    COUNT(*) AS fills
+                FROM fills
+                WHERE ts >= ? AND ts < ?
+                GROUP BY symbol
+                ORDER BY symbol
+            ''', (_epoch_ms(start), _epoch_ms(start + timedelta(days=1)))).fetchall()
+
+        report = []
+        for row in rows:
+            summary = dict(row)
+            summary['net_quantity'] = summary['bought'] - summary['sold']
+            summary['cash_flow'] = (summary['sold_value'] or 0.0) - (summary['bought_value'] or 0.0)
+            report.append(summary)
+
+        return report
+
+    @staticmethod
+    def _time_conditions(column: str, start: Union[int,datetime,None], end: Union[int,datetime,None]) -> tuple:
+        conditions = []
+        parameters = []
+        if start is not None:
+            conditions.append('{column} >= ?'.format(column=column))
+            parameters.append(_epoch_ms(start))
+        if end is not None:
+            conditions.append('{column} < ?'.format(column=column))
+            parameters.append(_epoch_ms(end))
+
+        return conditions, parameters
+
+    def _select(self, table: str, time_column: str, conditions: List[str], parameters: List, limit: Optional[int]) -> List[Dict]:
+        query = 'SELECT * FROM {table}'.format(table=table)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        if limit is not None:
+            query += ' ORDER BY {column} DESC LIMIT ?'.format(column=time_column)
+            parameters = parameters + [limit]
+        else:
+            query += ' ORDER BY {column}'.format(column=time_column)
+
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+
+        return [dict(row) for row in rows]
+
+
+def _epoch_ms(moment: Union[int,datetime]) -> int:
+    if isinstance(moment, datetime):
+        return int(moment.timestamp() * 1000)
+
+    return int(moment)
@@ -0,0 +1,304 @@
+import logging
+import threading
+
+from typing import List
+from typing import Dict
+from typing import Tuple
+from typing import Callable
+from typing import Optional
+
+# The states of an order
+PENDING_SUBMIT = 'PendingSubmit'
+SUBMITTED = 'Submitted'
+PARTIALLY_FILLED = 'PartiallyFilled'
+FILLED = 'Filled'
+CANCELLED = 'Cancelled'
+REJECTED = 'Rejected'
+
+# The states an order can move to from every state, the last three are final
+TRANSITIONS = {
+    PENDING_SUBMIT: {SUBMITTED, PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED},
+    SUBMITTED: {PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED},
+    PARTIALLY_FILLED: {PARTIALLY_FILLED, FILLED, CANCELLED},
+    FILLED: set(),
+    CANCELLED: set(),
+    REJECTED: set()
+}
+
+FINAL_STATES = {FILLED, CANCELLED, REJECTED}
+
+# The order statuses of the gateway mapped to the states, 'PendingCancel' leaves the state as it is
+GATEWAY_STATUSES = {
+    'PendingSubmit': PENDING_SUBMIT,
+    'ApiPending': PENDING_SUBMIT,
+    'PreSubmitted': SUBMITTED,
+    'Submitted': SUBMITTED,
+    'Filled': FILLED,
+    'Cancelled': CANCELLED,
+    'ApiCancelled': CANCELLED,
+    'Inactive': REJECTED,
+    'Rejected': REJECTED
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class Order():
+
+    def __init__(self, trade_id: str, conid: str = None, symbol: str = None, side: str = None, quantity: float = 0.0,
+    local_trade_id: str = None, state: str = PENDING_SUBMIT, account: str = None) -> None:
+        """An order tracked by the OrderManager.
+
+        Arguments:
+        ----
+        trade_id {str} -- The order id given by IB.
+
+        conid {str} -- The conid of the order. (default: {None})
+
+        symbol {str} -- The symbol of the order. (default: {None})
+
+        side {str} -- 'BUY' or 'SELL'. (default: {None})
+
+        quantity {float} -- The quantity of the order. (default: {0.0})
+
+        local_trade_id {str} -- The local trade id (cOID) of the order. (default: {None})
+
+        state {str} -- The state of the order. (default: {PENDING_SUBMIT})
+
+        account {str} -- The account of the order. (default: {None})
+        """
+
+        self.trade_id = str(trade_id)
+        self.conid = str(conid) if conid is not None else None
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.local_trade_id = local_trade_id
+        self.state = state
+        self.account = account
+        self.filled_quantity = 0.0
+        self.average_price: Optional[float] = None
+        self.gateway_status: Optional[str] = None
+
+        # The fields of the last live order update, an update with the same fields has nothing new
+        self._fingerprint: Optional[Tuple] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.state not in FINAL_STATES
+
+    @property
+    def remaining_quantity(self) -> float:
+        return self.quantity - self.filled_quantity
+
+    def __repr__(self) -> str:
+        return 'Order(trade_id={trade_id}, symbol={symbol}, side={side}, state={state}, filled={filled}/{quantity})'.format(
+            trade_id=self.trade_id,
+            symbol=self.symbol,
+            side=self.side,
+            state=self.state,
+            filled=self.filled_quantity,
+            quantity=self.quantity
+        )
+
+
+class OrderManager():
+
+    def __init__(self, on_change: Callable[[Order, str], None] = None) -> None:
+        """Keeps the orders in a state machine, indexed by trade id and by conid.
+
+        Overview:
+        ----
+        An order moves from PendingSubmit to Submitted, PartiallyFilled and finally to Filled,
+        Cancelled or Rejected. Only the transitions in `TRANSITIONS` are allowed, so a stale update
+        from the gateway can't move a filled order back to submitted. The live orders from
+        `IBClient.get_live_orders()` are applied as a diff: an order whose status, filled quantity
+        and last execution haven't changed since the last poll is skipped.
+
+        Arguments:
+        ----
+        on_change {Callable[[Order, str], None]} -- Called with every order whose state or filled
+            quantity has changed, and its previous state. (default: {None})
+
+        Usage:
+        ----
+            >>> order_manager = OrderManager()
+            >>> order_manager.add_order(trade_id='1234', conid='265598', symbol='AAPL', side='BUY', quantity=10)
+            >>> changed_orders = order_manager.apply_live_orders(live_orders=trader.session.get_live_orders())
+            >>> order_manager.open_orders(conid='265598')
+            [Order(trade_id=1234, symbol=AAPL, side=BUY, state=PartiallyFilled, filled=4.0/10)]
+        """
+
+        self.on_change = on_change
+
+        self.updates = 0
+        self.skipped_updates = 0
+
+        self._orders: Dict[str,Order] = {}
+        self._conid_orders: Dict[str,Dict[str,Order]] = {}
+        self._open_orders: Dict[str,Order] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def get(self, trade_id: str) -> Optional[Order]:
+        return self._orders.get(str(trade_id))
+
+    def orders(self, conid: str = None) -> List[Order]:
+        """Returns the orders, of a conid if one is given."""
+
+        with self._lock:
+            if conid is None:
+                return list(self._orders.values())
+            return list(self._conid_orders.get(str(conid), {}).values())
+
+    def open_orders(self, conid: str = None) -> List[Order]:
+        """Returns the orders which aren't filled, cancelled or rejected, of a conid if one is given."""
+
+        with self._lock:
+            if conid is None:
+                return list(self._open_orders.values())
+            return [order for order in self._conid_orders.get(str(conid), {}).values() if order.is_open]
+
+    def add_order(self, trade_id: str, conid: str = None, symbol: str = None, side: str = None, quantity: float = 0.0,
+    local_trade_id: str = None, state: str = PENDING_SUBMIT, account: str = None) -> Order:
+        """Starts tracking an order, e.g. once it has been placed. An order already tracked is returned as it is."""
+
+        with self._lock:
+            order = self._orders.get(str(trade_id))
+            if order is not None:
+                return order
+
+            order = Order(
+                trade_id=trade_id,
+                conid=conid,
+                symbol=symbol,
+                side=side,
+                quantity=quantity,
+                local_trade_id=local_trade_id,
+                state=state,
+                account=account
+            )
+            self._orders[order.trade_id] = order
+            if order.conid is not None:
+                self._conid_orders.setdefault(order.conid, {})[order.trade_id] = order
+            if order.is_open:
+                self._open_orders[order.trade_id] = order
+
+            return order
+
+    def transition(self, trade_id: str, state: str) -> Order:
+        """Moves an order to a new state.
+
+        Raises:
+        ----
+        KeyError: If the order isn't tracked.
+
+        InvalidTransition: If the order can't move from its state to the new one.
+        """
+
+        with self._lock:
+            order = self._orders[str(trade_id)]
+            previous_state = order.state
+            if state == previous_state:
+                return order
+            if state not in TRANSITIONS[previous_state]:
+                raise InvalidTransition("Order {trade_id} can't move from {previous_state} to {state}.".format(
+                    trade_id=order.trade_id, previous_state=previous_state, state=state))
+
+            order.state = state
+            if not order.is_open:
+                self._open_orders.pop(order.trade_id, None)
+
+        if self.on_change is not None:
+            self.on_change(order, previous_state)
+
+        return order
+
+    def apply_live_orders(self, live_orders: Dict) -> List[Order]:
+        """Applies the live orders returned by `IBClient.get_live_orders()`.
+
+        Arguments:
+        ----
+        live_orders {Dict} -- The response, with the live orders under 'orders'.
+
+        Returns:
+        ----
+        {List[Order]} -- The orders which have changed.
+        """
+
+        changed_orders = []
+        for live_order in live_orders.get('orders') or []:
+            order = self.apply_live_order(live_order=live_order)
+            if order is not None:
+                changed_orders.append(order)
+
+        return changed_orders
+
+    def apply_live_order(self, live_order: Dict) -> Optional[Order]:
+        """Applies one live order, returns the order if it has changed and None otherwise."""
+
+        trade_id = str(live_order.get('orderId'))
+        fingerprint = (live_order.get('status'), live_order.get('filledQuantity'), live_order.get('lastExecutionTime_r'))
+
+        with self._lock:
+            order = self._orders.get(trade_id)
+            if order is not None and order._fingerprint == fingerprint:
+                self.skipped_updates += 1
+                return None
+
+            self.updates += 1
+            if order is None:
+                # An order placed outside of this session
+                order = self.add_order(
+                    trade_id=trade_id,
+                    conid=live_order.get('conid'),
+                    symbol=live_order.get('ticker'),
+                    side=live_order.get('side'),
+                    quantity=_to_float(live_order.get('totalSize')),
+                    local_trade_id=live_order.get('order_ref'),
+                    account=live_order.get('acct')
+                )
+
+            order._fingerprint = fingerprint
+            previous_state = order.state
+            previous_filled_quantity = order.filled_quantity
+
+            filled_quantity = _to_float(live_order.get('filledQuantity'))
+            if filled_quantity is None:
+                filled_quantity = order.filled_quantity
+
+            state = GATEWAY_STATUSES.get(live_order.get('status'), previous_state)
+            if state == SUBMITTED and filled_quantity > 0:
+                state = PARTIALLY_FILLED
+
+            # An update which would move the order back, e.g. from Filled to Submitted, is stale
+            if state != previous_state and state not in TRANSITIONS[previous_state]:
+                logging.warning("Ignored a stale update of order %s from %s to %s.", trade_id, previous_state, state)
+                return None
+
+            order.gateway_status = live_order.get('status')
+            order.filled_quantity = filled_quantity
+            average_price = _to_float(live_order.get('avgPrice'))
+            if average_price is not None:
+                order.average_price = average_price
+
+            if state != previous_state:
+                return self.transition(trade_id=trade_id, state=state)
+
+            if order.filled_quantity != previous_filled_quantity:
+                if self.on_change is not None:
+                    self.on_change(order, previous_state)
+                return order
+
+        return None
+
+
+def _to_float(value: object) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -7,17 +7,120 @@ from typing import Tuple
 from ibw.client import IBClient
 
 import robot.stock_frame as stock_frame
+import robot.quotes as quotes
 import pandas as pd
 import numpy as np
 
 
+class RollingCovariance():
+
+    def __init__(self, symbols: List[str], window: int = 60) -> None:
+        """Keeps the covariance of the returns of several symbols over the last `window` bars.
+
+        Overview:
+        ----
+        The running sums of the returns and of their cross products are kept, so a new bar
+        adds its returns and takes off the returns of the bar leaving the window, which costs
+        O(k^2) for k symbols rather than recomputing the whole window. The sums are rebuilt
+        from the window every `window` bars, so rounding errors don't build up.
+
+        Arguments:
+        ----
+        symbols {List[str]} -- The symbols, in the order of the returns passed to `update()`.
+
+        window {int} -- The number of bars the covariance is computed over. (default: {60})
+
+        Usage:
+        ----
+            >>> rolling_covariance = RollingCovariance(symbols=['AAPL','MSFT'], window=60)
+            >>> rolling_covariance.update(returns=[0.0012, -0.0004])
+            >>> rolling_covariance.covariance()
+        """
+
+        self.symbols = list(symbols)
+        self.window = window
+        self.count = 0
+
+        self._returns = np.zeros((window, len(self.symbols)))
+        self._position = 0
+        self._updates = 0
+        self._sum = np.zeros(len(self.symbols))
+        self._products = np.zeros((len(self.symbols), len(self.symbols)))
+
+    def update(self, returns: Union[List[float],np.ndarray]) -> None:
+        """Adds the returns of a new bar, missing returns count as 0."""
+
+        returns = np.nan_to_num(np.asarray(returns, dtype=np.float64))
+
+        if self.count == self.window:
+            oldest = self._returns[self._position]
+            self._sum -= oldest
+            self._products -= np.outer(oldest, oldest)
+        else:
+            self.count += 1
+
+        self._returns[self._position] = returns
+        self._sum += returns
+        self._products += np.outer(returns, returns)
+        self._position = (self._position + 1) % self.window
+
+        self._updates += 1
+        if self._updates % self.window == 0:
+            history = self.history()
+            self._sum = history.sum(axis=0)
+            self._products = history.T @ history
+
+    def history(self) -> np.ndarray:
+        """Returns the returns in the window, one row per bar from the oldest to the newest."""
+
+        if self.count < self.window:
+            return self._returns[:self.count]
+
+        return np.roll(self._returns, -self._position, axis=0)
+
+    def covariance(self) -> np.ndarray:
+        """Returns the sample covariance matrix of the returns, NaN with fewer than 2 bars."""
+
+        if self.count < 2:
+            return np.full_like(self._products, np.nan)
+
+        return (self._products - np.outer(self._sum, self._sum) / self.count) / (self.count - 1)
+
+    def volatility(self) -> np.ndarray:
+        """Returns the standard deviation of the returns of every symbol, per bar."""
+
+        return np.sqrt(np.clip(np.diag(self.covariance()), 0.0, None))
+
+    def correlation(self) -> np.ndarray:
+        """Returns the correlation matrix of the returns, NaN for symbols whose price hasn't moved."""
+
+        volatility = self.volatility()
+        scale = np.outer(volatility, volatility)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(scale > 0, self.covariance() / scale, np.nan)
+
+
 class Portfolio():
 
-    def __init__(self,account_id = Optional[str]):
+    def __init__(self,account_id = Optional[str], quote_store: quotes.QuoteStore = None, risk_window: int = 60, benchmark: str = None):
         """Initalizes a new instance of the Portfolio object.
         Keyword Arguments:
         ----
         account_number {str} -- An accout number to associate with the Portfolio. (default: {None})
+
+        quote_store {QuoteStore} -- The quotes the current prices are read from. (default: {None})
+
+        risk_window {int} -- The number of bars the risk metrics are computed over. (default: {60})
+
+        benchmark {str} -- The symbol the beta is measured against, it needs to be in the StockFrame. (default: {None})
+
+        Overview:
+        ----
+        Besides the `positions` dictionary, the quantity, average price, last price and realised PnL
+        of every position are kept in NumPy columns, one row per position, so the valuation of the
+        whole portfolio is a handful of array operations. Change the positions through
+        `add_position()`, `update_position()` and `remove_position()` to keep both in step.
         """
         self.account = account_id
         self.positions = {}
@@ -25,6 +128,37 @@ class Portfolio():
         
         self._ib_client: IBClient = None
         self._stock_frame : stock_frame.StockFrame = None
+        self.quote_store: quotes.QuoteStore = quote_store
+
+        #The columns of the positions, the row of every symbol is kept in _rows
+        self._rows: Dict[str,int] = {}
+        self._symbols: List[str] = []
+        self._asset_types: List[str] = []
+        self.quantities = np.zeros(0)
+        self.average_prices = np.zeros(0)
+        self.last_prices = np.zeros(0)
+        self.realized_pnls = np.zeros(0)
+        self._quote_rows = np.zeros(0, dtype=np.int64)
+
+        #The realised PnL of the positions which have been removed
+        self._removed_realized_pnl = 0.0
+
+        #The rolling covariance of the returns and the last bar it has seen, see update_risk_metrics()
+        self.risk_window = risk_window
+        self.benchmark = benchmark
+        self._risk_covariance: RollingCovariance = None
+        self._risk_last_closes: pd.Series = None
+
+    @property
+    def stock_frame(self) -> stock_frame.StockFrame:
+        return self._stock_frame
+
+    @stock_frame.setter
+    def stock_frame(self, price_frame: 'stock_frame.StockFrame') -> None:
+        #The risk metrics are rebuilt from the history of the new frame
+        self._stock_frame = price_frame
+        self._risk_covariance = None
+        self._risk_last_closes = None
 
         
     #Create an add_position function to add positions to portfolio
@@ -57,10 +191,112 @@ class Portfolio():
         else:
             self.positions[symbol]['ownership_status'] = False
 
+        row = self._rows.get(symbol)
+        if row is None:
+            row = self._add_row(symbol=symbol)
+        self._asset_types[row] = asset_type
+        self.quantities[row] = quantity
+        self.average_prices[row] = purchase_price
+        self.last_prices[row] = np.nan
+        self.realized_pnls[row] = 0.0
+        self._quote_rows[row] = -1
+        self.positions_count = len(self.positions)
+
+        return self.positions[symbol]
+
+    def _add_row(self, symbol: str) -> int:
+        """Adds a row to the columns for a new position, doubling them when they are full."""
+        row = len(self._symbols)
+        if row == len(self.quantities):
+            self._reserve(capacity=row + 1)
+
+        self._rows[symbol] = row
+        self._symbols.append(symbol)
+        self._asset_types.append(None)
+
+        return row
+
+    def _reserve(self, capacity: int) -> None:
+        """Grows the columns to hold at least `capacity` positions, at least doubling them."""
+        if capacity <= len(self.quantities):
+            return
+
+        capacity = max(capacity, 2 * len(self.quantities), 16)
+        self.quantities = self._grow(self.quantities, capacity, 0.0)
+        self.average_prices = self._grow(self.average_prices, capacity, 0.0)
+        self.last_prices = self._grow(self.last_prices, capacity, np.nan)
+        self.realized_pnls = self._grow(self.realized_pnls, capacity, 0.0)
+        self._quote_rows = self._grow(self._quote_rows, capacity, -1)
+
+    @staticmethod
+    def _grow(values: np.ndarray, capacity: int, fill_value: float) -> np.ndarray:
+        grown = np.full(capacity, fill_value, dtype=values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def update_position(self, symbol: str, quantity: float = None, price: float = None, order_status: str = None) -> Dict:
+        """Updates a position after a fill or a change in its order.
+        Arguments:
+        ----
+        symbol {str} -- The symbol of the position.
+
+        quantity {float} -- The new quantity of the position. (default: {None})
+
+        price {float} -- The price the change in quantity was filled at. Buying more moves the average
+            price towards it and selling realises the PnL against the average price. (default: {None})
+
+        order_status {str} -- The new order status of the position. (default: {None})
+
+        Returns:
+        ----
+        {dict} -- The position.
+
+        Raises:
+        ----
+        KeyError: If the symbol is not in the portfolio.
+        """
+        if not self.in_portfolio(symbol=symbol):
+            raise KeyError("Symbol {symbol} is not in the portfolio.".format(symbol=symbol))
+
+        row = self._rows[symbol]
+        if quantity is not None:
+            old_quantity = self.quantities[row]
+            if price is not None:
+                if abs(quantity) > abs(old_quantity) and old_quantity * quantity >= 0:
+                    #Adding to the position
+                    self.average_prices[row] = (
+                        old_quantity * self.average_prices[row] + (quantity - old_quantity) * price
+                    ) / quantity
+                else:
+                    #Reducing the position, the part which is closed realises its PnL
+                    closed_quantity = old_quantity - quantity if old_quantity * quantity >= 0 else old_quantity
+                    self.realized_pnls[row] += closed_quantity * (price - self.average_prices[row])
+                    if old_quantity * quantity < 0:
+                        self.average_prices[row] = price
+
+                self.positions[symbol]['purchase_price'] = float(self.average_prices[row])
+
+            self.quantities[row] = quantity
+            self.positions[symbol]['quantity'] = quantity
+
+        if order_status is not None:
+            self.positions[symbol]['order_status'] = order_status
+
         return self.positions[symbol]
     
     def add_positions(self,positions:List[dict]) -> dict:
+        """Adds a batch of positions, growing the columns once for the whole batch.
+        Arguments:
+        ----
+        positions {List[dict]} -- The positions, with the arguments of `add_position()` as keys
+            and optionally their 'last_price'.
+
+        Returns:
+        ----
+        {dict} -- The positions of the portfolio.
+        """
         if isinstance(positions,list):
+            self._reserve(capacity=len(self._symbols) + len(positions))
             for position in positions:
                 self.add_position(
                     symbol=position['symbol'],
@@ -70,6 +306,8 @@ class Portfolio():
                     quantity=position.get('quantity',0.0),
                     order_status=position['order_status']
                 )
+                if position.get('last_price') is not None:
+                    self.set_price(symbol=position['symbol'], price=position['last_price'])
             return self.positions
         else:
             raise TypeError("Positions must be a list of dictionaries!")
@@ -77,20 +315,44 @@ class Portfolio():
     def remove_position(self,symbol:str) -> Tuple[bool,str]:
         if symbol in self.positions:
             del self.positions[symbol]
+            self._remove_row(symbol=symbol)
+            self.positions_count = len(self.positions)
             return (True,"Symbol {symbol} was successfully removed.".format(symbol=symbol))
         else:
             return (False,"Symbol {symbol} doesn't exist in the portfolio.".format(symbol=symbol))
 
+    def _remove_row(self, symbol: str) -> None:
+        """Removes the row of a position by moving the last row into its place."""
+        row = self._rows.pop(symbol)
+        last_row = len(self._symbols) - 1
+        self._removed_realized_pnl += self.realized_pnls[row]
+
+        if row != last_row:
+            last_symbol = self._symbols[last_row]
+            for values in (self.quantities, self.average_prices, self.last_prices, self.realized_pnls, self._quote_rows):
+                values[row] = values[last_row]
+            self._symbols[row] = last_symbol
+            self._asset_types[row] = self._asset_types[last_row]
+            self._rows[last_symbol] = row
+
+        self._symbols.pop()
+        self._asset_types.pop()
+
     def in_portfolio(self,symbol:str) -> bool:
         if symbol in self.positions:
             return True
         else:
             return False
 
-    def is_profitable(self,symbol:str, current_price:float) -> bool:
+    def is_profitable(self,symbol:str, current_price:float = None) -> bool:
         if self.in_portfolio(symbol=symbol):
             #Grab the purchase price
             purchase_price = self.positions[symbol]['purchase_price']    #Select the purchase_price for a symbol row
+            #Read the current price from the quote store if it isn't given
+            if current_price is None:
+                current_price = self._current_price(symbol=symbol)
+                if current_price is None:
+                    raise ValueError("There is no quote for {symbol}.".format(symbol=symbol))
             #Check if symbol is in portfolio
             if current_price > purchase_price:
                 return True
@@ -132,11 +394,290 @@ class Portfolio():
                 "Can't set ownership status, as you do not have the symbol in your portfolio."
             )
 
-    def total_allocation(self):
-        pass
+    def set_price(self, symbol: str, price: float) -> None:
+        """Sets the last price of a position, e.g. from the close of a bar."""
+        self.last_prices[self._rows[symbol]] = price
+
+    def set_average_price(self, symbol: str, price: float) -> None:
+        """Sets the average price of a position, e.g. from the positions of the account."""
+        self.average_prices[self._rows[symbol]] = price
+        self.positions[symbol]['purchase_price'] = price
 
-    def risk_exposure(self):
-        pass
+    def refresh_prices(self) -> None:
+        """Reads the last price of every position from the quote store in one go.
+        Positions without a quote keep their last price.
+        """
+        if self.quote_store is None or not self._symbols:
+            return
+
+        count = len(self._symbols)
+        quote_rows = self._quote_rows[:count]
+
+        #Look up the rows of the symbols which weren't in the quote store yet
+        for row in np.flatnonzero(quote_rows < 0):
+            quote_row = self.quote_store.row(symbol=self._symbols[row])
+            if quote_row is not None:
+                quote_rows[row] = quote_row
+
+        has_row = quote_rows >= 0
+        if not has_row.any():
+            return
+
+        store_prices = self.quote_store.columns['last'][quote_rows[has_row]]
+        has_price = ~np.isnan(store_prices)
+        rows = np.flatnonzero(has_row)[has_price]
+        self.last_prices[rows] = store_prices[has_price]
+
+    def _current_price(self, symbol: str) -> Optional[float]:
+        """Reads the last price of a symbol from the quote store, or the last price set on the position."""
+        if self.quote_store is not None:
+            current_price = self.quote_store.price(symbol=symbol)
+            if current_price is not None:
+                return current_price
+
+        row = self._rows.get(symbol)
+        if row is None or np.isnan(self.last_prices[row]):
+            return None
+
+        return float(self.last_prices[row])
+
+    def _valuation_prices(self) -> np.ndarray:
+        """The last price of every position, the average price for positions without one."""
+        count = len(self._symbols)
+        last_prices = self.last_prices[:count]
+        return np.where(np.isnan(last_prices), self.average_prices[:count], last_prices)
+
+    def market_values(self) -> Dict[str,float]:
+        """Calculates the market value of every position.
+        Returns:
+        ----
+        {Dict[str,float]} -- The market value of every position, keyed by symbol.
+        """
+        self.refresh_prices()
+        values = self.quantities[:len(self._symbols)] * self._valuation_prices()
+        return dict(zip(self._symbols, values.tolist()))
+
+    def positions_frame(self) -> pd.DataFrame:
+        """Returns the columns of the positions as a frame, one row per position.
+        Returns:
+        ----
+        {pd.DataFrame} -- The symbol, asset type, quantity, average price, last price and market value
+            of every position. Positions without a last price are valued at their average price.
+        """
+        count = len(self._symbols)
+        quantities = self.quantities[:count].copy()
+
+        return pd.DataFrame({
+            'symbol': list(self._symbols),
+            'asset_type': list(self._asset_types),
+            'quantity': quantities,
+            'average_price': self.average_prices[:count].copy(),
+            'last_price': self.last_prices[:count].copy(),
+            'market_value': quantities * self._valuation_prices()
+        })
+
+    def unrealized_pnl(self) -> float:
+        """Calculates the unrealised PnL of the positions with a last price."""
+        self.refresh_prices()
+        count = len(self._symbols)
+        pnls = self.quantities[:count] * (self.last_prices[:count] - self.average_prices[:count])
+        return float(np.nansum(pnls))
+
+    def realized_pnl(self) -> float:
+        """Returns the PnL realised by the fills recorded with `update_position()`, including removed positions."""
+        return float(self.realized_pnls[:len(self._symbols)].sum() + self._removed_realized_pnl)
+
+    def total_allocation(self) -> Dict[str,float]:
+        """Calculates the weight of every position, its market value over the total market value.
+        Returns:
+        ----
+        {Dict[str,float]} -- The weight of every position, keyed by symbol.
+        """
+        self.refresh_prices()
+        values = self.quantities[:len(self._symbols)] * self._valuation_prices()
+        total_value = values.sum()
+        if total_value == 0:
+            return {symbol: 0.0 for symbol in self._symbols}
+
+        return dict(zip(self._symbols, (values / total_value).tolist()))
+
+    def exposure_by_asset_type(self) -> Dict[str,float]:
+        """Calculates the gross exposure of every asset type, the sum of the absolute market values.
+        Returns:
+        ----
+        {Dict[str,float]} -- The exposure of every asset type, e.g. {'STK': 25000.0, 'OPT': 1200.0}.
+        """
+        self.refresh_prices()
+        if not self._symbols:
+            return {}
+
+        asset_types, codes = np.unique(np.array(self._asset_types, dtype=str), return_inverse=True)
+        values = np.abs(self.quantities[:len(self._symbols)] * self._valuation_prices())
+        exposures = np.bincount(codes, weights=values, minlength=len(asset_types))
+
+        return dict(zip(asset_types.tolist(), exposures.tolist()))
+
+    def _risk_symbols(self) -> List[str]:
+        """The symbols of the risk metrics, the positions and the benchmark which have prices in the StockFrame."""
+        symbols = set(self._symbols)
+        if self.benchmark is not None:
+            symbols.add(self.benchmark)
+
+        return sorted(symbols.intersection(self._stock_frame.symbol_slices.keys()))
+
+    def _close_prices(self, symbols: List[str], after: pd.Timestamp = None, bars: int = None) -> pd.DataFrame:
+        """Returns the closes of the symbols from the StockFrame, one column per symbol.
+        Arguments:
+        ----
+        symbols {List[str]} -- The symbols.
+
+        after {pd.Timestamp} -- Only the bars after this time are returned. (default: {None})
+
+        bars {int} -- Only the last bars of every symbol are returned. (default: {None})
+        """
+        frame = self._stock_frame.frame
+        symbol_slices = self._stock_frame.symbol_slices
+
+        closes = {}
+        for symbol in symbols:
+            symbol_frame = frame.iloc[symbol_slices[symbol]]
+            symbol_closes = pd.Series(
+                symbol_frame['close'].to_numpy(dtype=np.float64),
+                index=symbol_frame.index.get_level_values('datetime')
+            )
+            if after is not None:
+                symbol_closes = symbol_closes.iloc[symbol_closes.index.searchsorted(after, side='right'):]
+            if bars is not None:
+                symbol_closes = symbol_closes.iloc[-bars:]
+            closes[symbol] = symbol_closes
+
+        return pd.DataFrame(closes, columns=symbols).sort_index()
+
+    def update_risk_metrics(self) -> int:
+        """Adds the bars which have been added to the StockFrame since the last call to the risk metrics.
+        Overview:
+        ----
+        The first call, and every call after the positions or the benchmark have changed, builds the
+        rolling covariance from the last `risk_window` bars of the StockFrame. Every other call only
+        adds the returns of the new bars. Call it once every bar, `risk_exposure()` calls it as well.
+        Returns:
+        ----
+        {int} -- The number of bars added.
+        Raises:
+        ----
+        ValueError: If the portfolio has no StockFrame.
+        """
+        if self._stock_frame is None:
+            raise ValueError("The portfolio needs a StockFrame to compute the risk metrics.")
+
+        symbols = self._risk_symbols()
+
+        if self._risk_covariance is None or self._risk_covariance.symbols != symbols:
+            self._risk_covariance = RollingCovariance(symbols=symbols, window=self.risk_window)
+            closes = self._close_prices(symbols=symbols, bars=self.risk_window + 1).ffill()
+        else:
+            if self._risk_last_closes is None:
+                return 0
+            new_closes = self._close_prices(symbols=symbols, after=self._risk_last_closes.name)
+            if new_closes.empty:
+                return 0
+            #The last closes already seen give the returns of the first new bar
+            closes = pd.concat([self._risk_last_closes.to_frame().T, new_closes]).ffill()
+
+        if closes.empty:
+            self._risk_last_closes = None
+            return 0
+
+        returns = closes.pct_change().iloc[1:].to_numpy()
+        for bar_returns in returns:
+            self._risk_covariance.update(returns=bar_returns)
+
+        self._risk_last_closes = closes.iloc[-1]
+
+        return len(returns)
+
+    def risk_exposure(self, confidence: float = 0.95) -> Dict:
+        """Calculates the risk metrics of the portfolio over the last `risk_window` bars.
+        Arguments:
+        ----
+        confidence {float} -- The confidence level of the VaR and CVaR. (default: {0.95})
+        Returns:
+        ----
+        {Dict} -- The risk metrics:
+            'volatility' -- the standard deviation of the returns per bar of every symbol,
+            'covariance' and 'correlation' -- the matrices of the returns, as DataFrames,
+            'portfolio_volatility' -- the standard deviation of the PnL of the positions per bar,
+            'var' and 'cvar' -- the historical value at risk and expected shortfall of the positions per bar,
+            'beta' -- the beta of the positions against the benchmark, None without a benchmark,
+            'bars' -- the number of bars the metrics are computed over.
+        Usage:
+        ----
+            >>> trader_portfolio = trader.create_portfolio()
+            >>> trader_portfolio.benchmark = 'SPY'
+            >>> risk_metrics = trader_portfolio.risk_exposure(confidence=0.99)
+            >>> risk_metrics['var']
+            1532.27
+        """
+        self.update_risk_metrics()
+        rolling_covariance = self._risk_covariance
+        symbols = rolling_covariance.symbols
+
+        #The market value held in every symbol of the covariance, the benchmark has none unless it is a position
+        self.refresh_prices()
+        market_values = self.quantities[:len(self._symbols)] * self._valuation_prices()
+        exposures = np.array([market_values[self._rows[symbol]] if symbol in self._rows else 0.0 for symbol in symbols])
+
+        covariance = rolling_covariance.covariance()
+        pnls = rolling_covariance.history() @ exposures
+
+        var = cvar = np.nan
+        if len(pnls):
+            var = -np.quantile(pnls, 1 - confidence)
+            cvar = -pnls[pnls <= -var].mean()
+
+        beta = None
+        if self.benchmark in symbols:
+            benchmark_column = symbols.index(self.benchmark)
+            benchmark_variance = covariance[benchmark_column, benchmark_column]
+            total_value = exposures.sum()
+            if benchmark_variance > 0 and total_value != 0:
+                beta = float(exposures @ covariance[:, benchmark_column] / benchmark_variance / total_value)
+
+        return {
+            'volatility': dict(zip(symbols, rolling_covariance.volatility().tolist())),
+            'covariance': pd.DataFrame(covariance, index=symbols, columns=symbols),
+            'correlation': pd.DataFrame(rolling_covariance.correlation(), index=symbols, columns=symbols),
+            'portfolio_volatility': float(np.sqrt(max(exposures @ covariance @ exposures, 0.0))) if rolling_covariance.count > 1 else np.nan,
+            'var': float(var),
+            'cvar': float(cvar),
+            'beta': beta,
+            'bars': rolling_covariance.count
+        }
+
+    def total_market_value(self) -> float:
+        """Calculates the market value of the portfolio from the last prices.
+        Positions without a last price are valued at their purchase price.
+        Returns:
+        ----
+        {float} -- The total market value of the portfolio.
+        """
+        self.refresh_prices()
+        return float(np.dot(self.quantities[:len(self._symbols)], self._valuation_prices()))
+
+    def portfolio_metrics(self) -> Dict[str,float]:
+        """Calculates the valuation of the portfolio in one pass, e.g. once every bar.
+        Returns:
+        ----
+        {Dict[str,float]} -- The market value, unrealised and realised PnL and number of positions.
+        """
+        self.refresh_prices()
+        count = len(self._symbols)
+        quantities = self.quantities[:count]
+        last_prices = self.last_prices[:count]
 
-    def total_market_value(self):
-        pass
\ No newline at end of file
+        return {
+            'market_value': float(np.dot(quantities, self._valuation_prices())),
+            'unrealized_pnl': float(np.nansum(quantities * (last_prices - self.average_prices[:count]))),
+            'realized_pnl': self.realized_pnl(),
+            'positions': count
+        }
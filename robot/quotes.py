@@ -0,0 +1,406 @@
+import time
+import threading
+import numpy as np
+
+from typing import List
+from typing import Dict
+from typing import Optional
+
+from ibw.client import IBClient
+from robot.bar_builder import BarBuilder
+from robot.streaming import parse_field
+
+# The snapshot fields the poller requests, '55' is the symbol and the others are parsed as numbers
+SNAPSHOT_FIELDS = {
+    '55': 'symbol',
+    '31': 'last',
+    '7059': 'last_size',
+    '84': 'bid',
+    '88': 'bid_size',
+    '86': 'ask',
+    '85': 'ask_size',
+    '7762': 'volume'
+}
+
+# The numeric columns of the QuoteStore
+QUOTE_COLUMNS = ['last','last_size','bid','bid_size','ask','ask_size','volume']
+
+
+class QuoteStore():
+
+    def __init__(self, capacity: int = 256) -> None:
+        """A table of the latest quotes, shared by everything that reads or writes quotes.
+
+        Overview:
+        ----
+        Each conid gets a row in a set of float64 NumPy columns, one per quote field, plus the epoch
+        ms the row was last updated at. The conids and the symbols are both indexed to their row, so
+        reading a price is a dictionary lookup and an array read, with no request to the gateway.
+        Missing values are NaN in the columns and None when read. The columns grow as conids are added.
+
+        Arguments:
+        ----
+        capacity {int} -- The number of rows allocated up front. (default: {256})
+
+        Usage:
+        ----
+            >>> quote_store = QuoteStore()
+            >>> quote_store.update(conid='265598', symbol='AAPL', last=133.11, bid=133.1, ask=133.12)
+            >>> quote_store.price(symbol='AAPL')
+            133.11
+            >>> quote_store.price(conid='265598', field='ask', max_age=5.0)
+            133.12
+        """
+
+        self.columns: Dict[str,np.ndarray] = {column: np.full(capacity, np.nan) for column in QUOTE_COLUMNS}
+        self.updated = np.zeros(capacity, dtype=np.int64)
+
+        self._conid_rows: Dict[str,int] = {}
+        self._symbol_rows: Dict[str,int] = {}
+        self._conids: List[str] = []
+        self._symbols: List[Optional[str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._conids)
+
+    def __contains__(self, conid: str) -> bool:
+        return str(conid) in self._conid_rows
+
+    @property
+    def conids(self) -> List[str]:
+        return list(self._conids)
+
+    def _add_row(self, conid: str) -> int:
+        """Adds a row for a conid, doubling the columns when they are full. Called with the lock held."""
+
+        row = len(self._conids)
+        if row == len(self.updated):
+            capacity = max(2 * row, 1)
+            for column, values in self.columns.items():
+                grown = np.full(capacity, np.nan)
+                grown[:row] = values
+                self.columns[column] = grown
+
+            grown_updated = np.zeros(capacity, dtype=np.int64)
+            grown_updated[:row] = self.updated
+            self.updated = grown_updated
+
+        self._conid_rows[conid] = row
+        self._conids.append(conid)
+        self._symbols.append(None)
+
+        return row
+
+    def row(self, conid: str = None, symbol: str = None) -> Optional[int]:
+        """Returns the row of a conid or a symbol, or None if it isn't in the store."""
+
+        if conid is not None:
+            return self._conid_rows.get(str(conid))
+
+        return self._symbol_rows.get(symbol)
+
+    def symbol_to_conid(self, symbol: str) -> Optional[str]:
+        row = self._symbol_rows.get(symbol)
+        return self._conids[row] if row is not None else None
+
+    def conid_to_symbol(self, conid: str) -> Optional[str]:
+        row = self._conid_rows.get(str(conid))
+        return self._symbols[row] if row is not None else None
+
+    def update(self, conid: str, symbol: str = None, updated: int = None, **values: float) -> int:
+        """Writes the fields of a quote, the other fields keep their values.
+
+        Arguments:
+        ----
+        conid {str} -- The conid of the quote.
+
+        symbol {str} -- The symbol of the conid. (default: {None})
+
+        updated {int} -- The epoch ms of the quote. (default: {now})
+
+        values {float} -- The fields of the quote, any of `QUOTE_COLUMNS`. None values are skipped.
+
+        Returns:
+        ----
+        {int} -- The row of the conid.
+        """
+
+        conid = str(conid)
+
+        with self._lock:
+            row = self._conid_rows.get(conid)
+            if row is None:
+                row = self._add_row(conid=conid)
+
+            if symbol is not None and self._symbols[row] != symbol:
+                self._symbols[row] = symbol
+                self._symbol_rows[symbol] = row
+
+            for column, value in values.items():
+                if value is not None:
+                    self.columns[column][row] = value
+
+            self.updated[row] = updated if updated is not None else int(time.time() * 1000)
+
+        return row
+
+    def remove(self, conid: str) -> None:
+        """Clears the quote of a conid, its row is kept so the other rows don't move."""
+
+        conid = str(conid)
+        with self._lock:
+            row = self._conid_rows.get(conid)
+            if row is None:
+                return
+
+            for values in self.columns.values():
+                values[row] = np.nan
+            self.updated[row] = 0
+
+    def price(self, conid: str = None, symbol: str = None, field: str = 'last', max_age: float = None) -> Optional[float]:
+        """Reads one field of a quote.
+
+        Arguments:
+        ----
+        conid {str} -- The conid of the quote. (default: {None})
+
+        symbol {str} -- The symbol of the quote, used if no conid is given. (default: {None})
+
+        field {str} -- The field, any of `QUOTE_COLUMNS`. (default: {'last'})
+
+        max_age {float} -- The oldest quote in seconds that is returned, older quotes are stale. (default: {None})
+
+        Returns:
+        ----
+        {Optional[float]} -- The value, or None if the quote is missing, stale or doesn't have the field.
+        """
+
+        row = self.row(conid=conid, symbol=symbol)
+        if row is None:
+            return None
+
+        if max_age is not None and self.age(row=row) > max_age:
+            return None
+
+        value = self.columns[field][row]
+        return None if np.isnan(value) else float(value)
+
+    def prices(self, conids: List[str], field: str = 'last') -> np.ndarray:
+        """Reads one field of several quotes at once, NaN for the conids that are not in the store."""
+
+        rows = np.array([self._conid_rows.get(str(conid), -1) for conid in conids], dtype=np.int64)
+        values = self.columns[field][np.maximum(rows, 0)] if len(rows) else np.array([], dtype=np.float64)
+
+        return np.where(rows >= 0, values, np.nan)
+
+    def age(self, conid: str = None, symbol: str = None, row: int = None) -> float:
+        """Returns how old a quote is in seconds, infinite if it has never been updated."""
+
+        if row is None:
+            row = self.row(conid=conid, symbol=symbol)
+        if row is None or self.updated[row] == 0:
+            return float('inf')
+
+        return time.time() - self.updated[row] / 1000
+
+    def quote(self, conid: str = None, symbol: str = None) -> Optional[Dict]:
+        """Returns every field of a quote, or None if it isn't in the store."""
+
+        row = self.row(conid=conid, symbol=symbol)
+        if row is None:
+            return None
+
+        quote = {'conid': self._conids[row], 'symbol': self._symbols[row]}
+        for column, values in self.columns.items():
+            quote[column] = None if np.isnan(values[row]) else float(values[row])
+        quote['updated'] = int(self.updated[row]) if self.updated[row] else None
+
+        return quote
+
+
+class QuotePoller():
+
+    def __init__(self, session: IBClient, conids: List[str] = None, fields: Dict[str,str] = None, max_conids: int = 100,
+    max_conids_length: int = 1500, bar_builder: BarBuilder = None, quote_store: QuoteStore = None) -> None:
+        """Polls the market data snapshot endpoint for many conids, only asking for what has changed.
+
+        Overview:
+        ----
+        The poller keeps the time of the last update of every conid. Conids which have been seen
+        before are requested with `since`, so the gateway only returns the conids that have changed,
+        and conids seen for the first time are requested in full. The conids are packed into as few
+        requests as the gateway allows, split when a request would hold more than `max_conids`
+        conids or their joined list would be longer than `max_conids_length` characters. The
+        responses are merged into the QuoteStore, so a conid that hasn't changed keeps its quote.
+
+        Arguments:
+        ----
+        session {IBClient} -- The client the snapshots are requested with.
+
+        conids {List[str]} -- The conids to poll. (default: {None})
+
+        fields {Dict[str,str]} -- The snapshot fields to request, mapped to the column they are kept under,
+            '55' fills the symbol. (default: {SNAPSHOT_FIELDS})
+
+        max_conids {int} -- The most conids in one request. (default: {100})
+
+        max_conids_length {int} -- The longest joined list of conids in one request, which keeps the
+            URL under the length the gateway accepts. (default: {1500})
+
+        bar_builder {BarBuilder} -- Trades in the snapshots are added to it, so bars can be built from
+            polling as well as from streaming. (default: {None})
+
+        quote_store {QuoteStore} -- The store the quotes are merged into. (default: {QuoteStore()})
+
+        Usage:
+        ----
+            >>> quote_poller = QuotePoller(session=trader.session, conids=['265598','272093'])
+            >>> quote_poller.poll()
+            >>> quote_poller.quote_store.price(conid='265598')
+            133.11
+        """
+
+        self.session = session
+        self.fields = fields if fields is not None else SNAPSHOT_FIELDS
+        self.max_conids = max_conids
+        self.max_conids_length = max_conids_length
+        self.bar_builder = bar_builder
+        self.quote_store = quote_store if quote_store is not None else QuoteStore()
+
+        # The epoch ms every polled conid was last updated at
+        self.last_updated: Dict[str,int] = {}
+
+        self.requests = 0
+
+        self._conids: List[str] = []
+        self._polled = set()
+        for conid in conids or []:
+            self.add_conid(conid=conid)
+
+    @property
+    def conids(self) -> List[str]:
+        return list(self._conids)
+
+    def add_conid(self, conid: str) -> None:
+        """Starts polling a conid."""
+
+        conid = str(conid)
+        if conid not in self._polled:
+            self._conids.append(conid)
+            self._polled.add(conid)
+
+    def remove_conid(self, conid: str) -> None:
+        """Stops polling a conid."""
+
+        conid = str(conid)
+        if conid in self._polled:
+            self._conids.remove(conid)
+            self._polled.discard(conid)
+            self.last_updated.pop(conid, None)
+
+    def poll(self) -> List[str]:
+        """Requests the changes since the last poll and merges them into the QuoteStore.
+
+        Returns:
+        ----
+        {List[str]} -- The conids which have changed.
+        """
+
+        changed_conids = []
+
+        for conids, since in self._plan_requests():
+            self.requests += 1
+            snapshots = self.session.market_data(
+                conids=conids,
+                since=str(since) if since is not None else None,
+                fields=list(self.fields.keys())
+            )
+
+            for snapshot in snapshots or []:
+                conid = str(snapshot.get('conid', ''))
+                if conid not in self._polled:
+                    continue
+
+                if self._merge_snapshot(conid=conid, snapshot=snapshot):
+                    changed_conids.append(conid)
+
+        return changed_conids
+
+    def _plan_requests(self) -> List[tuple]:
+        """Packs the conids into requests, each with the `since` that covers every conid in it.
+
+        Conids which have never been updated are requested without `since`. The others are
+        sorted by their last update, so every request can use the oldest update of its conids
+        without asking for much more than each conid needs.
+        """
+
+        new_conids = [conid for conid in self._conids if conid not in self.last_updated]
+        known_conids = sorted(
+            (conid for conid in self._conids if conid in self.last_updated),
+            key=lambda conid: self.last_updated[conid]
+        )
+
+        requests = [(chunk, None) for chunk in self._chunk(conids=new_conids)]
+        requests += [(chunk, min(self.last_updated[conid] for conid in chunk)) for chunk in self._chunk(conids=known_conids)]
+
+        return requests
+
+    def _chunk(self, conids: List[str]) -> List[List[str]]:
+        """Splits the conids at the most conids and the longest joined list of one request."""
+
+        chunks = []
+        chunk = []
+        chunk_length = 0
+
+        for conid in conids:
+            # The conids are joined with commas
+            conid_length = len(conid) + (1 if chunk else 0)
+            if chunk and (len(chunk) >= self.max_conids or chunk_length + conid_length > self.max_conids_length):
+                chunks.append(chunk)
+                chunk = []
+                chunk_length = 0
+                conid_length = len(conid)
+
+            chunk.append(conid)
+            chunk_length += conid_length
+
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    def _merge_snapshot(self, conid: str, snapshot: Dict) -> bool:
+        """Merges the fields of a snapshot into the quote of a conid, returns False if it holds no new field."""
+
+        symbol = None
+        values = {}
+
+        for field, name in self.fields.items():
+            if field not in snapshot:
+                continue
+
+            if field == '55':
+                symbol = snapshot[field]
+            else:
+                values[name] = parse_field(snapshot[field])
+
+        if symbol is None and not values:
+            # The first snapshot of a conid can come back empty while the gateway subscribes to it,
+            # so the conid is requested in full again until its fields arrive
+            return False
+
+        updated = snapshot.get('_updated')
+        if updated is not None:
+            updated = int(updated)
+            self.last_updated[conid] = max(updated, self.last_updated.get(conid, updated))
+
+        self.quote_store.update(conid=conid, symbol=symbol, updated=updated, **values)
+
+        # A snapshot with a last price and size is a trade
+        symbol = self.quote_store.conid_to_symbol(conid=conid)
+        if self.bar_builder is not None and values.get('last') is not None and symbol is not None and updated is not None:
+            size = values.get('last_size') or 0.0
+            self.bar_builder.add_tick(conid=conid, symbol=symbol, price=values['last'], size=size, timestamp=updated)
+
+        return True
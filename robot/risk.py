@@ -0,0 +1,295 @@
+import time
+import collections
+
+from typing import List
+from typing import Callable
+from typing import Optional
+
+import robot.quotes as quotes
+import robot.portfolio as portfolio
+
+
+class RiskLimits():
+
+    def __init__(self, max_position_quantity: float = None, max_symbol_notional: float = None,
+    max_bar_notional: float = None, max_orders: int = None, order_rate_window: float = 1.0,
+    price_band: float = None, check_cash: bool = True) -> None:
+        """The limits every order is checked against before it is sent, None turns a check off.
+
+        Arguments:
+        ----
+        max_position_quantity {float} -- The largest quantity held in a symbol after the order. (default: {None})
+
+        max_symbol_notional {float} -- The largest value held in a symbol after the order. (default: {None})
+
+        max_bar_notional {float} -- The largest value of the orders sent within one bar. (default: {None})
+
+        max_orders {int} -- The most orders sent within `order_rate_window` seconds. (default: {None})
+
+        order_rate_window {float} -- The window of the order rate in seconds. (default: {1.0})
+
+        price_band {float} -- The largest distance of a limit price from the last price, as a fraction of
+            the last price, e.g. 0.05 for 5%. (default: {None})
+
+        check_cash {bool} -- Check the value of a buy against the available cash. (default: {True})
+        """
+
+        self.max_position_quantity = max_position_quantity
+        self.max_symbol_notional = max_symbol_notional
+        self.max_bar_notional = max_bar_notional
+        self.max_orders = max_orders
+        self.order_rate_window = order_rate_window
+        self.price_band = price_band
+        self.check_cash = check_cash
+
+
+class RiskDecision():
+
+    def __init__(self, approved: bool, reasons: List[str] = None, clear_pass: bool = False, notional: float = None) -> None:
+        """The result of the pre-trade checks of an order.
+
+        Arguments:
+        ----
+        approved {bool} -- The order is within every limit.
+
+        reasons {List[str]} -- Why the order was rejected, or why it doesn't clearly pass. (default: {None})
+
+        clear_pass {bool} -- The order is well within every limit and its price is known, so it doesn't
+            need a preview from the gateway. (default: {False})
+
+        notional {float} -- The value of the order, None if there is no price for it. (default: {None})
+        """
+
+        self.approved = approved
+        self.reasons = reasons or []
+        self.clear_pass = clear_pass
+        self.notional = notional
+
+    def __bool__(self) -> bool:
+        return self.approved
+
+    def __repr__(self) -> str:
+        return 'RiskDecision(approved={approved}, clear_pass={clear_pass}, reasons={reasons})'.format(
+            approved=self.approved,
+            clear_pass=self.clear_pass,
+            reasons=self.reasons
+        )
+
+
+class RiskBatch():
+
+    def __init__(self) -> None:
+        """The orders of a batch which have been approved but not placed yet.
+
+        Overview:
+        ----
+        The orders of a batch are only recorded with `PreTradeRiskChecker.record_order()` once they
+        are placed, so an order which fails its preview doesn't use up the limits. Until then, the
+        batch keeps a running total of them, so every order is still checked against the ones
+        approved before it.
+        """
+
+        self.orders = 0
+        self.notional = 0.0
+        self.cash = 0.0
+        self.quantities = {}
+
+    def add(self, symbol: str, side: str, quantity: float, notional: float = None) -> None:
+        """Adds an approved order to the running total."""
+
+        self.orders += 1
+        self.quantities[symbol] = self.quantities.get(symbol, 0.0) + (quantity if side == 'BUY' else -quantity)
+        if notional is not None:
+            self.notional += notional
+            self.cash += notional if side == 'BUY' else -notional
+
+
+class PreTradeRiskChecker():
+
+    def __init__(self, portfolio: portfolio.Portfolio, limits: RiskLimits = None, quote_store: quotes.QuoteStore = None,
+    available_cash: float = None, bar_seconds: float = 60.0, clear_pass_margin: float = 0.5,
+    clock: Callable[[], float] = time.time) -> None:
+        """Checks orders against local risk limits before they are sent to the gateway.
+
+        Overview:
+        ----
+        Every check reads the in-memory Portfolio and QuoteStore, so checking an order takes
+        microseconds rather than a `place_order_scenario` round trip. An order which uses less than
+        `clear_pass_margin` of every limit, and whose price is known, is a clear pass and doesn't
+        need a preview. Orders are only counted towards the order rate and the bar notional once
+        they are recorded with `record_order()`. The Trader records an order once it is placed,
+        and checks the orders of a batch against each other with a RiskBatch.
+
+        Arguments:
+        ----
+        portfolio {portfolio.Portfolio} -- The portfolio the positions are read from.
+
+        limits {RiskLimits} -- The limits. (default: {RiskLimits()})
+
+        quote_store {QuoteStore} -- The last prices market orders are valued at. (default: {the quote store of the portfolio})
+
+        available_cash {float} -- The cash available for buys, None skips the cash check. (default: {None})
+
+        bar_seconds {float} -- The length of a bar in seconds, for the notional per bar. (default: {60.0})
+
+        clear_pass_margin {float} -- The share of every limit an order may use and still be a clear pass. (default: {0.5})
+
+        clock {Callable[[], float]} -- Returns the current epoch time in seconds. (default: {time.time})
+
+        Usage:
+        ----
+            >>> risk_checker = PreTradeRiskChecker(
+                portfolio=trader_portfolio,
+                limits=RiskLimits(max_symbol_notional=10000, max_orders=5, price_band=0.05),
+                available_cash=25000
+            )
+            >>> risk_decision = risk_checker.check(symbol='AAPL', side='BUY', quantity=10)
+            >>> risk_decision.approved, risk_decision.clear_pass
+            (True, True)
+        """
+
+        self.portfolio = portfolio
+        self.limits = limits if limits is not None else RiskLimits()
+        self.quote_store = quote_store if quote_store is not None else portfolio.quote_store
+        self.available_cash = available_cash
+        self.bar_seconds = bar_seconds
+        self.clear_pass_margin = clear_pass_margin
+        self.clock = clock
+
+        self.rejected = 0
+
+        self._order_times = collections.deque()
+        self._bar_start: Optional[float] = None
+        self._bar_notional = 0.0
+
+    def check(self, symbol: str, side: str, quantity: float, price: float = None, conid: str = None, batch: RiskBatch = None) -> RiskDecision:
+        """Checks an order against every limit.
+
+        Arguments:
+        ----
+        symbol {str} -- The symbol of the order.
+
+        side {str} -- 'BUY' or 'SELL'.
+
+        quantity {float} -- The quantity of the order.
+
+        price {float} -- The limit price, None for a market order. (default: {None})
+
+        conid {str} -- The conid of the symbol, used to find its last price. (default: {None})
+
+        batch {RiskBatch} -- The orders approved before this one which haven't been placed yet. (default: {None})
+
+        Returns:
+        ----
+        {RiskDecision} -- Whether the order is approved and whether it clearly passes.
+        """
+
+        limits = self.limits
+        reasons = []
+        usage = 0.0
+
+        now = self.clock()
+        signed_quantity = quantity if side == 'BUY' else -quantity
+        position_quantity = self.portfolio.positions[symbol]['quantity'] if self.portfolio.in_portfolio(symbol=symbol) else 0.0
+        if batch is not None:
+            position_quantity += batch.quantities.get(symbol, 0.0)
+        quantity_after = position_quantity + signed_quantity
+
+        last_price = self._last_price(symbol=symbol, conid=conid)
+        order_price = price if price is not None else last_price
+        notional = abs(quantity) * order_price if order_price is not None else None
+
+        if limits.max_position_quantity is not None:
+            usage = max(usage, abs(quantity_after) / limits.max_position_quantity)
+            if abs(quantity_after) > limits.max_position_quantity:
+                reasons.append('The position of {quantity} would exceed the maximum quantity of {limit}.'.format(
+                    quantity=quantity_after, limit=limits.max_position_quantity))
+
+        if limits.max_symbol_notional is not None and order_price is not None:
+            symbol_notional = abs(quantity_after) * order_price
+            usage = max(usage, symbol_notional / limits.max_symbol_notional)
+            if symbol_notional > limits.max_symbol_notional:
+                reasons.append('The position value of {notional:.2f} would exceed the maximum of {limit}.'.format(
+                    notional=symbol_notional, limit=limits.max_symbol_notional))
+
+        if limits.max_bar_notional is not None and notional is not None:
+            bar_notional = self._current_bar_notional(now=now) + notional + (batch.notional if batch is not None else 0.0)
+            usage = max(usage, bar_notional / limits.max_bar_notional)
+            if bar_notional > limits.max_bar_notional:
+                reasons.append('The orders of this bar would be worth {notional:.2f}, more than the maximum of {limit}.'.format(
+                    notional=bar_notional, limit=limits.max_bar_notional))
+
+        if limits.max_orders is not None:
+            recent_orders = self._recent_orders(now=now) + 1 + (batch.orders if batch is not None else 0)
+            usage = max(usage, recent_orders / limits.max_orders)
+            if recent_orders > limits.max_orders:
+                reasons.append('More than {limit} orders within {window} seconds.'.format(
+                    limit=limits.max_orders, window=limits.order_rate_window))
+
+        if limits.price_band is not None and price is not None and last_price is not None:
+            distance = abs(price - last_price) / last_price
+            usage = max(usage, distance / limits.price_band)
+            if distance > limits.price_band:
+                reasons.append('The price {price} is {distance:.1%} away from the last price {last_price}.'.format(
+                    price=price, distance=distance, last_price=last_price))
+
+        if limits.check_cash and self.available_cash is not None and side == 'BUY' and notional is not None:
+            available_cash = self.available_cash - (batch.cash if batch is not None else 0.0)
+            usage = max(usage, notional / available_cash if available_cash > 0 else float('inf'))
+            if notional > available_cash:
+                reasons.append('The order is worth {notional:.2f}, more than the available cash of {cash:.2f}.'.format(
+                    notional=notional, cash=available_cash))
+
+        if reasons:
+            self.rejected += 1
+            return RiskDecision(approved=False, reasons=reasons, notional=notional)
+
+        if order_price is None:
+            return RiskDecision(approved=True, reasons=['There is no price to value the order at.'])
+
+        return RiskDecision(approved=True, clear_pass=usage <= self.clear_pass_margin, notional=notional)
+
+    def record_order(self, symbol: str, side: str, quantity: float, price: float = None, conid: str = None) -> None:
+        """Counts an order towards the order rate and the notional of the bar, and takes a buy off the cash."""
+
+        now = self.clock()
+        self._recent_orders(now=now)
+        self._order_times.append(now)
+
+        order_price = price if price is not None else self._last_price(symbol=symbol, conid=conid)
+        if order_price is None:
+            return
+
+        notional = abs(quantity) * order_price
+        self._bar_notional = self._current_bar_notional(now=now) + notional
+        if self.available_cash is not None:
+            self.available_cash += -notional if side == 'BUY' else notional
+
+    def _last_price(self, symbol: str, conid: str = None) -> Optional[float]:
+        if self.quote_store is None:
+            return None
+
+        if conid is not None:
+            last_price = self.quote_store.price(conid=conid)
+            if last_price is not None:
+                return last_price
+
+        return self.quote_store.price(symbol=symbol)
+
+    def _recent_orders(self, now: float) -> int:
+        """Drops the orders older than the rate window and returns the number left."""
+
+        while self._order_times and self._order_times[0] <= now - self.limits.order_rate_window:
+            self._order_times.popleft()
+
+        return len(self._order_times)
+
+    def _current_bar_notional(self, now: float) -> float:
+        """Returns the notional of the current bar, starting a new bar once the last one is over."""
+
+        bar_start = now - now % self.bar_seconds
+        if bar_start != self._bar_start:
+            self._bar_start = bar_start
+            self._bar_notional = 0.0
+
+        return self._bar_notional
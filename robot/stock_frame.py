@@ -1,61 +1,383 @@
+import pathlib
+import operator
+
 from datetime import datetime, time, timezone
 
 from typing import List
 from typing import Dict
 from typing import Union
+from typing import Optional
+from typing import Callable
 
 import numpy as np
 import pandas as pd
 from pandas.core.groupby import DataFrameGroupBy
 from pandas.core.window import RollingGroupby
 
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    # pyarrow is only needed to save and load the StockFrame store
+    pa = None
+
+# The bar sizes a StockFrame can hold, mapped to the width of each bar
+TIMEFRAMES = {
+    '1min': pd.Timedelta(minutes=1),
+    '5min': pd.Timedelta(minutes=5),
+    '15min': pd.Timedelta(minutes=15),
+    '1h': pd.Timedelta(hours=1),
+    '1d': pd.Timedelta(days=1)
+}
+
+# The file extension used for each format of the StockFrame store
+STORE_FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow'
+}
+
+# How each price column is combined when base bars are rolled up into a larger bar
+OHLCV_AGGREGATION = {
+    'open': 'first',
+    'close': 'last',
+    'high': 'max',
+    'low': 'min',
+    'volume': 'sum'
+}
+
+# The keys of a candle from the market data history endpoint, mapped to the column they fill
+CANDLE_KEYS = {
+    'datetime': 't',
+    'open': 'o',
+    'close': 'c',
+    'high': 'h',
+    'low': 'l',
+    'volume': 'v'
+}
+
+
+def candle_columns(candles: List[Dict]) -> Dict[str,np.ndarray]:
+    """Reads the candles of a market data history response straight into NumPy columns.
+    Arguments:
+    ----
+    candles {List[Dict]} -- The 'data' of a `market_data_history()` response.
+    Returns:
+    ----
+    {Dict[str,np.ndarray]} -- The epoch ms of the bars under 'datetime' and one float64 column
+        for each of the prices and the volume.
+    Usage:
+    ----
+        >>> historical_prices = ib_client.market_data_history(conid='265598', period='1d', bar='1min')
+        >>> columns = candle_columns(candles=historical_prices['data'])
+        >>> columns['close']
+        array([133.11, 133.2 , 133.07, ...])
+    """
+    bar_count = len(candles)
+    return {
+        column: np.fromiter(
+            map(operator.itemgetter(key), candles),
+            dtype=np.int64 if column == 'datetime' else np.float64,
+            count=bar_count
+        )
+        for column, key in CANDLE_KEYS.items()
+    }
+
 
 class StockFrame():
 
-    def __init__(self, data: List[Dict]) -> None:
+    def __init__(self, data: Union[List[Dict],Dict[str,np.ndarray],pd.DataFrame], timeframe: str = '1min', compact: bool = False,
+    price_tolerance: float = 1e-4) -> None:
         """Initalizes the Stock Data Frame Object.
         Arguments:
         ----
-        data {List[Dict]} -- The data to convert to a frame. Normally, this is 
-            returned from the historical prices endpoint.
+        data {Union[List[Dict],Dict[str,np.ndarray],pd.DataFrame]} -- The data to convert to a frame. Normally, this is 
+            returned from the historical prices endpoint, either as a list of quotes or as columns keyed
+            by 'symbol', 'datetime' and the price names, see `from_columns()`. A frame which is already
+            indexed by `symbol` and `datetime` can also be passed through.
+
+        timeframe {str} -- The bar size of the data, can be one of the following:
+            ['1min','5min','15min','1h','1d']. Default is '1min'.
+
+        compact {bool} -- Store the bars with compact dtypes, i.e. float32 prices where precision allows
+            and int64 volume. The index is built straight from the symbol codes and the epoch timestamps.
+            Default is False.
+
+        price_tolerance {float} -- Only used when `compact` is True. A price column is stored as float32
+            if no price moves by more than this amount when converted. Default is 1e-4.
         """
+        if timeframe not in TIMEFRAMES:
+            raise ValueError("Timeframe {timeframe} is not supported, use one of {supported}.".format(
+                timeframe=timeframe,
+                supported=list(TIMEFRAMES.keys())
+            ))
+
+        self.timeframe = timeframe
+        self.compact = compact
+        self.price_tolerance = price_tolerance
         self._data = data
         self._frame: pd.DataFrame = self.create_frame()
         self._symbol_groups: DataFrameGroupBy = None
         self._symbol_rolling_groups: RollingGroupby = None
+        self._symbol_slices: Dict[str,slice] = None
+
+        # Derived StockFrames which are aggregated from the bars in this frame, keyed by timeframe
+        self._timeframes: Dict[str,StockFrame] = {}
+
+        # The retention policy, see set_retention(), and the number of bars every indicator needs to look back on
+        self._max_bars: Optional[int] = None
+        self._max_age: Optional[pd.Timedelta] = None
+        self._trim_batch: int = 1
+        self._lookbacks: Dict[str,Optional[int]] = {}
+
+        # Called with the bars about to be trimmed, see add_trim_listener()
+        self._trim_listeners: List[Callable[[pd.DataFrame], None]] = []
 
     @property
     def frame(self) -> pd.DataFrame:
         return self._frame
+
+    @property
+    def timeframes(self) -> List[str]:
+        """Returns the timeframes available from this StockFrame, including its own."""
+        return [self.timeframe] + list(self._timeframes.keys())
     
     @property
     def symbol_groups(self) -> DataFrameGroupBy:
-        self._symbol_groups = self._frame.groupby(
-            by='symbol',
-            as_index=False,
-            sort=True
-        )
+        #The groups are cached until the rows of the frame change, see _invalidate_groups()
+        if self._symbol_groups is None:
+            self._symbol_groups = self._frame.groupby(
+                by='symbol',
+                as_index=False,
+                sort=True
+            )
 
         return self._symbol_groups
 
     def symbol_rolling_groups(self,size:int) -> RollingGroupby:
         #"size specifies the window size"
-        
-        if not self._symbol_groups:     #if there is no _symbol_groups object
-            self.symbol_groups
-
-        self._symbol_rolling_groups = self._symbol_groups.rolling(size)
+        self._symbol_rolling_groups = self.symbol_groups.rolling(size)
         
         return self._symbol_rolling_groups
 
+    @property
+    def symbol_slices(self) -> Dict[str,slice]:
+        """Returns the position of the rows of every symbol in the frame.
+        Overview:
+        ----
+        The frame is sorted by symbol, so the rows of a symbol are next to each other. The
+        table is built once from the integer codes of the index and cached until the rows
+        of the frame change, so grabbing the rows of a symbol doesn't need a new grouping.
+        Returns:
+        ----
+        {Dict[str,slice]} -- The symbols mapped to the slice of their rows, which can be passed to `frame.iloc`.
+        """
+        if self._symbol_slices is None:
+            symbol_codes = self._frame.index.codes[0]
+            group_starts = np.flatnonzero(np.diff(symbol_codes, prepend=-1))
+            group_ends = np.append(group_starts[1:], len(symbol_codes))
+            symbols = self._frame.index.levels[0][symbol_codes[group_starts]]
+
+            self._symbol_slices = {
+                symbol: slice(int(start), int(end)) for symbol, start, end in zip(symbols, group_starts, group_ends)
+            }
+
+        return self._symbol_slices
+
+    def get_symbol_frame(self, symbol: str) -> pd.DataFrame:
+        """Returns the rows of a symbol, keeping the `symbol` level of the index.
+        Raises:
+        ----
+        KeyError: If the symbol is not in the frame.
+        """
+        return self._frame.iloc[self.symbol_slices[symbol]]
+
+    @property
+    def last_rows(self) -> pd.DataFrame:
+        """Returns the last row of every symbol in the frame."""
+        last_positions = [symbol_slice.stop - 1 for symbol_slice in self.symbol_slices.values()]
+        return self._frame.iloc[last_positions]
+
+    def _invalidate_groups(self) -> None:
+        """Clears the cached groups, called every time rows are added to or dropped from the frame."""
+        self._symbol_groups = None
+        self._symbol_rolling_groups = None
+        self._symbol_slices = None
+
     def create_frame(self) -> pd.DataFrame:             #Initialise dataframe
-        #Create a dataframe
-        price_df  = pd.DataFrame(data=self._data)
-        price_df = self._parse_datatime_column(price_df=price_df)       #Take timestamp column of every row, make it a pandas
-        price_df = self._set_multi_index(price_df=price_df)
+        #A frame that has already been built, e.g. an aggregated timeframe, only needs to be sorted.
+        #A sorted one is only copied shallowly, so its price columns aren't duplicated
+        if isinstance(self._data, pd.DataFrame):
+            if self._data.index.is_monotonic_increasing:
+                price_df = self._data.copy(deep=False)
+            else:
+                price_df = self._data.sort_index()
+        elif self.compact or isinstance(self._data, dict):
+            price_df = self._create_columnar_frame()
+        else:
+            #Create a dataframe
+            price_df  = pd.DataFrame(data=self._data)
+            price_df = self._parse_datatime_column(price_df=price_df)       #Take timestamp column of every row, make it a pandas
+            price_df = self._set_multi_index(price_df=price_df)
+            price_df = price_df.sort_index()
+
+        if self.compact:
+            self._compact_dtypes(price_df=price_df)
+
+        return price_df
+
+    def _create_columnar_frame(self) -> pd.DataFrame:
+        """Builds the frame column by column instead of going through a frame of objects.
+        The symbols are integer coded and the datetime level is built straight from the epoch ms.
+        """
+        column_names = list(OHLCV_AGGREGATION.keys())
+
+        if isinstance(self._data, dict):
+            symbols = self._data['symbol']
+            epochs = self._data['datetime']
+            columns = {column: self._data[column] for column in column_names}
+        else:
+            bar_count = len(self._data)
+            symbols = np.array([quote['symbol'] for quote in self._data], dtype=object)
+            epochs = np.fromiter((quote['datetime'] for quote in self._data), dtype=np.int64, count=bar_count)
+            columns = {
+                column: np.fromiter((quote[column] for quote in self._data), dtype=np.float64, count=bar_count)
+                for column in column_names
+            }
+
+        return self._columns_to_frame(symbols=symbols, epochs=epochs, columns=columns)
+
+    @staticmethod
+    def _columns_to_frame(symbols: Union[str,np.ndarray], epochs: np.ndarray, columns: Dict[str,np.ndarray]) -> pd.DataFrame:
+        """Builds a frame sorted by `symbol` and `datetime` straight from the columns.
+        The index is built from codes into sorted levels, so the columns are only copied again
+        if the bars are out of order.
+        """
+        epochs = np.asarray(epochs, dtype=np.int64)
+        columns = {column: np.asarray(values, dtype=np.float64) for column, values in columns.items()}
+        bar_count = len(epochs)
+
+        if np.ndim(symbols) == 0:
+            #A single symbol, so every bar has the same code
+            symbol_codes = np.zeros(bar_count, dtype=np.int8)
+            symbol_level = [symbols]
+        else:
+            symbol_codes, symbol_level = pd.factorize(np.asarray(symbols, dtype=object), sort=True)
+
+        #History responses come back in time order, which saves hashing the timestamps
+        if len(symbol_level) == 1 and np.all(epochs[1:] > epochs[:-1]):
+            datetime_codes = np.arange(bar_count)
+            unique_epochs = epochs
+        else:
+            datetime_codes, unique_epochs = pd.factorize(epochs, sort=True)
+
+        #Put the bars in index order if they aren't already
+        sort_keys = symbol_codes.astype(np.int64) * len(unique_epochs) + datetime_codes
+        if np.any(sort_keys[1:] < sort_keys[:-1]):
+            order = np.argsort(sort_keys, kind='stable')
+            symbol_codes = symbol_codes[order]
+            datetime_codes = datetime_codes[order]
+            columns = {column: values[order] for column, values in columns.items()}
+
+        multi_index = pd.MultiIndex(
+            levels=[pd.Index(symbol_level), pd.to_datetime(unique_epochs, unit='ms', origin='unix')],
+            codes=[symbol_codes, datetime_codes],
+            names=['symbol','datetime'],
+            verify_integrity=False
+        )
+
+        return pd.DataFrame(data=columns, index=multi_index, copy=False)
+
+    @classmethod
+    def from_columns(cls, symbol: Union[str,np.ndarray], t: np.ndarray, o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray,
+    v: np.ndarray, timeframe: str = '1min', compact: bool = False) -> 'StockFrame':
+        """Creates a StockFrame straight from columns of bars, without going through a dict per bar.
+        Arguments:
+        ----
+        symbol {Union[str,np.ndarray]} -- The symbol of all the bars, or an array with the symbol of every bar.
+
+        t {np.ndarray} -- The epoch ms of the bars.
+
+        o {np.ndarray} -- The open prices.
+
+        h {np.ndarray} -- The high prices.
+
+        l {np.ndarray} -- The low prices.
+
+        c {np.ndarray} -- The close prices.
+
+        v {np.ndarray} -- The volumes.
+
+        timeframe {str} -- The bar size of the data. Default is '1min'.
+
+        compact {bool} -- Store the bars with compact dtypes, see `StockFrame()`. Default is False.
+        Returns:
+        ----
+        StockFrame -- The StockFrame holding the bars.
+        Usage:
+        ----
+            >>> historical_prices = ib_client.market_data_history(conid='265598', period='1d', bar='1min')
+            >>> columns = candle_columns(candles=historical_prices['data'])
+            >>> stock_frame = StockFrame.from_columns(
+                symbol=historical_prices['symbol'],
+                t=columns['datetime'],
+                o=columns['open'],
+                h=columns['high'],
+                l=columns['low'],
+                c=columns['close'],
+                v=columns['volume']
+            )
+        """
+        columns = {
+            'symbol': symbol,
+            'datetime': t,
+            'open': o,
+            'close': c,
+            'high': h,
+            'low': l,
+            'volume': v
+        }
+
+        return cls(data=columns, timeframe=timeframe, compact=compact)
+
+    def _compact_dtypes(self, price_df: pd.DataFrame) -> pd.DataFrame:
+        """Converts the price columns to float32 where precision allows and the volume to int64, in place."""
+        for column in ['open','close','high','low']:
+            if column not in price_df.columns or price_df[column].dtype == np.float32:
+                continue
+
+            prices = price_df[column].to_numpy(dtype=np.float64)
+            compact_prices = prices.astype(np.float32)
+
+            #Keep float64 if any price would move by more than the tolerance, e.g. large prices with many decimals
+            price_error = np.abs(compact_prices.astype(np.float64) - prices)
+            if not np.any(price_error > self.price_tolerance):
+                price_df[column] = compact_prices
+
+        if 'volume' in price_df.columns and price_df['volume'].dtype != np.int64:
+            volume = price_df['volume'].to_numpy(dtype=np.float64)
+
+            #Volume can only be stored as an integer if it is whole and there are no gaps
+            if np.isfinite(volume).all() and (volume == np.round(volume)).all():
+                price_df['volume'] = volume.astype(np.int64)
 
         return price_df
 
+    def memory_usage(self) -> Dict:
+        """Reports the memory used by the StockFrame, including its index.
+        Returns:
+        ----
+        {dict} -- A dictionary with keys 'total_bytes', 'bars' and 'bytes_per_bar'.
+        """
+        total_bytes = int(self._frame.memory_usage(index=True, deep=True).sum())
+        bars = len(self._frame)
+
+        return {
+            'total_bytes': total_bytes,
+            'bars': bars,
+            'bytes_per_bar': total_bytes / bars if bars else 0.0
+        }
+
     def _parse_datatime_column(self,price_df:pd.DataFrame) -> pd.DataFrame:
         price_df['datetime'] = pd.to_datetime(price_df['datetime'], unit = 'ms', origin = 'unix')       #Parse unix epoch timestamp to date time
         return price_df
@@ -89,6 +411,9 @@ class StockFrame():
         """
         column_names = ['open','close','high','low','volume']       #Headers of the columns in stock dataframe
 
+        #Keep track of the bars that have been added so the derived timeframes can be updated
+        new_bars = []
+
         for quote in data:
             #Parse the timestamp
             time_stamp = pd.to_datetime(
@@ -117,6 +442,376 @@ class StockFrame():
             self.frame.loc[row_id,column_names] = new_row.values
             self.frame.sort_index(inplace=True)
 
+            new_bars.append(row_id)
+
+        self._invalidate_groups()
+
+        #Adding rows widens the dtypes of the columns, so bring them back to the compact dtypes
+        if self.compact:
+            self._compact_dtypes(price_df=self._frame)
+
+        #Roll the new bars into every derived timeframe
+        if self._timeframes:
+            self._update_timeframes(new_bars=new_bars)
+
+        #Drop the bars which are outside of the retention policy
+        self.trim()
+
+    def set_retention(self, max_bars: Optional[int] = None, max_age: Optional[Union[str,pd.Timedelta]] = None, trim_batch: int = 100) -> None:
+        """Sets how much history the StockFrame keeps for every symbol.
+        Overview:
+        ----
+        Without a retention policy, the StockFrame grows every time `add_rows()` is called, so
+        refreshing the indicators gets slower the longer the bot runs. With a policy, the oldest
+        bars are dropped in batches, but never the bars that the registered indicators need to
+        look back on, so trimming never changes the latest value of an indicator. The indicators
+        based on exponentially weighted means (rsi, ema, macd) carry the weighted sums of the
+        trimmed bars over, so every value they keep is the one over the whole history, up to
+        floating point rounding. Columns which need every bar, e.g. vwap, stop the trimming.
+        Arguments:
+        ----
+        max_bars {Optional[int]} -- The number of bars to keep for every symbol. (default: {None})
+
+        max_age {Optional[Union[str,pd.Timedelta]]} -- The age of the oldest bar to keep, measured from the
+            latest bar of the symbol, e.g. '5d'. (default: {None})
+
+        trim_batch {int} -- The bars are only dropped once at least this many can be dropped, so
+            the frame isn't rebuilt on every new bar. (default: {100})
+        Usage:
+        ----
+            >>> stock_frame.set_retention(max_bars=2000, trim_batch=500)
+        """
+        if max_bars is not None and max_bars < 1:
+            raise ValueError("max_bars must be at least 1.")
+
+        self._max_bars = max_bars
+        self._max_age = pd.Timedelta(max_age) if max_age is not None else None
+        self._trim_batch = max(int(trim_batch), 1)
+
+    def register_lookback(self, column_name: str, lookback: Optional[int]) -> None:
+        """Registers the number of bars a column needs to look back on to be calculated.
+        Arguments:
+        ----
+        column_name {str} -- The name of the indicator column.
+
+        lookback {Optional[int]} -- The number of bars, or None if the column depends on the whole history.
+        """
+        self._lookbacks[column_name] = lookback
+
+    def add_trim_listener(self, listener: Callable[[pd.DataFrame], None]) -> None:
+        """Hands the bars about to be dropped by `trim()` to a listener, e.g. to carry the state
+        of an indicator over to the bars which are kept.
+        Arguments:
+        ----
+        listener {Callable[[pd.DataFrame], None]} -- Called with the rows of the bars, oldest first.
+        """
+        self._trim_listeners.append(listener)
+
+    @property
+    def required_lookback(self) -> Optional[int]:
+        """Returns the number of bars every symbol has to keep for the registered columns, None if
+        a column depends on the whole history."""
+        if any(lookback is None for lookback in self._lookbacks.values()):
+            return None
+
+        return max(self._lookbacks.values(), default=1)
+
+    def trim(self, force: bool = False) -> int:
+        """Drops the bars which are outside of the retention policy set by `set_retention()`.
+        Arguments:
+        ----
+        force {bool} -- Drop the bars even if there are fewer than `trim_batch` of them. (default: {False})
+        Returns:
+        ----
+        {int} -- The number of bars that have been dropped.
+        """
+        if self._max_bars is None and self._max_age is None:
+            return 0
+
+        #A column that depends on the whole history, e.g. 'vwap', can't be trimmed without changing it
+        required_lookback = self.required_lookback
+        if required_lookback is None or self._frame.empty:
+            return 0
+
+        #The position of the last row of the symbol, for every row
+        symbol_slices = list(self.symbol_slices.values())
+        row_group_end = np.repeat(
+            [symbol_slice.stop - 1 for symbol_slice in symbol_slices],
+            [symbol_slice.stop - symbol_slice.start for symbol_slice in symbol_slices]
+        )
+
+        #How many bars of the same symbol come after every row
+        bars_after = row_group_end - np.arange(len(self._frame))
+
+        drop_mask = np.zeros(len(self._frame), dtype=bool)
+
+        if self._max_bars is not None:
+            drop_mask |= bars_after >= max(self._max_bars, required_lookback)
+
+        if self._max_age is not None:
+            time_stamps = self._frame.index.get_level_values('datetime').to_numpy()
+            cutoff = time_stamps[row_group_end] - self._max_age.to_timedelta64()
+            drop_mask |= (time_stamps < cutoff) & (bars_after >= required_lookback)
+
+        drop_count = int(drop_mask.sum())
+        if drop_count == 0 or (drop_count < self._trim_batch and not force):
+            return 0
+
+        trimmed_df = self._frame[drop_mask]
+        for listener in self._trim_listeners:
+            listener(trimmed_df)
+
+        #Drop in place, so the objects holding the frame, e.g. Indicators, keep seeing the same frame
+        self._frame.drop(index=self._frame.index[drop_mask], inplace=True)
+        self._invalidate_groups()
+
+        return drop_count
+
+    def add_timeframe(self, timeframe: str) -> 'StockFrame':
+        """Adds a derived timeframe which is aggregated from the bars in this StockFrame.
+        Overview:
+        ----
+        The derived StockFrame is built once from the existing bars and from then on,
+        it is kept up to date incrementally every time `add_rows()` is called on this
+        StockFrame, so only one set of bars has to be requested from IB. The derived
+        StockFrame can be passed to an `Indicators` object like any other StockFrame.
+        Arguments:
+        ----
+        timeframe {str} -- The bar size to aggregate to, can be one of the following:
+            ['1min','5min','15min','1h','1d']. It must be a multiple of this StockFrame's timeframe.
+        Returns:
+        ----
+        StockFrame -- The StockFrame holding the aggregated bars.
+        Usage:
+        ----
+            >>> stock_frame = trader.create_stock_frame(data=historical_prices['aggregated'])
+            >>> stock_frame_5min = stock_frame.add_timeframe(timeframe='5min')
+            >>> indicator_client_5min = Indicators(price_df=stock_frame_5min)
+        """
+        if timeframe == self.timeframe:
+            return self
+
+        if timeframe in self._timeframes:
+            return self._timeframes[timeframe]
+
+        if timeframe not in TIMEFRAMES:
+            raise ValueError("Timeframe {timeframe} is not supported, use one of {supported}.".format(
+                timeframe=timeframe,
+                supported=list(TIMEFRAMES.keys())
+            ))
+
+        #A bar can only be built from whole base bars
+        if TIMEFRAMES[timeframe] % TIMEFRAMES[self.timeframe] != pd.Timedelta(0):
+            raise ValueError("Timeframe {timeframe} can't be built from {base} bars.".format(
+                timeframe=timeframe,
+                base=self.timeframe
+            ))
+
+        #The current bar of the timeframe is rebuilt from the base bars, so they have to be kept
+        self.register_lookback(
+            column_name='timeframe_' + timeframe,
+            lookback=int(TIMEFRAMES[timeframe] / TIMEFRAMES[self.timeframe])
+        )
+
+        aggregated_df = self._aggregate_bars(price_df=self._frame, timeframe=timeframe)
+        self._timeframes[timeframe] = StockFrame(
+            data=aggregated_df,
+            timeframe=timeframe,
+            compact=self.compact,
+            price_tolerance=self.price_tolerance
+        )
+
+        return self._timeframes[timeframe]
+
+    def get_timeframe(self, timeframe: str) -> 'StockFrame':
+        """Returns the StockFrame holding the bars of a timeframe.
+        Arguments:
+        ----
+        timeframe {str} -- The bar size, e.g. '5min'.
+        Raises:
+        ----
+        KeyError: If the timeframe has not been added with `add_timeframe()`.
+        Returns:
+        ----
+        StockFrame -- The StockFrame holding the bars of the timeframe.
+        """
+        if timeframe == self.timeframe:
+            return self
+        elif timeframe in self._timeframes:
+            return self._timeframes[timeframe]
+        else:
+            raise KeyError("Timeframe {timeframe} has not been added to the StockFrame, call add_timeframe() first.".format(
+                timeframe=timeframe
+            ))
+
+    def _aggregate_bars(self, price_df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+        """Aggregates the OHLCV bars in a frame into bars of a larger timeframe for every symbol.
+        Arguments:
+        ----
+        price_df {pd.DataFrame} -- A frame indexed by `symbol` and `datetime`.
+        timeframe {str} -- The bar size to aggregate to.
+        Returns:
+        ----
+        {pd.DataFrame} -- The aggregated bars, indexed by `symbol` and the start time of each bar.
+        """
+        column_names = list(OHLCV_AGGREGATION.keys())
+
+        #The start time of the bar every row belongs to
+        bar_start = price_df.index.get_level_values('datetime').floor(TIMEFRAMES[timeframe])
+
+        aggregated_df = price_df[column_names].groupby(
+            by=[price_df.index.get_level_values('symbol'),bar_start],
+            sort=True
+        ).agg(OHLCV_AGGREGATION)
+        aggregated_df.index.names = ['symbol','datetime']
+
+        return aggregated_df
+
+    def _update_timeframes(self, new_bars: List[tuple]) -> None:
+        """Rebuilds the bars in the derived timeframes that the new base bars fall into.
+        Arguments:
+        ----
+        new_bars {List[tuple]} -- A list of (symbol, datetime) index of the bars that have been added.
+        """
+        column_names = list(OHLCV_AGGREGATION.keys())
+
+        for timeframe, timeframe_stock_frame in self._timeframes.items():
+            bar_width = TIMEFRAMES[timeframe]
+
+            #Only the bars touched by the new rows have to be recalculated
+            bars_to_update = sorted({(symbol, time_stamp.floor(bar_width)) for symbol, time_stamp in new_bars})
+
+            #Grab the base bars which fall into the bars to update, the end of each slice is inclusive
+            base_bars = pd.concat([
+                self._frame.loc[pd.IndexSlice[symbol, bar_start:bar_start + bar_width - pd.Timedelta(nanoseconds=1)], column_names]
+                for symbol, bar_start in bars_to_update
+            ])
+            updated_bars = self._aggregate_bars(price_df=base_bars, timeframe=timeframe)
+
+            for row_id, row_values in zip(updated_bars.index, updated_bars.values):
+                timeframe_stock_frame.frame.loc[row_id,column_names] = row_values
+
+            timeframe_stock_frame.frame.sort_index(inplace=True)
+            timeframe_stock_frame._invalidate_groups()
+
+            if timeframe_stock_frame.compact:
+                timeframe_stock_frame._compact_dtypes(price_df=timeframe_stock_frame.frame)
+
+            timeframe_stock_frame.trim()
+
+    def save(self, store_path: Union[str,pathlib.Path], file_format: str = 'parquet', start: Optional[pd.Timestamp] = None) -> List[pathlib.Path]:
+        """Saves the bars of the StockFrame to a local store, partitioned by symbol and date.
+        Overview:
+        ----
+        Every symbol gets its own folder in the store and every trading date is saved
+        to its own file, e.g. `store_path/AAPL/2021-04-15.parquet`. Only the price columns
+        are saved, indicators are calculated again once the StockFrame has been loaded.
+        Arguments:
+        ----
+        store_path {Union[str,pathlib.Path]} -- The folder of the store, it will be created if it doesn't exist.
+
+        file_format {str} -- The format of the files, can be either 'parquet' or 'arrow'. Default is 'parquet'.
+
+        start {Optional[pd.Timestamp]} -- Optional, only the dates from `start` onwards are written, the
+            partitions before it are left untouched. If left blank, every date is written.
+        Returns:
+        ----
+        {List[pathlib.Path]} -- The files which have been written.
+        """
+        self._check_store_format(file_format=file_format)
+
+        store_path = pathlib.Path(store_path)
+        column_names = list(OHLCV_AGGREGATION.keys())
+
+        price_df = self._frame[column_names].reset_index()
+        if start is not None:
+            price_df = price_df[price_df['datetime'] >= pd.Timestamp(start).floor('D')]
+
+        written_files = []
+        for (symbol, date), partition_df in price_df.groupby(by=['symbol',price_df['datetime'].dt.date], sort=True):
+            partition_folder = store_path.joinpath(str(symbol).replace('/','_'))
+            partition_folder.mkdir(parents=True, exist_ok=True)
+            partition_file = partition_folder.joinpath(date.isoformat() + STORE_FORMATS[file_format])
+
+            table = pa.Table.from_pandas(df=partition_df, preserve_index=False)
+
+            # Write to a temporary file first so a crash never leaves a half written partition behind
+            temporary_file = partition_file.with_suffix(partition_file.suffix + '.tmp')
+            if file_format == 'parquet':
+                pq.write_table(table=table, where=str(temporary_file))
+            else:
+                feather.write_feather(df=table, dest=str(temporary_file), compression='uncompressed')
+            temporary_file.replace(partition_file)
+
+            written_files.append(partition_file)
+
+        return written_files
+
+    @classmethod
+    def load(cls, store_path: Union[str,pathlib.Path], symbols: Optional[List[str]] = None, file_format: str = 'parquet',
+    timeframe: str = '1min', compact: bool = False) -> Optional['StockFrame']:
+        """Loads a StockFrame from a local store that was written by `save()`.
+        Overview:
+        ----
+        The files are memory-mapped where possible, so loading the store is bounded by the
+        speed of the local disk rather than requesting the whole history from IB again.
+        Arguments:
+        ----
+        store_path {Union[str,pathlib.Path]} -- The folder of the store.
+
+        symbols {Optional[List[str]]} -- Optional, the symbols to load. If left blank, every symbol is loaded.
+
+        file_format {str} -- The format of the files, can be either 'parquet' or 'arrow'. Default is 'parquet'.
+
+        timeframe {str} -- The bar size of the data in the store. Default is '1min'.
+
+        compact {bool} -- Store the loaded bars with compact dtypes, see `StockFrame`. Default is False.
+        Returns:
+        ----
+        {Optional[StockFrame]} -- The StockFrame, or None if there isn't any data in the store.
+        Usage:
+        ----
+            >>> stock_frame = StockFrame.load(store_path='price_store/1min')
+        """
+        cls._check_store_format(file_format=file_format)
+
+        store_path = pathlib.Path(store_path)
+        if not store_path.exists():
+            return None
+
+        if symbols is not None:
+            symbol_folders = [store_path.joinpath(str(symbol).replace('/','_')) for symbol in symbols]
+        else:
+            symbol_folders = [folder for folder in store_path.iterdir() if folder.is_dir()]
+
+        tables = []
+        for symbol_folder in sorted(symbol_folders):
+            for partition_file in sorted(symbol_folder.glob('*' + STORE_FORMATS[file_format])):
+                if file_format == 'parquet':
+                    tables.append(pq.read_table(source=str(partition_file), memory_map=True))
+                else:
+                    tables.append(feather.read_table(source=str(partition_file), memory_map=True))
+
+        if not tables:
+            return None
+
+        price_df = pa.concat_tables(tables).to_pandas()
+        price_df['datetime'] = price_df['datetime'].astype('datetime64[ns]')
+        price_df = price_df.set_index(keys=['symbol','datetime'])
+
+        return cls(data=price_df, timeframe=timeframe, compact=compact)
+
+    @staticmethod
+    def _check_store_format(file_format: str) -> None:
+        if pa is None:
+            raise ImportError("pyarrow is required to save and load the StockFrame store, install it with `pip install pyarrow`.")
+
+        if file_format not in STORE_FORMATS:
+            raise ValueError("File format {file_format} is not supported, use one of {supported}.".format(
+                file_format=file_format,
+                supported=list(STORE_FORMATS.keys())
+            ))
+
     #Check whehter an indicator exists in the stock frame dataframe
     def do_indicator_exist(self, column_names: List[str]) -> bool:
         """Checks to see if the indicator columns specified exist.
@@ -172,8 +867,8 @@ class StockFrame():
             will be returned. If no signals are found then nothing will be returned.
         """
 
-        #Get the last row of every symbol_groups
-        last_rows = self._symbol_groups.tail(1)
+        #Get the last row of every symbol
+        last_rows = self.last_rows
 
         #Define a dictionary of conditions 
         conditions = {}
@@ -291,7 +986,7 @@ class StockFrame():
                 indicator = ticker_indicator[1]
                 
                 # Get the last row of the specified ticker group
-                last_row = self._symbol_groups.get_group(ticker).tail(1)
+                last_row = self.get_symbol_frame(symbol=ticker).tail(1)
 
                 # Select the indicator cell as target for comparison later
                 target_cell = last_row[indicator]
@@ -335,7 +1030,7 @@ class StockFrame():
                 parts = indicator.split('_comp_')
 
                 #Grab the last row of thr indicators that need to be compared
-                last_row = self._symbol_groups.get_group(ticker).tail(1)
+                last_row = self.get_symbol_frame(symbol=ticker).tail(1)
 
                 # Select the indicator cell for indicator 1 as target for comparison later
                 target_cell_1 = last_row[parts[0]]
@@ -353,4 +1048,4 @@ class StockFrame():
                     # The key would be the ticker and the value would be close_position_when_sold:bool, this will be passed onto process_signal()
                     conditions['sells'].update({ticker:ticker_indicators[ticker][ticker_comp_indicator]['close_position_when_sell']})
 
-        return conditions
\ No newline at end of file
+        return conditions
\ No newline at end of file
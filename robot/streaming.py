@@ -0,0 +1,316 @@
+import json
+import time
+import socket
+import logging
+import threading
+import collections
+
+from typing import List
+from typing import Dict
+from typing import Callable
+from typing import Optional
+
+import robot.stock_frame as stock_frame
+from robot.bar_builder import BarBuilder
+from ibw.websocket import WebSocketConnection
+
+# The streaming endpoint of the Client Portal gateway
+STREAM_URL = 'wss://localhost:5000/v1/api/ws'
+
+# The market data fields the stream subscribes to, mapped to the name they are kept under
+QUOTE_FIELDS = {
+    '31': 'last',
+    '7059': 'last_size',
+    '84': 'bid',
+    '88': 'bid_size',
+    '86': 'ask',
+    '85': 'ask_size'
+}
+
+# The suffixes the gateway abbreviates large sizes with, e.g. '1.2K'
+SIZE_SUFFIXES = {
+    'K': 1e3,
+    'M': 1e6,
+    'B': 1e9
+}
+
+
+def parse_field(value: object) -> Optional[float]:
+    """Parses a market data field, which the gateway may send as a formatted string.
+
+    Prices of a closed or halted market are prefixed with 'C' or 'H' and sizes can be
+    abbreviated, e.g. '1.2K'.
+
+    Arguments:
+    ----
+    value {object} -- The value of the field.
+
+    Returns:
+    ----
+    {Optional[float]} -- The number, or None if the value isn't a number.
+    """
+
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    if not isinstance(value, str):
+        return None
+
+    value = value.strip().replace(',', '').lstrip('CH')
+    multiplier = 1.0
+    if value[-1:] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[value[-1]]
+        value = value[:-1]
+
+    try:
+        return float(value) * multiplier
+    except ValueError:
+        return None
+
+
+class MarketDataStream():
+
+    def __init__(self, conids: Dict[str,str], price_df: stock_frame.StockFrame = None, url: str = STREAM_URL,
+    session_provider: Callable[[], str] = None, bar_builder: BarBuilder = None, poll_interval: float = 0.5,
+    heartbeat_interval: float = 30.0, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0,
+    connection_factory: Callable = WebSocketConnection, quote_store=None) -> None:
+        """Streams market data from the Client Portal websocket.
+
+        Overview:
+        ----
+        The stream subscribes to the market data topic (smd+conid) of every conid, keeps the
+        latest top of book of each one and hands every trade to a BarBuilder. The BarBuilder adds
+        each bar to the StockFrame as soon as it closes, so the indicators can be refreshed
+        without polling the history endpoint for every conid.
+        If the connection drops, the stream reconnects with an increasing delay and
+        subscribes to every conid again.
+
+        Arguments:
+        ----
+        conids {Dict[str,str]} -- The conids to stream, mapped to their symbols.
+
+        price_df {stock_frame.StockFrame} -- The StockFrame the finished bars are added to, when no
+            `bar_builder` is given. (default: {None})
+
+        url {str} -- The websocket URL. (default: {STREAM_URL})
+
+        session_provider {Callable[[], str]} -- Returns the session id the gateway expects as the first
+            message, e.g. the 'session' of `IBClient.tickle()`. (default: {None})
+
+        bar_builder {BarBuilder} -- Builds the bars from the trades. Default is a BarBuilder adding the
+            bars to `price_df`.
+
+        poll_interval {float} -- How often in seconds the stream stops waiting for messages to send
+            subscriptions and heartbeats. (default: {0.5})
+
+        heartbeat_interval {float} -- How often in seconds the session is kept alive. (default: {30.0})
+
+        reconnect_delay {float} -- The delay in seconds before the first reconnect, doubled after every
+            failed attempt. (default: {1.0})
+
+        max_reconnect_delay {float} -- The longest delay in seconds between reconnects. (default: {30.0})
+
+        connection_factory {Callable} -- Creates the connection from the url and a timeout.
+            (default: {WebSocketConnection})
+
+        quote_store {QuoteStore} -- Every quote is also written to it, so it can be read without going
+            through the stream. (default: {None})
+
+        Usage:
+        ----
+            >>> stream = MarketDataStream(
+                conids={'265598': 'AAPL', '272093': 'MSFT'},
+                price_df=stock_frame_client,
+                session_provider=lambda: trader.session.tickle()['session']
+            )
+            >>> stream.start()
+            >>> finished_bars = stream.bar_builder.wait_for_bars(timeout=90)
+            >>> stream.quote(conid='265598')
+            {'last': 133.11, 'last_size': 100.0, 'bid': 133.1, 'bid_size': 300.0, 'ask': 133.12, 'ask_size': 200.0, 'updated': 1618493401012}
+        """
+
+        self.url = url
+        self.session_provider = session_provider
+        self.bar_builder = bar_builder if bar_builder is not None else BarBuilder(price_df=price_df)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connection_factory = connection_factory
+        self.quote_store = quote_store
+
+        self.messages = 0
+        self.reconnects = 0
+
+        self._conids: Dict[str,str] = {str(conid): symbol for conid, symbol in conids.items()}
+        self._quotes: Dict[str,Dict] = {}
+        self._lock = threading.Lock()
+        self._outbox = collections.deque()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connection = None
+
+    @property
+    def frame_lock(self) -> threading.Lock:
+        """Held while bars are added to the StockFrame, hold it while reading the StockFrame from another thread."""
+        return self.bar_builder.frame_lock
+
+    @property
+    def is_connected(self) -> bool:
+        connection = self._connection
+        return connection is not None and connection.connected
+
+    def start(self) -> None:
+        """Starts streaming from a background thread."""
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self.bar_builder.start()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='market-data-stream', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stops streaming and closes the connection."""
+
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+        self.bar_builder.stop(timeout=timeout)
+
+    def subscribe(self, conid: str, symbol: str) -> None:
+        """Starts streaming a conid, it is also subscribed to again after every reconnect."""
+
+        conid = str(conid)
+        with self._lock:
+            self._conids[conid] = symbol
+        self._outbox.append(self._subscribe_message(conid=conid))
+
+    def unsubscribe(self, conid: str) -> None:
+        """Stops streaming a conid."""
+
+        conid = str(conid)
+        with self._lock:
+            self._conids.pop(conid, None)
+            self._quotes.pop(conid, None)
+        self._outbox.append('umd+{conid}+{{}}'.format(conid=conid))
+
+    def quote(self, conid: str) -> Optional[Dict]:
+        """Returns the latest top of book of a conid, or None if nothing has been received for it yet."""
+
+        with self._lock:
+            quote = self._quotes.get(str(conid))
+            return dict(quote) if quote is not None else None
+
+    def live_bar(self, conid: str) -> Optional[Dict]:
+        """Returns the bar of a conid which is still being built, or None if there is none."""
+
+        return self.bar_builder.open_bar(conid=conid)
+
+    def _subscribe_message(self, conid: str) -> str:
+        return 'smd+{conid}+{fields}'.format(
+            conid=conid,
+            fields=json.dumps({'fields': list(QUOTE_FIELDS.keys())}, separators=(',', ':'))
+        )
+
+    def _run(self) -> None:
+        """Keeps the connection open until the stream is stopped, reconnecting whenever it drops."""
+
+        delay = self.reconnect_delay
+
+        while not self._stop_event.is_set():
+            try:
+                self._connect()
+                delay = self.reconnect_delay
+                self._receive()
+            except (OSError, ConnectionError) as error:
+                logging.warning('Market data stream disconnected: %s', error)
+            except Exception:
+                # A bad frame or a failing session provider or bar builder mustn't end the stream
+                logging.exception('Market data stream failed, reconnecting.')
+            finally:
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+
+            if self._stop_event.wait(delay):
+                break
+
+            self.reconnects += 1
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _connect(self) -> None:
+        """Opens the connection and subscribes to every conid."""
+
+        self._connection = self.connection_factory(url=self.url, timeout=self.poll_interval)
+        self._connection.connect()
+
+        if self.session_provider is not None:
+            self._connection.send(json.dumps({'session': self.session_provider()}))
+
+        # Every subscription is sent again, so the ones waiting in the outbox are no longer needed
+        self._outbox.clear()
+        with self._lock:
+            conids = list(self._conids.keys())
+        for conid in conids:
+            self._connection.send(self._subscribe_message(conid=conid))
+
+    def _receive(self) -> None:
+        """Handles the messages until the connection drops or the stream is stopped."""
+
+        last_heartbeat = time.monotonic()
+
+        while not self._stop_event.is_set():
+            while self._outbox:
+                self._connection.send(self._outbox.popleft())
+
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                self._connection.send('tic')
+                last_heartbeat = time.monotonic()
+
+            try:
+                message = self._connection.recv()
+            except socket.timeout:
+                continue
+
+            self.messages += 1
+            self._handle_message(message=message)
+
+    def _handle_message(self, message: str) -> None:
+        """Updates the quote of a conid from a market data message and hands its trade to the bar builder."""
+
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+
+        if not isinstance(data, dict) or not str(data.get('topic', '')).startswith('smd+'):
+            return
+
+        conid = str(data.get('conid') or data['topic'][4:])
+        updated = int(data.get('_updated') or time.time() * 1000)
+
+        values = {name: parse_field(data[field]) for field, name in QUOTE_FIELDS.items() if field in data}
+
+        with self._lock:
+            symbol = self._conids.get(conid)
+            if symbol is None:
+                return
+
+            quote = self._quotes.setdefault(conid, {name: None for name in QUOTE_FIELDS.values()})
+            for name, value in values.items():
+                if value is not None:
+                    quote[name] = value
+            quote['updated'] = updated
+
+        if self.quote_store is not None:
+            self.quote_store.update(conid=conid, symbol=symbol, updated=updated, **values)
+
+        # A message with a last price is a trade
+        price = parse_field(data.get('31'))
+        if price is not None:
+            size = parse_field(data.get('7059')) or 0.0
+            self.bar_builder.add_tick(conid=conid, symbol=symbol, price=price, size=size, timestamp=updated)
@@ -1,11 +1,19 @@
 import json
+import logging
 import time as time_true
 import pprint
 import pathlib
+import numpy as np
 import pandas as pd
 import robot.stock_frame as stock_frame
 import robot.trades as trades
 import robot.portfolio as portfolio
+import robot.streaming as streaming
+import robot.quotes as quotes
+import robot.risk as risk
+import robot.journal as journal
+import robot.order_store as order_store
+import robot.orders as orders
 
 from datetime import time
 from datetime import datetime
@@ -16,14 +24,22 @@ from typing import List
 from typing import Dict
 from typing import Union
 from typing import Optional
+from typing import Callable
 from ibw.client import IBClient
 from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
+
+#The gateway returns the positions of an account in pages of this many positions
+POSITIONS_PAGE_SIZE = 30
+
+#The longest period of look back the gateway serves, in years
+MAX_HISTORY_YEARS = 15
 
 #gateway_path = pathlib.Path('clientportal.gw').resolve() #Added this line to redirect clientportal.gw away from resoruces/clientportal.beta.gw
 
 class Trader():
 
-    def __init__(self, username: str, account: str , client_gateway_path: str = None, is_server_running: bool = True):
+    def __init__(self, username: str, account: str , client_gateway_path: str = None, is_server_running: bool = True, transport: object = None):
         """
             USAGE:
             Specify the paper and regular account details and gateway path before creating an object
@@ -46,23 +62,52 @@ class Trader():
                 username='paper_username',
                 account='paper_account',
             )
+
+            A recorded session can be replayed through the Trader without a gateway by passing
+            a transport, e.g. transport=ReplayTransport(record_path='recordings/2021-04-15.jsonl')
         """
         #Change username and account to go from paper account to regular account
         self.username = username
         self.account = account
-        #self.client_gateway_path = client_gateway_path
+        self.accounts: List[str] = [account]                    #The accounts served by this session, see load_accounts()
+        self.client_gateway_path = client_gateway_path
+        self.transport = transport
         self.is_paper_trading = True                            #Remember to change it when switch to regular account
         self.session: IBClient = self._create_session()         ### self.seesion = ib_client ### 
         self._account_data:pd.DataFrame = self._get_account_data()      #Get account data
         self.historical_prices = {}                             #A historical prices dictionary for all interested stocks
         self.stock_frame:stock_frame.StockFrame = None
+        self.market_data_stream:streaming.MarketDataStream = None
+        self.quote_poller:quotes.QuotePoller = None
+        self.quote_store = quotes.QuoteStore()                  #The latest quotes, shared by the poller, the stream and the portfolio
+        self.quote_max_age = 10.0                               #Quotes older than this many seconds are polled again before use
         self.portfolio:portfolio.Portfolio = None
+        self.portfolios: Dict[str,portfolio.Portfolio] = {}     #The portfolio of every account, self.portfolio is the one of self.account
+        self.accounts_data: Dict[str,pd.DataFrame] = {}         #The ledger of every account, see get_accounts_data()
+        self.risk_checker:risk.PreTradeRiskChecker = None       #Checks the orders against local limits before they are sent, see create_risk_checker()
+        self.preview_policy = trades.PreviewPolicy()            #Decides which orders are previewed before they are placed
+        self._order_journal:journal.OrderJournal = None          #Journals the orders and fills, see order_journal
+        self.order_store:order_store.OrderStore = None          #The indexed order history, see create_order_store()
+        self.order_manager = orders.OrderManager()              #The state of every order placed, indexed by trade_id and conid
         self.trades = {}                                        # A dictionary of all the trades that belongs to the trader
+        self._position_pages: Dict[str,int] = {}                #The number of position pages of every account at the last load
+        self._account_symbols: Dict[str,set] = {}               #The symbols of every account at the last load_positions()
     
     @property
     def account_data(self) -> pd.DataFrame:
         return self._account_data
 
+    @property
+    def order_journal(self) -> journal.OrderJournal:
+        """The journal the orders and fills are written to, by default 'order_record/orders.jsonl'."""
+        if self._order_journal is None:
+            self._order_journal = journal.default_journal()
+        return self._order_journal
+
+    @order_journal.setter
+    def order_journal(self, order_journal: journal.OrderJournal) -> None:
+        self._order_journal = order_journal
+
     def _create_session(self) -> IBClient:
         """Start a new session. Go to initiate an IBClient object and the session will be passed onto trader object
         Creates a new session with the IB Client  API and logs the user into
@@ -74,7 +119,9 @@ class Trader():
         ib_client = IBClient(
             username = self.username,
             account = self.account,
-            is_server_running=True
+            client_gateway_path = self.client_gateway_path,
+            is_server_running=True,
+            transport=self.transport
         )
 
         #Start a new session
@@ -89,6 +136,10 @@ class Trader():
 
         portfolio_ledger = self.session.portfolio_account_ledger(account_id=self.account)
 
+        return self._ledger_to_frame(portfolio_ledger=portfolio_ledger)
+
+    def _ledger_to_frame(self, portfolio_ledger: Dict) -> pd.DataFrame:
+        """Turns the ledger of an account into a row per currency."""
         column_names = ['account number','currency','cash balance','stock value','net liquidation value','realised PnL','unrealised PnL',]
         #create a pandas df with columns stated by column_names
 
@@ -192,26 +243,30 @@ class Trader():
             After querying symbol_to_conid and have a dataframe returned,
             select the 'conid' column of the specific row id with symbol, exchange
             then pass them to a list to get the current qoutes for them
+
+            The quotes are kept by a QuotePoller, which only requests what has changed since the last call
+            and packs all the conids into as few requests as possible. The quotes are kept in the quote store,
+            read it directly to avoid a request. Returns the last price of every conid keyed by its symbol,
+            None if there is no last price yet. A conid whose symbol hasn't arrived yet is keyed by the conid.
         """
-        quote_fields = ['55','31']      #qoute_feilds to indicate information wanted,'55' is symbol,'31' is last price
-        current_quotes = self.session.market_data(
-            conids=conids,
-            since='0',
-            fields=quote_fields
+        if self.quote_poller is None:
+            self.quote_poller = quotes.QuotePoller(session=self.session,quote_store=self.quote_store)
 
-        )
+        conids = [str(conid) for conid in conids]
+        for conid in conids:
+            self.quote_poller.add_conid(conid=conid)
+
+        self.quote_poller.poll()
 
         current_quotes_dict = dict()
-        for item in current_quotes:
-            if '31' in item.keys():     # Check if the last price exists for a symbol
-                current_quotes_dict.update({item['55']:item['31']})
-            else:
-                current_quotes_dict.update({item['55']:None})
+        for conid in conids:
+            symbol = self.quote_store.conid_to_symbol(conid=conid)
+            current_quotes_dict.update({symbol if symbol is not None else conid:self.quote_store.price(conid=conid)})
 
         return current_quotes_dict
         
 
-    def get_historical_prices(self,period:str,bar:str,conids:List[str]=None) -> List[Dict]:
+    def get_historical_prices(self,period:str,bar:str,conids:List[str]=None) -> Dict:
         #Get historical prices for a list of conids
         """
             Get history of market Data for the given conid, length of data is controlled by period and 
@@ -231,9 +286,13 @@ class Trader():
                   Possible values are ['1min','5min','1h','1w']
             TYPE: String
 
+            The candles of every symbol are read straight into NumPy columns, and self.historical_prices['aggregated']
+            holds the columns of all the symbols, keyed by 'symbol', 'datetime', 'open', 'close', 'high', 'low' and 'volume',
+            which can be passed to create_stock_frame().
+
         """
-        #List of new_prices for each symbol
-        new_prices = []
+        #Columns of the candles for each symbol
+        symbol_columns = []
         
         for conid in conids:
             historical_prices = self.session.market_data_history(
@@ -247,28 +306,164 @@ class Trader():
             self.historical_prices[symbol]= {}      #Create a dictionary which will be a propety of trader object
             self.historical_prices[symbol]['candles'] = historical_prices['data']
 
-            
-            #Extract candle data from historical_prices['data']
-            for candle in historical_prices['data']:
-                #Parse the timestamp
-                # time_stamp = pd.to_datetime(
-                #     candle['t'],        #timestamp from IB in epoch format, see IB Client Portal API docs /portal/iserver/marketdata/snapshot for data return of price request
-                #     unit='ms',
-                #     origin='unix'   
-                # )
-                new_price_dict = {}     #This is a mini dictionary for every candle, refer to /portal/iserver/marketdata/history
-                new_price_dict['symbol'] = symbol
-                new_price_dict['datetime'] = candle['t']        #Parse it to datetime timestamp later in stockframe
-                new_price_dict['open'] = candle['o']
-                new_price_dict['close'] = candle['c']
-                new_price_dict['high'] = candle['h']
-                new_price_dict['low'] = candle['l']
-                new_price_dict['volume'] = candle['v']
-                new_prices.append(new_price_dict)
+            #Extract candle data from historical_prices['data'] into columns, refer to /portal/iserver/marketdata/history
+            columns = stock_frame.candle_columns(candles=historical_prices['data'])
+            self.historical_prices[symbol]['columns'] = columns
+            symbol_columns.append((symbol,columns))
 
-        self.historical_prices['aggregated'] = new_prices
+        self.historical_prices['aggregated'] = self._join_symbol_columns(symbol_columns=symbol_columns)
 
         return self.historical_prices
+
+    def _join_symbol_columns(self,symbol_columns:List[tuple]) -> Dict[str,np.ndarray]:
+        """Joins the candle columns of several symbols into one set of columns with a symbol column.
+        The symbol column is filled in one go rather than per candle.
+        """
+        joined = {'symbol': np.array([],dtype=object)}
+        joined.update({column: np.array([],dtype=np.int64 if column == 'datetime' else np.float64) for column in stock_frame.CANDLE_KEYS})
+
+        if symbol_columns:
+            joined['symbol'] = np.concatenate([np.full(len(columns['datetime']),symbol,dtype=object) for symbol, columns in symbol_columns])
+            for column in stock_frame.CANDLE_KEYS:
+                joined[column] = np.concatenate([columns[column] for _, columns in symbol_columns])
+
+        return joined
+
+    def load_historical_prices(self,store_path:str,period:str,bar:str,conids:List[str]=None,file_format:str='parquet') -> stock_frame.StockFrame:
+        """Creates a stock frame from the local store and only requests the missing bars from IB.
+
+        Overview:
+        ----
+        The bars which are already in the store at `store_path` are loaded from disk, then for
+        every conid, only the bars that have come out since the last bar in the store are requested.
+        Conids which are not in the store yet are requested over the whole `period`. The new bars
+        are saved back to the store before the stock frame is returned, so the next start up
+        only has to request the bars since then.
+
+        Arguments:
+        ----
+        store_path {str} -- The folder of the store, use one folder per bar size, e.g. 'price_store/1min'.
+
+        period {str} -- The period of look back for the conids that are not in the store yet.
+            Possible values are ['1d','1w','1m','1y']
+
+        bar {str} -- Specifies granularity of data. Possible values are ['1min','5min','1h','1w']
+
+        conids {List[str]} -- The conids of the interested stocks.
+
+        file_format {str} -- The format of the files in the store, can be either 'parquet' or 'arrow'.
+            Default is 'parquet'.
+
+        Returns:
+        ----
+        StockFrame -- The stock frame with the stored and the newly requested bars.
+
+        Usage:
+        ----
+            >>> stock_frame_client = trader.load_historical_prices(
+                store_path='price_store/1min',
+                period='1m',
+                bar='1min',
+                conids=['265598','272093']
+            )
+        """
+        store_path = pathlib.Path(store_path)
+        conid_map_path = store_path.joinpath('conids.json')
+
+        # The symbols are only known once IB responds, so keep a map of conid to symbol in the store
+        if conid_map_path.exists():
+            with open(file=conid_map_path,mode='r') as conid_map_file:
+                conid_symbols = json.load(conid_map_file)
+        else:
+            conid_symbols = {}
+
+        stored_frame = stock_frame.StockFrame.load(store_path=store_path,file_format=file_format)
+
+        # Grab the time of the last bar in the store for every symbol
+        last_timestamps = {}
+        if stored_frame is not None:
+            for symbol, time_stamps in stored_frame.frame.reset_index(level='datetime')['datetime'].groupby(level='symbol'):
+                last_timestamps[symbol] = time_stamps.max()
+
+        symbol_columns = []
+        for conid in conids:
+            symbol = conid_symbols.get(str(conid))
+
+            # Only request the bars since the last stored bar, unless the conid isn't in the store yet
+            if symbol in last_timestamps:
+                missing_period = self._missing_tail_period(last_timestamp=last_timestamps[symbol])
+            else:
+                missing_period = period
+
+            historical_prices = self.session.market_data_history(
+                conid=conid,
+                period=missing_period,
+                bar=bar
+            )
+
+            symbol = historical_prices['symbol']
+            conid_symbols[str(conid)] = symbol
+            self.historical_prices[symbol] = {}
+            self.historical_prices[symbol]['candles'] = historical_prices['data']
+
+            columns = stock_frame.candle_columns(candles=historical_prices['data'])
+
+            # The epoch of the last stored bar in ms, candles at or before it are already in the store
+            if symbol in last_timestamps:
+                last_epoch = int(last_timestamps[symbol].value // 1_000_000)
+                is_new = columns['datetime'] > last_epoch
+                columns = {column: values[is_new] for column, values in columns.items()}
+
+            symbol_columns.append((symbol,columns))
+
+        new_prices = self._join_symbol_columns(symbol_columns=symbol_columns)
+        self.historical_prices['aggregated'] = new_prices
+        has_new_prices = len(new_prices['datetime']) > 0
+
+        if stored_frame is None:
+            self.stock_frame = stock_frame.StockFrame(data=new_prices)
+        elif has_new_prices:
+            # Build the new bars column by column and append them to the stored bars in one go
+            new_frame = stock_frame.StockFrame(data=new_prices).frame
+            self.stock_frame = stock_frame.StockFrame(data=pd.concat([stored_frame.frame,new_frame]))
+        else:
+            self.stock_frame = stored_frame
+
+        # Only the dates which have received new bars have to be written back to the store
+        if has_new_prices:
+            first_new_bar = pd.to_datetime(new_prices['datetime'].min(),unit='ms',origin='unix')
+            self.stock_frame.save(store_path=store_path,file_format=file_format,start=first_new_bar)
+
+            with open(file=conid_map_path,mode='w') as conid_map_file:
+                json.dump(conid_symbols,conid_map_file)
+
+        if self.portfolio is not None:
+            self.portfolio.stock_frame = self.stock_frame
+
+        return self.stock_frame
+
+    def _missing_tail_period(self,last_timestamp:pd.Timestamp) -> str:
+        """Returns the shortest period of look back which covers the bars since `last_timestamp`.
+        A gap longer than the gateway serves is logged, as the bars at its start stay missing.
+        """
+        gap = pd.Timestamp(datetime.now(tz=timezone.utc).replace(tzinfo=None)) - last_timestamp
+
+        # Each period is paired with the longest gap it safely covers, leaving room for weekends and holidays
+        for tail_period, tail_width in [('2d',timedelta(days=1)),('1w',timedelta(days=4)),('1m',timedelta(days=25)),('1y',timedelta(days=300))]:
+            if gap < tail_width:
+                return tail_period
+
+        # Longer gaps are covered in whole years, with the same room as '1y'
+        years = gap.days // 300 + 1
+        if years > MAX_HISTORY_YEARS:
+            logging.warning(
+                "The last stored bar is from %s, more than the %d years the gateway serves. The bars in between stay missing.",
+                last_timestamp, MAX_HISTORY_YEARS
+            )
+            years = MAX_HISTORY_YEARS
+
+        return '{years}y'.format(years=years)
+
     #Get latest candle
     def get_latest_candle(self,bar='1min',conids=List[str]) -> List[Dict]:
         """
@@ -371,12 +566,42 @@ class Trader():
 
         time_true.sleep(time_to_wait_now)
         
+    def create_market_data_stream(self,conids:Dict[str,str],url:str=streaming.STREAM_URL) -> streaming.MarketDataStream:
+        """Creates a market data stream which adds the bars of the conids to the stock frame as they finish.
+        Arguments:
+        ----
+        conids {Dict[str,str]} -- The conids to stream, mapped to their symbols.
+
+        url {str} -- The websocket URL of the gateway. Default is 'wss://localhost:5000/v1/api/ws'.
+
+        Returns:
+        ----
+        MarketDataStream -- The stream, call `start()` on it to start streaming.
+
+        Usage:
+        ----
+            >>> stock_frame_client = trader.create_stock_frame(data=trader.historical_prices['aggregated'])
+            >>> market_data_stream = trader.create_market_data_stream(conids={'265598':'AAPL','272093':'MSFT'})
+            >>> market_data_stream.start()
+            >>> # Wait for the bars to close instead of calling wait_till_next_candle()
+            >>> finished_bars = market_data_stream.bar_builder.wait_for_bars(timeout=90)
+        """
+        self.market_data_stream = streaming.MarketDataStream(
+            conids=conids,
+            price_df=self.stock_frame,
+            url=url,
+            session_provider=lambda: self.session.tickle()['session'],
+            quote_store=self.quote_store
+        )
+
+        return self.market_data_stream
+
     #Create a stock frame for trader class
-    def create_stock_frame(self,data: List[Dict]) -> stock_frame.StockFrame:
+    def create_stock_frame(self,data: Union[List[Dict],Dict[str,np.ndarray]]) -> stock_frame.StockFrame:
         """Generates a new stock frame object
         Arguments:
         ----
-        data{List[dict]} -- The data to add to the StockFrame object, it can be the results obtained from get_historical_prices(), e.g. self.historical_prices['aggregated']
+        data{Union[List[Dict],Dict[str,np.ndarray]]} -- The data to add to the StockFrame object, it can be the results obtained from get_historical_prices(), e.g. self.historical_prices['aggregated']
 
         Returns:
         ----
@@ -385,14 +610,23 @@ class Trader():
 
         #Create the frame
         self.stock_frame = stock_frame.StockFrame(data=data)
+        if self.portfolio is not None:
+            self.portfolio.stock_frame = self.stock_frame
         return self.stock_frame
 
     #Obtain account positions data which will then be passed to the portfolio object to generate a portfolio dataframe
-    def load_positions(self) -> List[Dict]:
+    def load_positions(self, refresh: bool = False, max_workers: int = 4, account_id: str = None) -> List[Dict]:
         """Load all the existing positions from IB to the Portfolio object
         Arguments:
         ----
-        None
+        refresh {bool} -- Invalidate the positions cached by the gateway first and apply the changes
+            since the last load: new positions are added, changed ones updated and the ones which
+            are gone are closed. (default: {False})
+
+        max_workers {int} -- The most pages of positions requested at the same time. (default: {4})
+
+        account_id {str} -- The account whose positions are loaded into its portfolio, see
+            load_accounts(). (default: {self.account})
 
         Returns:
         ----
@@ -407,32 +641,99 @@ class Trader():
             )
             >>> trader_portfolio = trader.create_portfolio()
             >>> trader.load_positions()
+            >>> trader.load_positions(refresh=True)
 
         """
-        account_positions = self.session.portfolio_account_positions(
-            account_id=self.account,
-            page_id=0
+        account_id = account_id if account_id is not None else self.account
+        target_portfolio = self.portfolio if account_id == self.account else self.portfolios[account_id]
+
+        if refresh:
+            self.session.portfolio_positions_invalidate(account_id=account_id)
+
+        account_positions = self._fetch_positions(account_id=account_id, max_workers=max_workers)
+        self._apply_positions(
+            target_portfolio=target_portfolio,
+            account_positions=account_positions,
+            previous_symbols=self._account_symbols.get(account_id, set())
         )
+        self._account_symbols[account_id] = {position['ticker'] for position in account_positions}
+
+        return account_positions
+
+    def _fetch_positions(self, account_id: str, max_workers: int = 4) -> List[Dict]:
+        """Requests every page of the positions of an account.
+
+        A full page means there may be another one. The pages are requested in waves of
+        `max_workers` at the same time until a page comes back short, the first wave covering
+        as many pages as the account had at its last load.
+        """
+        pages = self._position_pages.get(account_id, 1)
+        first_page = 0
+        account_positions = []
+
+        def request_page(page_id: int) -> List[Dict]:
+            page = self.session.portfolio_account_positions(account_id=account_id, page_id=page_id)
+            if not isinstance(page, list):
+                logging.warning("Page %d of the positions of %s returned %r.", page_id, account_id, page)
+                return []
+            return page
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                page_ids = range(first_page, first_page + pages)
+                responses = executor.map(request_page, page_ids) if pages > 1 else [request_page(first_page)]
+
+                for page_id, page in zip(page_ids, responses):
+                    account_positions.extend(page)
+                    if len(page) < POSITIONS_PAGE_SIZE:
+                        self._position_pages[account_id] = page_id + 1
+                        return account_positions
+
+                first_page += pages
+                pages = max_workers
+
+    def _apply_positions(self, target_portfolio: portfolio.Portfolio, account_positions: List[Dict], previous_symbols: set) -> None:
+        """Brings a portfolio in line with the positions of its account.
+
+        New positions are added in one batch, the quantity and average price of the others are
+        updated in place, so their realised PnL is kept. The positions of the previous load
+        which are gone have been closed.
+        """
+        new_positions = []
         for position in account_positions:
 
             # Sometimes there isn't the key 'ticker' in the position dictionary, in which case \
             # use 'contractDesc' instead
             if 'ticker' not in position:
                 position['ticker'] = position['contractDesc']
-            
-            self.portfolio.add_position(
-                symbol=position['ticker'],
-                asset_type=position['assetClass'],
-                purchase_date="Unknown",
-                order_status="Filled",      #If it is in the positions list, it is filled
-                quantity=position['position'],
-                purchase_price=position['mktPrice']
-            )
-
-        # Set the ownership_status to True as not providing date has set it to False originally
-        self.portfolio.set_ownership_status(symbol=position['ticker'],ownership=True)
 
-        return account_positions
+            symbol = position['ticker']
+            average_price = position.get('avgPrice',position['mktPrice'])
+
+            if not target_portfolio.in_portfolio(symbol=symbol):
+                new_positions.append({
+                    'symbol': symbol,
+                    'asset_type': position['assetClass'],
+                    'purchase_date': "Unknown",
+                    'order_status': "Filled",       #If it is in the positions list, it is filled
+                    'quantity': position['position'],
+                    'purchase_price': average_price,
+                    'last_price': position['mktPrice']
+                })
+                continue
+
+            if target_portfolio.positions[symbol]['quantity'] != position['position']:
+                target_portfolio.update_position(symbol=symbol, quantity=position['position'], order_status="Filled")
+            target_portfolio.set_average_price(symbol=symbol, price=average_price)
+            target_portfolio.set_price(symbol=symbol, price=position['mktPrice'])
+            target_portfolio.set_ownership_status(symbol=symbol, ownership=position['position'] != 0)
+
+        target_portfolio.add_positions(positions=new_positions)
+
+        for symbol in previous_symbols - {position['ticker'] for position in account_positions}:
+            if target_portfolio.in_portfolio(symbol=symbol):
+                target_portfolio.update_position(symbol=symbol, quantity=0)
+                target_portfolio.set_ownership_status(symbol=symbol, ownership=False)
 
     def create_portfolio(self) -> portfolio.Portfolio:
         """Creates a new portfoliio
@@ -449,13 +750,260 @@ class Trader():
         
         trader_portfolio = trader.create_portfolio()
         """
-        self.portfolio = portfolio.Portfolio(account_id=self.account)
-        
-        #Assign the client
-        self.portfolio._ib_client = self.session
+        self.portfolio = self._create_account_portfolio(account_id=self.account)
 
         return self.portfolio
 
+    def _create_account_portfolio(self, account_id: str) -> portfolio.Portfolio:
+        """Creates the portfolio of an account, sharing the quotes of the Trader."""
+        account_portfolio = portfolio.Portfolio(account_id=account_id,quote_store=self.quote_store)
+
+        #Assign the client and the stock frame the risk metrics are computed from
+        account_portfolio._ib_client = self.session
+        account_portfolio.stock_frame = self.stock_frame
+        self.portfolios[account_id] = account_portfolio
+
+        return account_portfolio
+
+    def create_order_store(self,path:str=order_store.DEFAULT_STORE_PATH,load_journal:bool=True) -> order_store.OrderStore:
+        """Creates the indexed order history, which is kept up to date from the order journal.
+
+        Arguments:
+        ----
+        path {str} -- The SQLite database file. Default is 'order_record/orders.db'.
+
+        load_journal {bool} -- Add the records already in the journal file, records which are already
+            in the store are skipped. (default: {True})
+
+        Returns:
+        ----
+        OrderStore -- The order history.
+
+        Usage:
+        ----
+            >>> order_history = trader.create_order_store()
+            >>> trader.order_history(symbol='AAPL',status='Filled')
+        """
+        self.order_store = order_store.OrderStore(path=path)
+
+        if load_journal:
+            self.order_journal.flush()
+            self.order_store.load_journal(path=self.order_journal.path)
+
+        self.order_journal.add_listener(self.order_store.ingest)
+
+        return self.order_store
+
+    def order_history(self,symbol:str=None,status:str=None,trade_id:str=None,start:Union[int,datetime]=None,end:Union[int,datetime]=None) -> List[Dict]:
+        """Queries the orders in the order history, see OrderStore.orders().
+
+        Arguments:
+        ----
+        symbol {str} -- The symbol.
+
+        status {str} -- The order status, e.g. 'Filled'.
+
+        trade_id {str} -- The order id given by IB, or the local trade id.
+
+        start {Union[int,datetime]} -- Orders created at or after this epoch ms or time.
+
+        end {Union[int,datetime]} -- Orders created before this epoch ms or time.
+
+        Returns:
+        ----
+        List[Dict] -- The orders, oldest first.
+        """
+        if self.order_store is None:
+            self.create_order_store()
+
+        # Records still waiting in the journal are written to the store first
+        self.order_journal.flush()
+
+        return self.order_store.orders(symbol=symbol,status=status,trade_id=trade_id,start=start,end=end)
+
+    def restore_positions(self) -> portfolio.Portfolio:
+        """Rebuilds the positions of the portfolio from the fills in the order journal, e.g. after a restart.
+        The fills of every account served, see load_accounts(), are replayed into the portfolio of the account.
+
+        Usage:
+        ----
+            >>> trader_portfolio = trader.create_portfolio()
+            >>> trader.restore_positions()
+        """
+        if self.portfolio is None:
+            self.create_portfolio()
+
+        return self.order_journal.replay(portfolio=self.portfolio, portfolios=self.portfolios)
+
+    def load_accounts(self, account_ids: List[str] = None, sub_accounts: bool = False) -> List[str]:
+        """Serves several accounts from the one session, each with a portfolio of its own.
+
+        The accounts the session can see are listed first, which the gateway needs before any
+        other /portfolio request for them. Every account gets a Portfolio in `portfolios`, the
+        one of `self.account` is `self.portfolio`.
+
+        Arguments:
+        ----
+        account_ids {List[str]} -- The accounts to serve. (default: {every account the session can see})
+
+        sub_accounts {bool} -- List the sub-accounts of a tiered account structure, e.g. a financial
+            advisor account, rather than the accounts. (default: {False})
+
+        Returns:
+        ----
+        {List[str]} -- The accounts served.
+
+        Raises:
+        ----
+        ValueError: If an account isn't one the session can see.
+
+        Usage:
+        ----
+            >>> trader.load_accounts(account_ids=['DU1234567','DU7654321'])
+            >>> trader.update_accounts()
+            >>> trader.aggregate_metrics()
+        """
+        if sub_accounts:
+            response = self.session.portfolio_sub_accounts()
+        else:
+            response = self.session.portfolio_accounts()
+
+        available_ids = [account.get('accountId', account.get('id')) for account in response or []]
+        if account_ids is None:
+            account_ids = available_ids
+        else:
+            missing_ids = [account_id for account_id in account_ids if account_id not in available_ids]
+            if missing_ids:
+                raise ValueError("The session can't see the accounts {missing_ids}.".format(missing_ids=missing_ids))
+
+        self.accounts = list(dict.fromkeys(account_ids))
+        for account_id in self.accounts:
+            if account_id == self.account and self.portfolio is not None:
+                self.portfolios[account_id] = self.portfolio
+            elif account_id == self.account:
+                self.create_portfolio()
+            elif account_id not in self.portfolios:
+                self._create_account_portfolio(account_id=account_id)
+
+        return self.accounts
+
+    def _fan_out(self, request: Callable[[str], object], account_ids: List[str] = None, max_workers: int = 8) -> Dict[str,object]:
+        """Runs a request for every account at the same time. An account whose request fails is logged and left out."""
+        account_ids = account_ids if account_ids is not None else self.accounts
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(account_ids)))) as executor:
+            futures = {account_id: executor.submit(request, account_id) for account_id in account_ids}
+            for account_id, future in futures.items():
+                try:
+                    results[account_id] = future.result()
+                except Exception:
+                    logging.exception("The request for account %s failed.", account_id)
+
+        return results
+
+    def get_accounts_data(self, account_ids: List[str] = None, max_workers: int = 8) -> Dict[str,pd.DataFrame]:
+        """Requests the ledger of every account at the same time.
+
+        Returns:
+        ----
+        {Dict[str,pd.DataFrame]} -- The ledger of every account, as in `account_data`.
+        """
+        accounts_data = self._fan_out(
+            request=lambda account_id: self._ledger_to_frame(portfolio_ledger=self.session.portfolio_account_ledger(account_id=account_id)),
+            account_ids=account_ids,
+            max_workers=max_workers
+        )
+        self.accounts_data.update(accounts_data)
+        if self.account in accounts_data:
+            self._account_data = accounts_data[self.account]
+
+        return accounts_data
+
+    def load_accounts_positions(self, refresh: bool = False, account_ids: List[str] = None, max_workers: int = 8) -> Dict[str,List[Dict]]:
+        """Loads the positions of every account into its portfolio, the accounts at the same time.
+        The arguments are the same as `load_positions()`.
+
+        Returns:
+        ----
+        {Dict[str,List[Dict]]} -- The positions of every account.
+        """
+        return self._fan_out(
+            request=lambda account_id: self.load_positions(refresh=refresh, account_id=account_id),
+            account_ids=account_ids,
+            max_workers=max_workers
+        )
+
+    def update_accounts(self, refresh_positions: bool = True, max_workers: int = 8) -> Dict:
+        """Requests the ledgers, the positions and the live orders of every account, e.g. once every bar.
+
+        The ledgers, the positions and the live orders are all requested at the same time, the
+        ledgers and positions of every account at once. The live orders of the session cover every
+        account, so they take one request. They are applied once the positions are loaded, as both
+        change the same portfolios. Each order updates the portfolio of its account.
+
+        Returns:
+        ----
+        {Dict} -- The 'accounts_data', 'positions' and 'live_orders'.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            accounts_data = executor.submit(self.get_accounts_data, max_workers=max_workers)
+            live_orders = executor.submit(self.session.get_live_orders)
+            positions = self.load_accounts_positions(refresh=refresh_positions, max_workers=max_workers)
+
+            # The portfolios aren't locked, so the orders are only applied once every position is loaded
+            live_order_response = live_orders.result()
+            self._apply_live_orders(live_order_response=live_order_response)
+
+            return {
+                'accounts_data': accounts_data.result(),
+                'positions': positions,
+                'live_orders': live_order_response
+            }
+
+    def accounts_allocation(self, account_ids: List[str] = None) -> Dict:
+        """The allocation of the accounts by asset class, sector and group, consolidated by the gateway."""
+        return self.session.portfolio_accounts_allocation(account_ids=account_ids if account_ids is not None else self.accounts)
+
+    def aggregate_metrics(self) -> Dict:
+        """Sums up the valuation of the portfolios of every account.
+
+        Returns:
+        ----
+        {Dict} -- The totals of `Portfolio.portfolio_metrics()`, and the metrics of every account under 'accounts'.
+        """
+        accounts_metrics = {
+            account_id: account_portfolio.portfolio_metrics()
+            for account_id, account_portfolio in self.portfolios.items()
+        }
+
+        aggregate = {
+            key: sum(metrics[key] for metrics in accounts_metrics.values())
+            for key in ['market_value', 'unrealized_pnl', 'realized_pnl', 'positions']
+        }
+        aggregate['accounts'] = accounts_metrics
+
+        return aggregate
+
+    def aggregate_positions(self) -> pd.DataFrame:
+        """The positions of every account, indexed by account and symbol.
+
+        Usage:
+        ----
+            >>> positions = trader.aggregate_positions()
+            >>> positions.groupby('symbol')[['quantity','market_value']].sum()
+        """
+        frames = []
+        for account_id, account_portfolio in self.portfolios.items():
+            positions_frame = account_portfolio.positions_frame()
+            positions_frame.insert(0, 'account', account_id)
+            frames.append(positions_frame)
+
+        if not frames:
+            return pd.DataFrame(columns=['account','symbol','asset_type','quantity','average_price','last_price','market_value']).set_index(['account','symbol'])
+
+        return pd.concat(frames, ignore_index=True).set_index(['account','symbol'])
+
 
     def create_trade(self,account_id:Optional[str], local_trade_id:str, conid:str, ticker:str, security_type:str, order_type: str, side:str, duration:str , 
     price:float = 0.0, quantity:float = 0.0,outsideRTH:bool=False) -> trades.Trade:
@@ -534,9 +1082,10 @@ class Trader():
             quantity=quantity
         )
 
-        #Set the Client
-        trade.account = self.account
+        #Set the Client and the journal the order is recorded in
+        trade.account = account_id if account_id else self.account
         trade._ib_client = self.session
+        trade._journal = self.order_journal
 
         local_trade_id = trade.local_trade_id
         self.trades[local_trade_id] = trade
@@ -577,14 +1126,14 @@ class Trader():
             # Grab the buy symbols
             symbol_list = buys.index.get_level_values(0).to_list()
 
-            #Loop through each symbol in buy signals
+            # Create a Trade object for every symbol that doesn't exist in Portfolio.positions
+            trade_objs: List[trades.Trade] = []
             for symbol in symbol_list:
                 # Obtain the conid for the symbol
                 conid = self.symbol_to_conid(symbol=symbol,exchange=exchange)
 
                 # Check if position already exists in Portfolio object, only proceed buy signal if it is not in portfolio
                 if self.portfolio.in_portfolio(symbol) is False:
-                    #Create a Trade object for symbol that doesn't exist in Portfolio.positions
                     trade_obj: trades.Trade = self.create_trade(
                         account_id=self.account,
                         local_trade_id=None,
@@ -597,52 +1146,67 @@ class Trader():
                         price=None,
                         quantity=1.0
                     )
+                    trade_objs.append(trade_obj)
+
+            # Check the orders against the risk limits, preview them if needed and execute them
+            execute_order_responses = self._submit_orders(trade_objs=trade_objs)
+
+            for trade_obj, execute_order_response in zip(trade_objs, execute_order_responses):
+                if execute_order_response is None:
+                    continue
+                symbol = trade_obj.symbol
+
+                # Save the exexcute_order_response into a dictionary
+                order_response = {
+                    'symbol': symbol,
+                    'local_trade_id':execute_order_response[0]['local_order_id'],
+                    'trade_id':execute_order_response[0]['order_id'],
+                    'message':execute_order_response[0]['text'],
+                    'order_status':execute_order_response[0]['order_status'],
+                    'warning_message':execute_order_response[0]['warning_message']
+                }
+
+                # Sleep for 0.1 seconds to make sure order is executed on IB server
+                time_true.sleep(0.1)
+
+                # Query order to find out market order, price and other info
+                order_status_response = self.session.get_order_status(trade_id=execute_order_response[0]['order_id'])
+                order_price = float(order_status_response['exit_strategy_display_price'])
+                order_quantity = float(order_status_response['size'])
+                order_status = order_status_response['order_status']
+                order_asset_type = order_status_response['sec_type']
+                
+                # Obtain the time now
+                time_now = datetime.now(tz=timezone.utc).replace(microsecond=0).isoformat()
+                
+                # Journal the fill, so the position can be rebuilt with OrderJournal.replay() after a restart
+                self.order_journal.record_fill(
+                    symbol=symbol,
+                    side='BUY',
+                    quantity=order_quantity,
+                    price=order_price,
+                    trade_id=execute_order_response[0]['order_id'],
+                    asset_type=order_asset_type,
+                    order_status=order_status,
+                    account=trade_obj.account
+                )
+
+                # Add this position onto our Portfolio Object with the data obtained from order_status_response
+                portfolio_position_dict = self.portfolio.add_position(
+                    symbol=symbol,
+                    asset_type=order_asset_type,
+                    purchase_date=time_now,
+                    purchase_price=order_price,
+                    quantity=order_quantity,
+                    order_status=order_status
+                    # Ownership_status is automatically set to when purchase_date is supplied
+                    )
 
-                    # Preview the order
-                    preview_order_response = trade_obj.preview_order()
-
-                    # Execute the order
-                    execute_order_response = trade_obj.place_order(ignore_warning=True)
-
-                    # Save the exexcute_order_response into a dictionary
-                    order_response = {
-                        'symbol': symbol,
-                        'local_trade_id':execute_order_response[0]['local_order_id'],
-                        'trade_id':execute_order_response[0]['order_id'],
-                        'message':execute_order_response[0]['text'],
-                        'order_status':execute_order_response[0]['order_status'],
-                        'warning_message':execute_order_response[0]['warning_message']
-                    }
-
-                    # Sleep for 0.1 seconds to make sure order is executed on IB server
-                    time_true.sleep(0.1)
-
-                    # Query order to find out market order, price and other info
-                    order_status_response = self.session.get_order_status(trade_id=execute_order_response[0]['order_id'])
-                    order_price = float(order_status_response['exit_strategy_display_price'])
-                    order_quantity = float(order_status_response['size'])
-                    order_status = order_status_response['order_status']
-                    order_asset_type = order_status_response['sec_type']
-                    
-                    # Obtain the time now
-                    time_now = datetime.now(tz=timezone.utc).replace(microsecond=0).isoformat()
-                    
-                    # Add this position onto our Portfolio Object with the data obtained from order_status_response
-                    portfolio_position_dict = self.portfolio.add_position(
-                        symbol=symbol,
-                        asset_type=order_asset_type,
-                        purchase_date=time_now,
-                        purchase_price=order_price,
-                        quantity=order_quantity,
-                        order_status=order_status
-                        # Ownership_status is automatically set to when purchase_date is supplied
-                        )
-
-                    # IMPLEMENT WAIT UNTIL ORDER IS FILLED? #
+                # IMPLEMENT WAIT UNTIL ORDER IS FILLED? #
 
 
-                    # Append the order_response above to the main order_responses list
-                    order_responses.append(order_response)
+                # Append the order_response above to the main order_responses list
+                order_responses.append(order_response)
 
         # Check if we have any sells signals
         elif not sells.empty:
@@ -650,7 +1214,8 @@ class Trader():
             # Grab the sell symbols
             symbol_list = buys.index.get_level_values(0).to_list()
             
-            #Loop through each symbol in sell signals
+            # Create a Trade object for every symbol we own in the portfolio
+            trade_objs: List[trades.Trade] = []
             for symbol in symbol_list:
                 # Obtain the conid for the symbol
                 conid = self.symbol_to_conid(symbol=symbol,exchange=exchange)
@@ -676,30 +1241,51 @@ class Trader():
                             price=None,
                             quantity=self.portfolio.positions[symbol]['quantity']
                         )
-
-                        # Preview the order
-                        preview_order_response = trade_obj.preview_order()
-
-                        # Execute the order
-                        execute_order_response = trade_obj.place_order(ignore_warning=True)
-
-                        # Save the exexcute_order_response into a dictionary
-                        order_response = {
-                            'symbol': symbol,
-                            'local_trade_id':execute_order_response[0]['local_order_id'],
-                            'trade_id':execute_order_response[0]['order_id'],
-                            'order_status':execute_order_response[0]['order_status'],
-                        }
-
-
-                        # Sleep for 0.1 seconds to make sure order is executed on IB server
-                        time_true.sleep(0.1)
-
-                        # Set positions[symbol]['quantity] to 0 and update order_status
-                        self.portfolio.positions[symbol]['quantity'] = 0
-                        self.portfolio.positions[symbol]['order_status'] = execute_order_response[0]['order_status']
-
-                        order_responses.append(order_response)
+                        trade_objs.append(trade_obj)
+
+            # Check the orders against the risk limits, preview them if needed and execute them
+            execute_order_responses = self._submit_orders(trade_objs=trade_objs)
+
+            for trade_obj, execute_order_response in zip(trade_objs, execute_order_responses):
+                symbol = trade_obj.symbol
+                if execute_order_response is None:
+                    # The order wasn't placed, so we still own the position
+                    self.portfolio.set_ownership_status(symbol=symbol,ownership=True)
+                    continue
+
+                # Save the exexcute_order_response into a dictionary
+                order_response = {
+                    'symbol': symbol,
+                    'local_trade_id':execute_order_response[0]['local_order_id'],
+                    'trade_id':execute_order_response[0]['order_id'],
+                    'order_status':execute_order_response[0]['order_status'],
+                }
+
+
+                # Sleep for 0.1 seconds to make sure order is executed on IB server
+                time_true.sleep(0.1)
+
+                # Set the quantity of the position to 0 and update order_status, realising the PnL at the fill price
+                sell_price = self._sell_fill_price(trade_id=execute_order_response[0]['order_id'],symbol=symbol)
+                if sell_price is not None:
+                    self.order_journal.record_fill(
+                        symbol=symbol,
+                        side='SELL',
+                        quantity=trade_obj.quantity,
+                        price=sell_price,
+                        trade_id=execute_order_response[0]['order_id'],
+                        asset_type=self.portfolio.positions[symbol]['asset_type'],
+                        order_status=execute_order_response[0]['order_status'],
+                        account=trade_obj.account
+                    )
+                self.portfolio.update_position(
+                    symbol=symbol,
+                    quantity=0,
+                    price=sell_price,
+                    order_status=execute_order_response[0]['order_status']
+                )
+
+                order_responses.append(order_response)
         
         return order_responses
     
@@ -715,6 +1301,8 @@ class Trader():
 
         # Check if there are any buys signals
         if buys:
+            # Create a Trade object for every ticker that doesn't exist in Portfolio.positions
+            trade_objs: List[trades.Trade] = []
             # Loop through each key value pair in dict
             for ticker,buy_cash_quantity in buys.items():
                 # Obtain the conid for the symbol
@@ -728,7 +1316,6 @@ class Trader():
                     
                     # Check if a quantity has been calculated
                     if quantity != 0.0:
-                        # Create a Trade object for symbol that doesn't exist in Portfolio.positions
                         # Purchase with the quantity calculated
                         trade_obj: trades.Trade = self.create_trade(
                             account_id=self.account,
@@ -742,58 +1329,75 @@ class Trader():
                             price=None,
                             quantity=quantity
                         )
-
-                        # Preview the order
-                        preview_order_response = trade_obj.preview_order()
-
-                        # Execute the order
-                        execute_order_response = trade_obj.place_order(ignore_warning=True)
-
-                        # Save the exexcute_order_response into a dictionary
-                        order_response = {
-                            'symbol': ticker,
-                            'local_trade_id':execute_order_response[0]['local_order_id'],
-                            'trade_id':execute_order_response[0]['order_id'],
-                            'message':execute_order_response[0]['text'],
-                            'order_status':execute_order_response[0]['order_status'],
-                            'warning_message':execute_order_response[0]['warning_message']
-                        }
-
-                        # Sleep for 0.1 seconds to make sure order is executed on IB server
-                        time_true.sleep(0.1)
-
-                        # Query order to find out market order, price and other info
-                        order_status_response = self.session.get_order_status(trade_id=execute_order_response[0]['order_id'])
-                        order_price = float(order_status_response['exit_strategy_display_price'])
-                        order_quantity = float(order_status_response['size'])
-                        order_status = order_status_response['order_status']
-                        order_asset_type = order_status_response['sec_type']
-                        
-                        # Obtain the time now
-                        time_now = datetime.now(tz=timezone.utc).replace(microsecond=0).isoformat()
-                        
-                        # Add this position onto our Portfolio Object with the data obtained from order_status_response
-                        portfolio_position_dict = self.portfolio.add_position(
-                            symbol=ticker,
-                            asset_type=order_asset_type,
-                            purchase_date=time_now,
-                            purchase_price=order_price,
-                            quantity=order_quantity,
-                            order_status=order_status
-                            # Ownership_status is automatically set to when purchase_date is supplied
-                        )
-
-                        # IMPLEMENT WAIT UNTIL ORDER IS FILLED? #
-
-
-                        # Append the order_response above to the main order_responses list
-                        order_responses.append(order_response)
+                        trade_objs.append(trade_obj)
                     else:
                         pprint(f"Current quote for {ticker} is {quantity} which means it cannot be obtained,\
                              no order has been placed as a result.")
 
+            # Check the orders against the risk limits, preview them if needed and execute them
+            execute_order_responses = self._submit_orders(trade_objs=trade_objs)
+
+            for trade_obj, execute_order_response in zip(trade_objs, execute_order_responses):
+                if execute_order_response is None:
+                    continue
+                ticker = trade_obj.symbol
+
+                # Save the exexcute_order_response into a dictionary
+                order_response = {
+                    'symbol': ticker,
+                    'local_trade_id':execute_order_response[0]['local_order_id'],
+                    'trade_id':execute_order_response[0]['order_id'],
+                    'message':execute_order_response[0]['text'],
+                    'order_status':execute_order_response[0]['order_status'],
+                    'warning_message':execute_order_response[0]['warning_message']
+                }
+
+                # Sleep for 0.1 seconds to make sure order is executed on IB server
+                time_true.sleep(0.1)
+
+                # Query order to find out market order, price and other info
+                order_status_response = self.session.get_order_status(trade_id=execute_order_response[0]['order_id'])
+                order_price = float(order_status_response['exit_strategy_display_price'])
+                order_quantity = float(order_status_response['size'])
+                order_status = order_status_response['order_status']
+                order_asset_type = order_status_response['sec_type']
+                
+                # Obtain the time now
+                time_now = datetime.now(tz=timezone.utc).replace(microsecond=0).isoformat()
+                
+                # Journal the fill, so the position can be rebuilt with OrderJournal.replay() after a restart
+                self.order_journal.record_fill(
+                    symbol=ticker,
+                    side='BUY',
+                    quantity=order_quantity,
+                    price=order_price,
+                    trade_id=execute_order_response[0]['order_id'],
+                    asset_type=order_asset_type,
+                    order_status=order_status,
+                    account=trade_obj.account
+                )
+
+                # Add this position onto our Portfolio Object with the data obtained from order_status_response
+                portfolio_position_dict = self.portfolio.add_position(
+                    symbol=ticker,
+                    asset_type=order_asset_type,
+                    purchase_date=time_now,
+                    purchase_price=order_price,
+                    quantity=order_quantity,
+                    order_status=order_status
+                    # Ownership_status is automatically set to when purchase_date is supplied
+                )
+
+                # IMPLEMENT WAIT UNTIL ORDER IS FILLED? #
+
+
+                # Append the order_response above to the main order_responses list
+                order_responses.append(order_response)
+
         # Check if we have any sells signals
         elif sells:
+            # Create a Trade object for every ticker we own in the portfolio
+            trade_objs: List[trades.Trade] = []
             # Loop through each key value pair in dict
             for ticker,close_position_when_sell in sells.items():
                 # Obtain the conid for the symbol
@@ -828,33 +1432,203 @@ class Trader():
                             price=None,     # price can be None when selling with market order
                             quantity=quantity
                         )
+                        trade_objs.append(trade_obj)
+
+            # Check the orders against the risk limits, preview them if needed and execute them
+            execute_order_responses = self._submit_orders(trade_objs=trade_objs)
+
+            for trade_obj, execute_order_response in zip(trade_objs, execute_order_responses):
+                ticker = trade_obj.symbol
+                if execute_order_response is None:
+                    # The order wasn't placed, so we still own the position
+                    self.portfolio.set_ownership_status(symbol=ticker,ownership=True)
+                    continue
+
+                # Save the exexcute_order_response into a dictionary
+                order_response = {
+                    'symbol': ticker,
+                    'local_trade_id':execute_order_response[0]['local_order_id'],
+                    'trade_id':execute_order_response[0]['order_id'],
+                    'order_status':execute_order_response[0]['order_status'],
+                }
+
+
+                # Sleep for 0.1 seconds to make sure order is executed on IB server
+                time_true.sleep(0.1)
+
+                # Set the quantity of the position to 0 and update order_status, realising the PnL at the fill price
+                sell_price = self._sell_fill_price(trade_id=execute_order_response[0]['order_id'],symbol=ticker)
+                if sell_price is not None:
+                    self.order_journal.record_fill(
+                        symbol=ticker,
+                        side='SELL',
+                        quantity=trade_obj.quantity,
+                        price=sell_price,
+                        trade_id=execute_order_response[0]['order_id'],
+                        asset_type=self.portfolio.positions[ticker]['asset_type'],
+                        order_status=execute_order_response[0]['order_status'],
+                        account=trade_obj.account
+                    )
+                self.portfolio.update_position(
+                    symbol=ticker,
+                    quantity=0,
+                    price=sell_price,
+                    order_status=execute_order_response[0]['order_status']
+                )
+
+                order_responses.append(order_response)
+
+        return order_responses
 
-                        # Preview the order
-                        preview_order_response = trade_obj.preview_order()
 
-                        # Execute the order
-                        execute_order_response = trade_obj.place_order(ignore_warning=True)
+    def _sell_fill_price(self,trade_id:str,symbol:str) -> Optional[float]:
+        """Returns the price a sell was filled at, from its order status as for buys.
+        Falls back to the last price of the symbol, and logs a warning when neither is known,
+        in which case the fill isn't journalled and its PnL isn't realised.
+        """
+        order_status_response = self.session.get_order_status(trade_id=trade_id)
+        try:
+            return float(order_status_response['exit_strategy_display_price'])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+        last_price = self.quote_store.price(symbol=symbol)
+        if last_price is None:
+            logging.warning("There is no fill price for the sell of %s (order %s), the fill isn't journalled.",symbol,trade_id)
+        else:
+            logging.warning("The order status of the sell of %s (order %s) has no fill price, using the last price %s.",symbol,trade_id,last_price)
 
-                        # Save the exexcute_order_response into a dictionary
-                        order_response = {
-                            'symbol': ticker,
-                            'local_trade_id':execute_order_response[0]['local_order_id'],
-                            'trade_id':execute_order_response[0]['order_id'],
-                            'order_status':execute_order_response[0]['order_status'],
-                        }
+        return last_price
 
+    def create_risk_checker(self,limits:risk.RiskLimits,available_cash:float=None) -> risk.PreTradeRiskChecker:
+        """Creates the pre-trade risk checks every order goes through before it is sent.
+        Orders which break a limit are not sent, and orders which clearly pass every limit
+        are placed without a preview.
 
-                        # Sleep for 0.1 seconds to make sure order is executed on IB server
-                        time_true.sleep(0.1)
+        Arguments:
+        ----
+        limits {RiskLimits} -- The limits to check the orders against.
 
-                        # Set positions[symbol]['quantity] to 0 and update order_status
-                        self.portfolio.positions[ticker]['quantity'] = 0
-                        self.portfolio.positions[ticker]['order_status'] = execute_order_response[0]['order_status']
+        available_cash {float} -- The cash available for buys. Default is the cash balance in the
+            base currency of the account data.
 
-                        order_responses.append(order_response)
+        Returns:
+        ----
+        PreTradeRiskChecker -- The risk checks.
 
-        return order_responses
+        Usage:
+        ----
+            >>> trader_portfolio = trader.create_portfolio()
+            >>> risk_checker = trader.create_risk_checker(
+                limits=RiskLimits(max_position_quantity=500,max_symbol_notional=20000,max_orders=5,price_band=0.05)
+            )
+        """
+        if self.portfolio is None:
+            raise ValueError("Create the portfolio with create_portfolio() before the risk checker.")
+
+        if available_cash is None:
+            base_rows = self._account_data[self._account_data['currency'] == 'BASE']
+            if not base_rows.empty:
+                available_cash = float(base_rows['cash balance'].iloc[-1])
+
+        self.risk_checker = risk.PreTradeRiskChecker(
+            portfolio=self.portfolio,
+            limits=limits,
+            quote_store=self.quote_store,
+            available_cash=available_cash
+        )
 
+        return self.risk_checker
+
+    def _submit_orders(self,trade_objs:List[trades.Trade]) -> List[Union[List[Dict],None]]:
+        """Checks a batch of orders against the risk limits, previews them according to the preview policy and places them.
+        Orders which clearly pass the risk limits are not previewed. The previews of the batch are done before
+        any order is placed, so they can run concurrently, see PreviewPolicy.
+
+        Arguments:
+        ----
+        trade_objs {List[trades.Trade]} -- The orders, created with create_trade().
+
+        Returns:
+        ----
+        List[Union[List[Dict],None]] -- The response of place_order() for every order, None for the orders
+            which were rejected by the risk checks, failed their preview or failed to be placed.
+        """
+        approved_trades = []
+        preview_trades = []
+
+        # The approved orders are only recorded once they are placed, until then the batch keeps their running total
+        risk_batch = risk.RiskBatch()
+
+        for trade_obj in trade_objs:
+            notional = None
+            clear_pass = False
+            if self.risk_checker is not None:
+                risk_decision = self.risk_checker.check(
+                    symbol=trade_obj.symbol,
+                    side=trade_obj.side,
+                    quantity=trade_obj.quantity,
+                    price=trade_obj.price,
+                    conid=trade_obj.conid,
+                    batch=risk_batch
+                )
+                if not risk_decision.approved:
+                    logging.warning("The %s order for %s was rejected by the risk checks: %s",trade_obj.side,trade_obj.symbol,' '.join(risk_decision.reasons))
+                    continue
+                notional = risk_decision.notional
+                clear_pass = risk_decision.clear_pass
+                risk_batch.add(symbol=trade_obj.symbol,side=trade_obj.side,quantity=trade_obj.quantity,notional=notional)
+            else:
+                last_price = trade_obj.price if trade_obj.price is not None else self.quote_store.price(conid=trade_obj.conid)
+                notional = abs(trade_obj.quantity) * last_price if last_price is not None else None
+
+            approved_trades.append(trade_obj)
+            # Only orders which don't clearly pass the local limits are left to the preview policy
+            if not clear_pass and self.preview_policy.needs_preview(notional=notional):
+                preview_trades.append(trade_obj)
+
+        preview_errors = self.preview_policy.preview_orders(trade_objs=preview_trades)
+        failed_trades = {id(trade_obj) for trade_obj, error in zip(preview_trades, preview_errors) if error is not None}
+
+        execute_order_responses = {}
+        for trade_obj in approved_trades:
+            if id(trade_obj) in failed_trades:
+                continue
+
+            # One order failing to be placed doesn't stop the others of the batch
+            try:
+                execute_order_response = trade_obj.place_order(ignore_warning=True)
+            except Exception:
+                logging.exception("The %s order for %s failed to be placed.",trade_obj.side,trade_obj.symbol)
+                continue
+            execute_order_responses[id(trade_obj)] = execute_order_response
+
+            # Only an order which has been placed counts towards the risk limits
+            if self.risk_checker is not None:
+                self.risk_checker.record_order(
+                    symbol=trade_obj.symbol,
+                    side=trade_obj.side,
+                    quantity=trade_obj.quantity,
+                    price=trade_obj.price,
+                    conid=trade_obj.conid
+                )
+
+            # Track the state of the order from now on
+            try:
+                self.order_manager.add_order(
+                    trade_id=execute_order_response[0]['order_id'],
+                    conid=trade_obj.conid,
+                    symbol=trade_obj.symbol,
+                    side=trade_obj.side,
+                    quantity=trade_obj.quantity,
+                    local_trade_id=trade_obj.local_trade_id,
+                    account=trade_obj.account,
+                    state=orders.GATEWAY_STATUSES.get(execute_order_response[0]['order_status'],orders.SUBMITTED)
+                )
+            except (KeyError, IndexError, TypeError):
+                logging.warning("The %s order for %s was placed without an order id to track: %r",trade_obj.side,trade_obj.symbol,execute_order_response)
+
+        return [execute_order_responses.get(id(trade_obj)) for trade_obj in trade_objs]
 
     def calculate_buy_quantity(self,ticker:str,conid:str,buy_cash_quantity:float) -> Union[float,None]:
         """Calculate the quantity of stock to buy based on the latest quote and the total buy cash.
@@ -868,13 +1642,14 @@ class Trader():
             Union[float,None]: Depending on whether current quote can be obtained, it returns the quantity \
                 or None
         """
-        # First query the latest quote
-        quotes_dict = self.get_current_quotes(conids=[conid])
+        # Read the latest quote from the quote store, only polling if it is missing or stale
+        current_price = self.quote_store.price(conid=conid,max_age=self.quote_max_age)
+        if current_price is None:
+            self.get_current_quotes(conids=[conid])
+            current_price = self.quote_store.price(conid=conid)
         
-        # Check if the dict contains latest quote data 
-        if quotes_dict.get(ticker):
-            # Convert the price to a float
-            current_price = float(quotes_dict.get(ticker))
+        # Check if there is a latest quote
+        if current_price:
             # Calculate quantity
             quantity = buy_cash_quantity/current_price
             # Round it to 2 d.p
@@ -891,22 +1666,30 @@ class Trader():
         with activity in the current day. Notifications contains information about 
         execute orders as they happen, see status field.
 
+        The live orders are applied to the order manager as a diff, only the orders which have
+        changed since the last poll update their Trade object and their position in the portfolio.
+
         Returns:
         {dict} -- A dictionary containing all the live orders
         """
         live_order_response = self.session.get_live_orders()
+        self._apply_live_orders(live_order_response=live_order_response)
 
+        return live_order_response
+
+    def _apply_live_orders(self, live_order_response: Dict) -> None:
+        """Applies a response of the live orders endpoint to the orders, their Trade objects and the portfolios."""
         # Check if live_order_response contains any data to update
         if live_order_response['snapshot'] is True:
-            # Loop through all the live orders
-            for order in live_order_response['orders']:
-                print(order)
-                symbol = order['ticker']
-                # Check if the order is in portfolio position
-                if self.portfolio.in_portfolio(symbol=symbol):
-                    # Check if the order has order_status 'Submitted' ir 'PreSubmitted'
-                    if self.portfolio.positions[symbol]['order_status'] is 'Submitted' or 'PreSubmitted':
-                        self.portfolio.positions[symbol]['order_status'] = order['status']
-
-        return live_order_response
+            # Only the orders which have changed are returned
+            for order in self.order_manager.apply_live_orders(live_orders=live_order_response):
+                # Keep the Trade object in step with the order
+                trade_obj = self.trades.get(order.local_trade_id)
+                if trade_obj is not None:
+                    trade_obj.order_status = order.gateway_status
+
+                # Check if the order is in the portfolio of its account
+                order_portfolio = self.portfolios.get(order.account, self.portfolio) if order.account else self.portfolio
+                if order_portfolio is not None and order_portfolio.in_portfolio(symbol=order.symbol):
+                    order_portfolio.update_position(symbol=order.symbol,order_status=order.state)
 
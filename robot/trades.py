@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import json
 import re
+import random
+import logging
 import pathlib
 
 from typing import Tuple
@@ -11,7 +13,10 @@ from typing import Optional
 from typing import Union
 from datetime import datetime
 from datetime import timezone
+from concurrent.futures import ThreadPoolExecutor
 from ibw.client import IBClient
+import robot.journal as journal
+import robot.orders as orders
 
 class Trade():
     """
@@ -39,6 +44,7 @@ class Trade():
         self._order_response = {}
         self._triggered_added = False
         self._multi_leg = False
+        self._journal: journal.OrderJournal = None
         self._ib_client:IBClient = None
 
     def create_order(self, account_id:Optional[str], local_trade_id:str, conid:str, ticker:str, security_type:str, order_type: str, side:str, duration:str , 
@@ -230,30 +236,11 @@ class Trade():
 
     def add_to_order_record(self) -> None:
         """
-        Save the order details onto a json file so orders can be viewed later
+        Record the order in the order journal so orders can be viewed later, see OrderJournal.query().
+        The journal writes it from its own thread, so no file is opened on the order path.
         """
-        #Establish the location of order_record.json
-        record_path = pathlib.Path('order_record/orders.jsonc')
-        
-        # Convert IB_Client details in self object into strings so they can be read,
-        # We can't just dump the IBClient object into a json file
-        def default(obj):
-            if isinstance(obj,IBClient):
-                return str(obj)
-        # # Create a directory called 'order_records' in working directory and create a JSON file called 'orders.jsonc'
-        # # Initialise the file with empty list
-        # with open(file=record_path,mode='w+') as order_file:
-        #     json.dump(
-        #         obj=[], #Set up empty list
-        #         fp=order_file,
-        #         indent=4
-        #     )
-        
-        # After a directory is created, open the JSON file and append new data
-        with open(file=record_path,mode='a') as order_file_json:
-            data = self.__dict__
-            order_file_json.write(json.dumps(data,indent=4,default=default))
-            order_file_json.close()
+        order_journal = self._journal if self._journal is not None else journal.default_journal()
+        order_journal.record_order(trade_obj=self)
     
     def cancel_order(self) -> dict:
         """
@@ -264,16 +251,19 @@ class Trade():
         {dict} -- A dictionary object that has keys 'order_id', 'msg','conid','account'
         """
         if self.trade_id:
-            #Check the order_status to see the status of the order
-            if self.order_status=="PreSubmitted":
-                #if order is pre-submitted and not filled, then cancel the order
+            #Check the order_status to see the status of the order, either a gateway status or a state of the OrderManager
+            state = orders.GATEWAY_STATUSES.get(self.order_status, self.order_status)
+            if state in orders.TRANSITIONS and state not in orders.FINAL_STATES:
+                #if order is still open, e.g. pre-submitted, submitted or partially filled, then cancel the order
                 response = self._ib_client.delete_order(account_id=self.account,customer_order_id=self.trade_id)
                 self.order_status = "Cancelled"
+                order_journal = self._journal if self._journal is not None else journal.default_journal()
+                order_journal.record_order(trade_obj=self,event='cancel')
                 return response
-            elif self.order_status == "Filled":
+            elif state == orders.FILLED:
                 #if order is filled already, it can't be cancelled
                 raise RuntimeError("{} has been filled already so it cannot be cancelled.".format(self.trade_id))
-            elif self.order_status == "Cancelled":
+            elif state == orders.CANCELLED:
                 raise RuntimeError("{} has already been cancelled so it cannot be cancelled again.".format(self.trade_id))
             else:
                 raise RuntimeError("The order_status of {} is not specidie/is not defined. Please check the status through IB"
@@ -281,4 +271,97 @@ class Trade():
 
         else:
             RuntimeError("self.trade_id is undefined.")
-        
\ No newline at end of file
+        
+
+
+class PreviewPolicy():
+
+    # The modes of the policy
+    MODES = ['always','off','sampled','threshold']
+
+    def __init__(self, mode: str = 'always', sample_rate: float = 0.1, notional_threshold: float = None,
+    concurrent: bool = False, max_workers: int = 8) -> None:
+        """Decides which orders are previewed with `place_order_scenario` before they are placed.
+
+        Overview:
+        ----
+        A preview is a round trip to the gateway on the way to placing an order. The policy
+        previews every order ('always'), none ('off'), a random share of them ('sampled') or the
+        orders worth at least `notional_threshold` ('threshold', orders without a known value are
+        always previewed). With `concurrent`, the previews of a batch of orders run at the same
+        time before any of the orders is placed, rather than one after the other.
+
+        Arguments:
+        ----
+        mode {str} -- One of ['always','off','sampled','threshold']. (default: {'always'})
+
+        sample_rate {float} -- The share of the orders previewed in the 'sampled' mode. (default: {0.1})
+
+        notional_threshold {float} -- The smallest order value previewed in the 'threshold' mode. (default: {None})
+
+        concurrent {bool} -- Preview the orders of a batch concurrently. (default: {False})
+
+        max_workers {int} -- The most previews running at the same time. (default: {8})
+
+        Usage:
+        ----
+            >>> trader.preview_policy = PreviewPolicy(mode='threshold', notional_threshold=5000, concurrent=True)
+        """
+
+        if mode not in self.MODES:
+            raise ValueError("The preview mode must be one of {modes}.".format(modes=self.MODES))
+        if mode == 'threshold' and notional_threshold is None:
+            raise ValueError("The 'threshold' mode needs a notional_threshold.")
+
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.notional_threshold = notional_threshold
+        self.concurrent = concurrent
+        self.max_workers = max_workers
+
+    def needs_preview(self, notional: Optional[float] = None) -> bool:
+        """Decides whether an order is previewed.
+
+        Arguments:
+        ----
+        notional {float} -- The value of the order, None if it isn't known. (default: {None})
+
+        Returns:
+        ----
+        {bool} -- True if the order is previewed.
+        """
+
+        if self.mode == 'always':
+            return True
+        elif self.mode == 'off':
+            return False
+        elif self.mode == 'sampled':
+            return random.random() < self.sample_rate
+        else:
+            return notional is None or notional >= self.notional_threshold
+
+    def preview_orders(self, trade_objs: List[Trade]) -> List[Optional[Exception]]:
+        """Previews a batch of orders, concurrently if the policy says so.
+
+        Arguments:
+        ----
+        trade_objs {List[Trade]} -- The orders to preview.
+
+        Returns:
+        ----
+        {List[Optional[Exception]]} -- The error of every preview, None for the orders which passed.
+        """
+
+        def preview(trade_obj: Trade) -> Optional[Exception]:
+            try:
+                trade_obj.preview_order()
+            except Exception as error:
+                logging.warning("The preview of the %s order for %s failed: %s", trade_obj.side, trade_obj.symbol, error)
+                return error
+            return None
+
+        if not self.concurrent or len(trade_objs) < 2:
+            return [preview(trade_obj) for trade_obj in trade_objs]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(trade_objs))) as executor:
+            return list(executor.map(preview, trade_objs))
@@ -0,0 +1,8 @@
+import os
+import sys
+
+#The tests import the robot and ibw packages from the root of the repository
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+#These are scripts which need a config file or a running gateway, not tests
+collect_ignore = ['run_client.py', 'test_ticker_signal.py', 'market_data_server.py']
@@ -0,0 +1,214 @@
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import socketserver
+
+from typing import List
+from typing import Dict
+
+from ibw.websocket import accept_key
+from ibw.websocket import decode_frame
+from ibw.websocket import encode_frame
+from ibw.websocket import OPCODE_TEXT
+from ibw.websocket import OPCODE_CLOSE
+from ibw.websocket import OPCODE_PING
+
+# A local stand-in for the streaming endpoint of the Client Portal gateway, so the
+# MarketDataStream can be run without a gateway, a login or market hours.
+# It accepts plain websocket connections, answers the smd+conid/umd+conid subscriptions
+# and pushes market data messages shaped like the gateway's to the subscribers.
+#
+# Run it on its own to stream random trades:
+#   python -m tests.market_data_server --port 5050
+# and point the stream at it:
+#   >>> stream = MarketDataStream(conids={'265598': 'AAPL'}, url='ws://127.0.0.1:5050/v1/api/ws')
+
+
+class MarketDataServer():
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        """A local websocket server which behaves like the market data stream of the gateway.
+
+        Arguments:
+        ----
+        host {str} -- The address to listen on. (default: {'127.0.0.1'})
+
+        port {int} -- The port to listen on, 0 picks a free port. (default: {0})
+        """
+
+        server = self
+
+        class StreamHandler(socketserver.BaseRequestHandler):
+
+            def handle(self):
+                server._handle_client(self.request)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), StreamHandler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address
+        self.url = 'ws://{host}:{port}/v1/api/ws'.format(host=self.host, port=self.port)
+
+        # Every message received from the clients, in order
+        self.received: List[str] = []
+        self.connections = 0
+
+        self._clients: Dict[socket.socket, set] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.drop_connections()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def subscribed_conids(self) -> set:
+        """Returns the conids any client is subscribed to."""
+
+        with self._lock:
+            return set().union(*self._clients.values())
+
+    def subscribers(self, conid: str) -> int:
+        """Returns the number of clients subscribed to a conid."""
+
+        with self._lock:
+            return sum(str(conid) in conids for conids in self._clients.values())
+
+    def push(self, conid: str, fields: Dict[str,object], updated: int = None) -> None:
+        """Sends a market data message for a conid to every client subscribed to it.
+
+        Arguments:
+        ----
+        conid {str} -- The conid.
+
+        fields {Dict[str,object]} -- The fields of the message, e.g. {'31': '133.10', '7059': '100'}.
+
+        updated {int} -- The epoch ms of the update. (default: {now})
+        """
+
+        message = {
+            'server_id': 'q0',
+            'conid': int(conid),
+            '_updated': updated if updated is not None else int(time.time() * 1000),
+            'topic': 'smd+{conid}'.format(conid=conid)
+        }
+        message.update(fields)
+        frame = encode_frame(payload=json.dumps(message).encode('utf-8'), opcode=OPCODE_TEXT, mask=False)
+
+        with self._lock:
+            clients = [client for client, conids in self._clients.items() if str(conid) in conids]
+
+        for client in clients:
+            try:
+                client.sendall(frame)
+            except OSError:
+                pass
+
+    def drop_connections(self) -> None:
+        """Closes every connection, as the gateway does when the session times out."""
+
+        with self._lock:
+            clients = list(self._clients.keys())
+            self._clients.clear()
+
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+                client.close()
+            except OSError:
+                pass
+
+    def _handle_client(self, client: socket.socket) -> None:
+        request = bytearray()
+        while b'\r\n\r\n' not in request:
+            chunk = client.recv(4096)
+            if not chunk:
+                return
+            request += chunk
+
+        header_block, _, remainder = bytes(request).partition(b'\r\n\r\n')
+        headers = {}
+        for line in header_block.decode('latin-1').split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        client.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+        ).format(accept=accept_key(headers['sec-websocket-key'].encode('ascii')).decode('ascii')).encode('latin-1'))
+
+        with self._lock:
+            self._clients[client] = set()
+            self.connections += 1
+
+        buffer = bytearray(remainder)
+        try:
+            while True:
+                frame = decode_frame(buffer)
+                if frame is None:
+                    chunk = client.recv(65536)
+                    if not chunk:
+                        break
+                    buffer += chunk
+                    continue
+
+                _, opcode, payload, frame_size = frame
+                del buffer[:frame_size]
+
+                if opcode == OPCODE_CLOSE:
+                    break
+                if opcode == OPCODE_PING:
+                    continue
+
+                self._handle_message(client=client, message=payload.decode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._clients.pop(client, None)
+
+    def _handle_message(self, client: socket.socket, message: str) -> None:
+        with self._lock:
+            self.received.append(message)
+            conids = self._clients.get(client)
+            if conids is None:
+                return
+
+            if message.startswith('smd+'):
+                conids.add(message.split('+')[1])
+            elif message.startswith('umd+'):
+                conids.discard(message.split('+')[1])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Streams random trades like the Client Portal gateway.')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--interval', type=float, default=0.2, help='Seconds between the trades of a conid.')
+    arguments = parser.parse_args()
+
+    market_data_server = MarketDataServer(port=arguments.port)
+    market_data_server.start()
+    print('Streaming on {url}'.format(url=market_data_server.url))
+
+    last_prices = {}
+    while True:
+        for conid in market_data_server.subscribed_conids():
+            last_price = last_prices.get(conid, 100.0) * (1 + random.gauss(0, 0.0005))
+            last_prices[conid] = last_price
+            market_data_server.push(conid=conid, fields={
+                '31': '{price:.2f}'.format(price=last_price),
+                '7059': str(random.randint(1, 10) * 100),
+                '84': '{price:.2f}'.format(price=last_price - 0.01),
+                '86': '{price:.2f}'.format(price=last_price + 0.01)
+            })
+
+        time.sleep(arguments.interval)
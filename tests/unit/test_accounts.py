@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+from robot.orders import OrderManager
+from robot.quotes import QuoteStore
+from robot.trader import Trader
+
+
+class FakeSession:
+
+    def __init__(self, quantities):
+        self.quantities = quantities
+
+    def portfolio_accounts(self):
+        return [{'id': account_id, 'accountId': account_id} for account_id in self.quantities]
+
+    def portfolio_sub_accounts(self):
+        return [{'id': 'SUB1'}]
+
+    def portfolio_positions_invalidate(self, account_id):
+        pass
+
+    def portfolio_account_positions(self, account_id, page_id=0):
+        if self.quantities[account_id] is None:
+            raise RuntimeError('The gateway timed out.')
+        return [{'ticker': 'AAPL', 'assetClass': 'STK', 'position': self.quantities[account_id], 'mktPrice': 130.0, 'avgPrice': 120.0}]
+
+    def portfolio_accounts_allocation(self, account_ids):
+        return {'accounts': account_ids}
+
+
+def make_trader(session):
+    trader = Trader.__new__(Trader)
+    trader.account = 'A'
+    trader.accounts = ['A']
+    trader.session = session
+    trader.quote_store = QuoteStore()
+    trader.stock_frame = None
+    trader.portfolio = None
+    trader.portfolios = {}
+    trader._position_pages = {}
+    trader._account_symbols = {}
+    return trader
+
+
+def test_every_account_gets_a_portfolio():
+    trader = make_trader(session=FakeSession(quantities={'A': 10, 'B': 5}))
+
+    assert trader.load_accounts() == ['A', 'B']
+    assert trader.portfolio is trader.portfolios['A']
+    assert trader.portfolios['B'].account == 'B'
+    # The portfolios share the quotes of the Trader
+    assert trader.portfolios['B'].quote_store is trader.quote_store
+
+
+def test_an_account_the_session_cannot_see_raises():
+    trader = make_trader(session=FakeSession(quantities={'A': 10}))
+
+    with pytest.raises(ValueError):
+        trader.load_accounts(account_ids=['A', 'Z'])
+
+
+def test_sub_accounts_are_listed_on_request():
+    trader = make_trader(session=FakeSession(quantities={'A': 10}))
+
+    assert trader.load_accounts(sub_accounts=True) == ['SUB1']
+
+
+def test_positions_are_loaded_into_the_portfolio_of_their_account():
+    trader = make_trader(session=FakeSession(quantities={'A': 10, 'B': 5}))
+    trader.load_accounts()
+
+    positions = trader.load_accounts_positions()
+
+    assert sorted(positions) == ['A', 'B']
+    assert trader.portfolios['A'].positions['AAPL']['quantity'] == 10
+    assert trader.portfolios['B'].positions['AAPL']['quantity'] == 5
+
+
+def test_an_account_whose_request_fails_is_left_out():
+    trader = make_trader(session=FakeSession(quantities={'A': 10, 'B': None}))
+    trader.load_accounts()
+
+    positions = trader.load_accounts_positions()
+
+    assert list(positions) == ['A']
+    assert not trader.portfolios['B'].positions
+
+
+def test_the_accounts_are_aggregated():
+    trader = make_trader(session=FakeSession(quantities={'A': 10, 'B': 5}))
+    trader.load_accounts()
+    trader.load_accounts_positions()
+
+    metrics = trader.aggregate_metrics()
+    positions = trader.aggregate_positions()
+
+    assert metrics['positions'] == 2
+    assert metrics['market_value'] == pytest.approx(
+        metrics['accounts']['A']['market_value'] + metrics['accounts']['B']['market_value']
+    )
+    assert list(positions.index) == [('A', 'AAPL'), ('B', 'AAPL')]
+    assert positions.groupby('symbol')['quantity'].sum()['AAPL'] == 15
+    assert trader.accounts_allocation() == {'accounts': ['A', 'B']}
+
+
+def test_no_portfolios_aggregate_to_an_empty_frame():
+    trader = make_trader(session=FakeSession(quantities={}))
+
+    positions = trader.aggregate_positions()
+
+    assert positions.empty
+    assert positions.index.names == ['account', 'symbol']
+
+
+class ConcurrentSession(FakeSession):
+    """Every request waits until the ledgers, the positions and the live orders have all been requested."""
+
+    def __init__(self, quantities):
+        super().__init__(quantities=quantities)
+        self.barrier = threading.Barrier(parties=2 * len(quantities) + 1, timeout=5)
+
+    def portfolio_account_ledger(self, account_id):
+        self.barrier.wait()
+        return {}
+
+    def portfolio_account_positions(self, account_id, page_id=0):
+        self.barrier.wait()
+        return super().portfolio_account_positions(account_id=account_id, page_id=page_id)
+
+    def get_live_orders(self):
+        self.barrier.wait()
+        return {'snapshot': True, 'orders': [
+            {'orderId': 1, 'status': 'Submitted', 'filledQuantity': 0, 'totalSize': 5, 'acct': 'B', 'ticker': 'AAPL', 'conid': 265598, 'side': 'BUY'}
+        ]}
+
+
+def test_ledgers_positions_and_live_orders_are_requested_at_the_same_time():
+    trader = make_trader(session=ConcurrentSession(quantities={'A': 10, 'B': 5}))
+    trader.accounts_data = {}
+    trader.order_manager = OrderManager()
+    trader.trades = {}
+    trader.load_accounts()
+
+    #A request made after another one has finished would break the barrier
+    results = trader.update_accounts()
+
+    assert sorted(results['accounts_data']) == ['A', 'B']
+    assert {account_id: len(positions) for account_id, positions in results['positions'].items()} == {'A': 1, 'B': 1}
+    #The order is applied to the portfolio of its account once the positions are loaded
+    assert trader.portfolios['B'].positions['AAPL']['order_status'] == 'Submitted'
+    assert trader.portfolios['A'].positions['AAPL']['order_status'] == 'Filled'
@@ -0,0 +1,116 @@
+import operator
+
+import numpy as np
+import pytest
+
+from robot.backtester import Backtester, FillModel
+from robot.indicator import Indicators
+from robot.stock_frame import StockFrame
+
+START = 1600000020000 - 1600000020000 % 3600000
+
+
+def make_stock_frame(closes, symbol='AAPL'):
+    bars = [
+        {'symbol': symbol, 'datetime': START + i * 60000, 'open': close + 0.5, 'close': close, 'high': close + 1.0, 'low': close - 1.0, 'volume': 100}
+        for i, close in enumerate(closes)
+    ]
+    return StockFrame(data=bars)
+
+
+def make_strategy(stock_frame):
+    #An sma over 1 bar is the close, buy at 10 or below and sell at 20 or above
+    indicators = Indicators(price_df=stock_frame)
+    indicators.sma(period=1)
+    indicators.set_indicator_signal(indicator='sma', buy=10.0, sell=20.0, condition_buy=operator.le, condition_sell=operator.ge)
+    return indicators
+
+
+def test_signals_are_filled_at_the_next_open():
+    stock_frame = make_stock_frame(closes=[15.0, 9.0, 12.0, 21.0, 18.0, 8.0, 14.0])
+
+    results = Backtester(price_df=stock_frame, indicator_client=make_strategy(stock_frame)).run()
+    trades = results['trades']
+
+    assert trades['entry_price'].tolist() == [12.5, 14.5]
+    assert trades['exit_price'].iloc[0] == 18.5
+    assert trades['is_open'].tolist() == [False, True]
+    #The open position is marked at the last close
+    assert trades['pnl'].tolist() == pytest.approx([6.0, -0.5])
+    assert results['equity_curve'].iloc[-1] == pytest.approx(100000.0 + 6.0 - 0.5)
+    assert results['stats']['trades'] == 2
+    assert results['stats']['open_trades'] == 1
+    assert results['stats']['win_rate'] == 1.0
+
+
+def test_slippage_and_commissions_are_charged():
+    stock_frame = make_stock_frame(closes=[15.0, 9.0, 12.0, 21.0, 18.0])
+    fill_model = FillModel(fill_on='close', slippage_bps=100, commission_per_share=0.01, min_commission=1.0)
+
+    trades = Backtester(price_df=stock_frame, indicator_client=make_strategy(stock_frame), fill_model=fill_model).run()['trades']
+
+    assert trades['entry_price'].iloc[0] == pytest.approx(9.0 * 1.01)
+    assert trades['exit_price'].iloc[0] == pytest.approx(21.0 * 0.99)
+    assert trades['commission'].iloc[0] == 2.0
+    assert trades['pnl'].iloc[0] == pytest.approx(21.0 * 0.99 - 9.0 * 1.01 - 2.0)
+
+
+def test_the_backtest_matches_a_bar_by_bar_replay():
+    rng = np.random.default_rng(1)
+    bars = []
+    for symbol in ['AAPL', 'MSFT', 'TSLA']:
+        closes = 100 + np.cumsum(rng.normal(size=500))
+        for i, close in enumerate(closes):
+            bars.append({'symbol': symbol, 'datetime': START + i * 60000, 'open': close + rng.normal() * 0.1, 'close': close,
+                         'high': close + 1, 'low': close - 1, 'volume': 100})
+    stock_frame = StockFrame(data=bars)
+    indicators = Indicators(price_df=stock_frame)
+    indicators.rsi(period=14)
+    indicators.set_indicator_signal(indicator='rsi', buy=30, sell=70, condition_buy=operator.le, condition_sell=operator.ge)
+    indicators.set_ticker_indicator_signal(ticker='TSLA', indicator='rsi', buy_cash_quantity=1000, buy=35, sell=60,
+                                           condition_buy=operator.le, condition_sell=operator.ge)
+    fill_model = FillModel(slippage_bps=5, commission_per_share=0.01, min_commission=1.0)
+
+    trades = Backtester(price_df=stock_frame, indicator_client=indicators, fill_model=fill_model).run()['trades']
+
+    expected_pnls = []
+    for symbol in ['AAPL', 'MSFT', 'TSLA']:
+        symbol_frame = stock_frame.get_symbol_frame(symbol=symbol)
+        held = None
+        for k in range(len(symbol_frame) - 1):
+            rsi = symbol_frame['rsi'].iloc[k]
+            buy = rsi <= 30 or (symbol == 'TSLA' and rsi <= 35)
+            sell = rsi >= 70 or (symbol == 'TSLA' and rsi >= 60)
+            if buy and held is None:
+                quantity = round(1000 / symbol_frame['close'].iloc[k], 2) if symbol == 'TSLA' else 1.0
+                held = (quantity, symbol_frame['open'].iloc[k + 1] * (1 + 5e-4))
+            elif sell and not buy and held is not None:
+                quantity, entry_price = held
+                exit_price = symbol_frame['open'].iloc[k + 1] * (1 - 5e-4)
+                expected_pnls.append(quantity * (exit_price - entry_price) - 2 * max(quantity * 0.01, 1.0))
+                held = None
+
+    closed_trades = trades[~trades['is_open']]
+    assert len(expected_pnls) > 0
+    np.testing.assert_allclose(sorted(closed_trades['pnl']), sorted(expected_pnls))
+
+
+def test_unsupported_signals_raise():
+    stock_frame = make_stock_frame(closes=[15.0, 9.0, 12.0])
+    indicators = Indicators(price_df=stock_frame)
+    indicators.sma(period=1)
+    indicators.set_indicator_signal(indicator='sma', buy=10.0, sell=20.0, condition_buy=operator.le, condition_sell=operator.ge,
+                                    buy_max=5.0, condition_buy_max=operator.ge)
+
+    with pytest.raises(ValueError, match='buy_max'):
+        Backtester(price_df=stock_frame, indicator_client=indicators).run()
+
+    #Registered the way set_ticker_indicator_signal_compare() keys a comparison
+    indicators = make_strategy(stock_frame)
+    indicators._ticker_indicators_comp_key.append(('AAPL', 'sma_comp_ema'))
+
+    with pytest.raises(ValueError, match='comparison'):
+        Backtester(price_df=stock_frame, indicator_client=indicators).run()
+
+    with pytest.raises(ValueError):
+        FillModel(fill_on='previous_close')
@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+
+from robot.bar_builder import BarBuilder
+from robot.stock_frame import StockFrame
+
+# The start of a minute, in epoch ms
+START = 1600000020000 - 1600000020000 % 60000
+
+
+class Clock():
+
+    def __init__(self, now: float) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ticks_are_aggregated_in_trade_time_order():
+    bar_builder = BarBuilder(grace_period=2.0, clock=Clock(now=START / 1000))
+
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=10.0, size=1, timestamp=START + 1000)
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=12.0, size=1, timestamp=START + 5000)
+    #Arrives after the trade at 5s but happened before it
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=9.0, size=2, timestamp=START + 3000)
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=8.0, size=1, timestamp=START + 500)
+
+    assert bar_builder.open_bar(conid='1') == {
+        'symbol': 'AAPL', 'datetime': START, 'open': 8.0, 'close': 12.0, 'high': 12.0, 'low': 8.0, 'volume': 5
+    }
+
+
+def test_duplicate_ticks_are_only_counted_once():
+    bar_builder = BarBuilder()
+
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=10.0, size=1, timestamp=START + 1000)
+    assert not bar_builder.add_tick(conid='1', symbol='AAPL', price=10.0, size=1, timestamp=START + 1000)
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=10.0, size=1, timestamp=START + 1000, tick_id='a')
+    assert not bar_builder.add_tick(conid='1', symbol='AAPL', price=11.0, size=3, timestamp=START + 2000, tick_id='a')
+
+    assert bar_builder.open_bar(conid='1')['volume'] == 2
+    assert (bar_builder.ticks, bar_builder.duplicate_ticks) == (4, 2)
+
+
+def test_bars_wait_for_late_ticks_during_the_grace_period():
+    finished = []
+    bar_builder = BarBuilder(grace_period=2.0, on_bar=finished.append)
+    bar_builder.add_tick(conid='1', symbol='AAPL', price=10.0, size=1, timestamp=START + 1000)
+    bar_builder.add_tick(conid='1', symbol='AAPL', price=11.0, size=1, timestamp=START + 61000)
+
+    assert bar_builder.flush(now=(START + 61000) / 1000) == []
+    assert bar_builder.next_flush_time() == (START + 60000) / 1000 + 2.0
+
+    #Late, but within the grace period
+    assert bar_builder.add_tick(conid='1', symbol='AAPL', price=8.0, size=1, timestamp=START + 59000)
+    finished_bars = bar_builder.flush(now=(START + 62000) / 1000)
+
+    assert finished_bars == finished
+    assert [(bar['datetime'], bar['close'], bar['low'], bar['volume']) for bar in finished_bars] == [(START, 8.0, 8.0, 2)]
+    #The bar is finished, so a trade in it is too late
+    assert not bar_builder.add_tick(conid='1', symbol='AAPL', price=8.0, size=1, timestamp=START + 59500)
+    assert bar_builder.late_ticks == 1
+    assert bar_builder.open_bar(conid='1')['datetime'] == START + 60000
+    assert bar_builder.wait_for_bars(timeout=0) == finished_bars
+    assert bar_builder.wait_for_bars(timeout=0) == []
+
+
+def test_finished_bars_are_added_to_the_stock_frame():
+    stock_frame = StockFrame(data=[{'symbol': 'AAPL', 'datetime': START - 60000, 'open': 1.0, 'close': 1.0, 'high': 1.0, 'low': 1.0, 'volume': 1}])
+    bar_builder = BarBuilder(price_df=stock_frame, grace_period=0.0)
+    bar_builder.add_tick(conid='1', symbol='AAPL', price=10.0, size=5, timestamp=START + 1000)
+    bar_builder.add_tick(conid='2', symbol='MSFT', price=20.0, size=5, timestamp=START + 1000)
+
+    bar_builder.flush(now=(START + 60000) / 1000)
+
+    assert stock_frame.symbol_slices == {'AAPL': slice(0, 2), 'MSFT': slice(2, 3)}
+    assert stock_frame.get_symbol_frame(symbol='MSFT')['close'].tolist() == [20.0]
+
+
+def test_the_background_thread_finishes_bars_on_time():
+    stock_frame = StockFrame.from_columns(symbol='AAPL', t=np.array([0]), o=np.ones(1), h=np.ones(1), l=np.ones(1), c=np.ones(1), v=np.ones(1))
+    bar_builder = BarBuilder(price_df=stock_frame, grace_period=0.05)
+    #200ms bars, so the test doesn't wait for a whole minute
+    bar_builder.bar_width = 200
+    bar_builder.start()
+
+    try:
+        timestamp = int(time.time() * 1000)
+        bar_builder.add_tick(conid='1', symbol='AAPL', price=5.0, size=1, timestamp=timestamp)
+        finished_bars = bar_builder.wait_for_bars(timeout=2.0)
+    finally:
+        bar_builder.stop()
+
+    assert [bar['close'] for bar in finished_bars] == [5.0]
+    assert len(stock_frame.frame) == 2
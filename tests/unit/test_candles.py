@@ -0,0 +1,85 @@
+import math
+
+import numpy as np
+
+from ibw import client
+from ibw.client import _decode_json
+from robot.stock_frame import candle_columns
+from robot.trader import Trader
+
+START = 1600000020000 - 1600000020000 % 3600000
+
+
+def make_candles(count, price=100.0):
+    return [
+        {'t': START + i * 60000, 'o': price + i, 'c': price + i + 0.5, 'h': price + i + 1.0, 'l': price + i - 1.0, 'v': 100 + i}
+        for i in range(count)
+    ]
+
+
+def test_bodies_are_decoded_with_and_without_orjson(monkeypatch):
+    body = b'{"symbol":"AAPL","data":[{"t":1600000020000,"c":133.11}]}'
+
+    decoded = _decode_json(content=body)
+    monkeypatch.setattr(client, 'orjson', None)
+
+    assert decoded == {'symbol': 'AAPL', 'data': [{'t': 1600000020000, 'c': 133.11}]}
+    assert _decode_json(content=body) == decoded
+
+
+def test_bodies_holding_nan_fall_back_to_the_standard_library():
+    decoded = _decode_json(content=b'{"c":NaN}')
+
+    assert math.isnan(decoded['c'])
+
+
+def test_candles_are_read_into_typed_columns():
+    columns = candle_columns(candles=make_candles(count=3))
+
+    assert sorted(columns) == ['close', 'datetime', 'high', 'low', 'open', 'volume']
+    assert columns['datetime'].dtype == np.int64
+    assert all(columns[column].dtype == np.float64 for column in ['open', 'close', 'high', 'low', 'volume'])
+    assert columns['datetime'].tolist() == [START, START + 60000, START + 120000]
+    assert columns['close'].tolist() == [100.5, 101.5, 102.5]
+
+
+def test_no_candles_give_empty_columns():
+    columns = candle_columns(candles=[])
+
+    assert all(len(values) == 0 for values in columns.values())
+
+
+class HistorySession:
+
+    def __init__(self, histories):
+        self.histories = histories
+
+    def market_data_history(self, conid, period, bar):
+        symbol, candles = self.histories[conid]
+        return {'symbol': symbol, 'data': candles}
+
+
+def test_historical_prices_of_every_conid_are_aggregated():
+    trader = Trader.__new__(Trader)
+    trader.historical_prices = {}
+    trader.session = HistorySession(histories={'265598': ('AAPL', make_candles(count=3)), '272093': ('MSFT', make_candles(count=2, price=200.0))})
+
+    historical_prices = trader.get_historical_prices(period='1d', bar='1min', conids=['265598', '272093'])
+
+    aggregated = historical_prices['aggregated']
+    assert aggregated['symbol'].tolist() == ['AAPL', 'AAPL', 'AAPL', 'MSFT', 'MSFT']
+    assert aggregated['close'].tolist() == [100.5, 101.5, 102.5, 200.5, 201.5]
+    assert historical_prices['MSFT']['columns']['datetime'].tolist() == [START, START + 60000]
+    assert len(historical_prices['AAPL']['candles']) == 3
+
+
+def test_no_conids_aggregate_to_empty_columns():
+    trader = Trader.__new__(Trader)
+    trader.historical_prices = {}
+    trader.session = HistorySession(histories={})
+
+    aggregated = trader.get_historical_prices(period='1d', bar='1min', conids=[])['aggregated']
+
+    assert aggregated['symbol'].dtype == object
+    assert aggregated['datetime'].dtype == np.int64
+    assert all(len(values) == 0 for values in aggregated.values())
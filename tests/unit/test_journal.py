@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+from robot.journal import OrderJournal
+from robot.portfolio import Portfolio
+from robot.quotes import QuoteStore
+from robot.trader import Trader
+
+
+class FakeTrade():
+
+    def __init__(self, trade_id='1', symbol='AAPL', order_status='Submitted'):
+        self.local_trade_id = 'L' + trade_id
+        self.trade_id = trade_id
+        self.account = 'U1'
+        self.symbol = symbol
+        self.conid = 265598
+        self.side = 'BUY'
+        self.quantity = 10
+        self.price = None
+        self.order_type = 'MKT'
+        self.asset_type = 'STK'
+        self.order_status = order_status
+        self.total_cost = 0.0
+        self._ib_client = object()
+
+
+def test_orders_and_fills_are_written_one_per_line(tmp_path):
+    path = tmp_path / 'order_record' / 'orders.jsonl'
+
+    with OrderJournal(path=path) as order_journal:
+        order_journal.record_order(trade_obj=FakeTrade())
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=100.0, trade_id='1')
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record['event'] for record in records] == ['order', 'fill']
+    #The client of the trade isn't journalled
+    assert '_ib_client' not in records[0]
+    assert (records[0]['local_trade_id'], records[0]['order_status']) == ('L1', 'Submitted')
+    assert (records[1]['price'], records[1]['quantity']) == (100.0, 10)
+
+
+def test_flush_writes_and_syncs_the_queued_records(tmp_path):
+    order_journal = OrderJournal(path=tmp_path / 'orders.jsonl', flush_interval=60.0)
+    batches = []
+    order_journal.add_listener(batches.append)
+
+    for i in range(100):
+        order_journal.record_order(trade_obj=FakeTrade(trade_id=str(i)))
+
+    assert order_journal.flush(timeout=5.0)
+    assert order_journal.records_written == 100
+    assert order_journal.fsyncs == 1
+    assert sum(len(batch) for batch in batches) == 100
+    order_journal.close()
+
+    with pytest.raises(ValueError):
+        order_journal.record_order(trade_obj=FakeTrade())
+
+
+def test_query_filters_the_records(tmp_path):
+    with OrderJournal(path=tmp_path / 'orders.jsonl') as order_journal:
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=100.0, trade_id='1')
+        order_journal.record_fill(symbol='MSFT', side='BUY', quantity=1, price=200.0, trade_id='2')
+        order_journal.record_order(trade_obj=FakeTrade(trade_id='3'))
+
+        assert [record['trade_id'] for record in order_journal.query(event='fill')] == ['1', '2']
+        assert [record['trade_id'] for record in order_journal.query(symbol='AAPL')] == ['1', '3']
+        assert order_journal.query(trade_id=2)[0]['symbol'] == 'MSFT'
+        assert order_journal.query(end=0) == []
+
+
+def test_a_torn_line_is_skipped_and_the_next_record_starts_a_new_line(tmp_path):
+    path = tmp_path / 'orders.jsonl'
+    with OrderJournal(path=path) as order_journal:
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=100.0)
+    with open(path, mode='ab') as journal_file:
+        journal_file.write(b'{"ts":1,"event":"fi')
+
+    with OrderJournal(path=path) as order_journal:
+        order_journal.record_fill(symbol='MSFT', side='BUY', quantity=1, price=200.0)
+        records = order_journal.query()
+
+    assert [record['symbol'] for record in records] == ['AAPL', 'MSFT']
+
+
+def test_replay_rebuilds_the_positions_and_realised_pnl(tmp_path):
+    with OrderJournal(path=tmp_path / 'orders.jsonl') as order_journal:
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=100.0)
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=110.0)
+        order_journal.record_fill(symbol='AAPL', side='SELL', quantity=5, price=120.0)
+        order_journal.record_fill(symbol='MSFT', side='BUY', quantity=1, price=200.0)
+        order_journal.record_fill(symbol='MSFT', side='SELL', quantity=1, price=210.0)
+
+        portfolio = order_journal.replay(portfolio=Portfolio(account_id='U1'))
+
+    assert portfolio.positions['AAPL']['quantity'] == 15
+    assert portfolio.positions['AAPL']['purchase_price'] == pytest.approx(105.0)
+    assert portfolio.realized_pnl() == pytest.approx(5 * 15.0 + 10.0)
+    assert portfolio.get_ownership_status(symbol='AAPL')
+    assert not portfolio.get_ownership_status(symbol='MSFT')
+
+
+def test_fills_are_replayed_into_the_portfolio_of_their_account(tmp_path):
+    trader = Trader.__new__(Trader)
+    trader.account = 'U1'
+    trader.portfolio = Portfolio(account_id='U1')
+    trader.portfolios = {'U1': trader.portfolio, 'U2': Portfolio(account_id='U2')}
+
+    with OrderJournal(path=tmp_path / 'orders.jsonl') as order_journal:
+        trader.order_journal = order_journal
+        order_journal.record_order(trade_obj=FakeTrade())
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=100.0, account='U1')
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=4, price=101.0, account='U2')
+        #An account which isn't served is left out, a fill journaled without an account is the Trader's own
+        order_journal.record_fill(symbol='AAPL', side='BUY', quantity=7, price=102.0, account='U3')
+        order_journal.record_fill(symbol='MSFT', side='BUY', quantity=1, price=200.0)
+
+        assert trader.restore_positions() is trader.portfolio
+
+    assert [record['account'] for record in order_journal.query()] == ['U1', 'U1', 'U2', 'U3', None]
+    assert trader.portfolios['U1'].positions['AAPL']['quantity'] == 10
+    assert trader.portfolios['U2'].positions['AAPL']['quantity'] == 4
+    assert trader.portfolios['U1'].positions['MSFT']['quantity'] == 1
+    assert not trader.portfolios['U2'].in_portfolio(symbol='MSFT')
+
+
+class OrderStatusSession():
+
+    def __init__(self, order_status):
+        self.order_status = order_status
+
+    def get_order_status(self, trade_id):
+        return self.order_status
+
+
+@pytest.mark.parametrize('order_status,last_price,fill_price', [
+    ({'exit_strategy_display_price': '121.5'}, 120.0, 121.5),
+    ({}, 120.0, 120.0),
+    ({'exit_strategy_display_price': None}, None, None)
+])
+def test_sells_are_journalled_at_their_fill_price(order_status, last_price, fill_price):
+    trader = Trader.__new__(Trader)
+    trader.session = OrderStatusSession(order_status=order_status)
+    trader.quote_store = QuoteStore()
+    if last_price is not None:
+        trader.quote_store.update(conid='1', symbol='AAPL', last=last_price)
+
+    assert trader._sell_fill_price(trade_id='1', symbol='AAPL') == fill_price
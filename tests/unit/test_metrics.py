@@ -0,0 +1,73 @@
+import json
+import random
+
+import requests
+
+from ibw.client import IBClient
+from ibw.metrics import EndpointMetrics, MetricsRegistry, endpoint_label, request_body_size
+
+
+def test_ids_are_taken_out_of_the_endpoint_labels():
+    assert endpoint_label('portfolio/U1234567/positions/0') == 'portfolio/{id}/positions/{id}'
+    assert endpoint_label('/iserver/marketdata/history?conid=265598') == 'iserver/marketdata/history'
+
+
+def test_latency_percentiles_are_within_their_bucket():
+    rng = random.Random(0)
+    latencies = sorted(rng.lognormvariate(-2, 1) for _ in range(5000))
+    endpoint_metrics = EndpointMetrics()
+    for latency in latencies:
+        endpoint_metrics.observe(latency=latency, bytes_sent=0, bytes_received=0, error=False)
+
+    for percentile in (50, 95, 99):
+        #The buckets are 2 ** 0.5 wide
+        exact = latencies[int(percentile / 100 * len(latencies))]
+        assert exact / 2 ** 0.5 <= endpoint_metrics.latency_percentile(percentile) <= exact * 2 ** 0.5
+
+    assert EndpointMetrics().latency_percentile(50) is None
+
+
+def test_the_registry_counts_requests_per_endpoint():
+    registry = MetricsRegistry()
+    registry.request_started(method='POST', endpoint='iserver/account/U1/orders')
+    assert registry.snapshot()[('POST', 'iserver/account/{id}/orders')]['in_flight'] == 1
+
+    registry.request_finished(method='POST', endpoint='iserver/account/U1/orders', latency=0.05, bytes_sent=50, bytes_received=10, error=True)
+    registry.request_started(method='POST', endpoint='iserver/account/U2/orders')
+    registry.request_finished(method='POST', endpoint='iserver/account/U2/orders', latency=0.1, bytes_sent=20, bytes_received=10)
+
+    metrics = registry.snapshot()[('POST', 'iserver/account/{id}/orders')]
+    assert (metrics['requests'], metrics['errors'], metrics['in_flight']) == (2, 1, 0)
+    assert (metrics['bytes_sent'], metrics['bytes_received']) == (70, 20)
+    assert metrics['latency_max'] == 0.1
+    assert 'ibw_requests_total{method="POST",endpoint="iserver/account/{id}/orders"} 2' in registry.to_text()
+
+
+class SentResponse():
+
+    def __init__(self, payload):
+        prepared_request = requests.Request(method='POST', url='https://localhost:5000/v1/api/iserver/a', json=payload).prepare()
+        self.request = prepared_request
+        self.status_code = 200
+        self.ok = True
+        self.headers = {'Content-Type': 'application/json'}
+        self.content = b'{}'
+        self.text = '{}'
+
+
+class SendingTransport():
+
+    def request(self, method, url, headers=None, params=None, json=None):
+        return SentResponse(payload=json)
+
+
+def test_the_bytes_sent_are_the_body_requests_sent():
+    payload = {'orders': [{'conid': 265598, 'quantity': 10}]}
+
+    assert request_body_size(SentResponse(payload=payload)) == len(json.dumps(payload))
+    assert request_body_size(object()) == 0
+
+    ib_client = IBClient(username='IB_PAPER_USERNAME', account='IB_PAPER_ACCOUNT', client_gateway_path='.', transport=SendingTransport())
+    ib_client._make_request(endpoint='iserver/a', req_type='POST', json=payload)
+
+    assert ib_client.metrics.snapshot()[('POST', 'iserver/a')]['bytes_sent'] == len(json.dumps(payload))
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from multiprocessing import shared_memory
+
+from robot import optimizer
+from robot.optimizer import ParameterSweep
+from robot.stock_frame import StockFrame
+
+START = 1600000020000 - 1600000020000 % 3600000
+
+
+@pytest.fixture
+def stock_frame():
+    rng = np.random.default_rng(0)
+    bars = []
+    for symbol in ['AAPL', 'MSFT']:
+        closes = 100.0 + np.cumsum(rng.normal(size=200))
+        bars.extend(
+            {'symbol': symbol, 'datetime': START + i * 60000, 'open': close, 'close': close, 'high': close + 1.0, 'low': close - 1.0, 'volume': 100}
+            for i, close in enumerate(closes)
+        )
+    return StockFrame(data=bars)
+
+
+def test_grid_covers_every_combination(stock_frame):
+    sweep = ParameterSweep(price_df=stock_frame)
+
+    parameters = sweep.grid(parameter_grid={'period': [5, 10], 'buy': [30.0, 40.0], 'sell': [60.0]})
+
+    assert len(parameters) == 4
+    assert {'period': 10, 'buy': 40.0, 'sell': 60.0} in parameters
+
+
+def test_random_sample_respects_the_bounds(stock_frame):
+    sweep = ParameterSweep(price_df=stock_frame)
+
+    parameters = sweep.random_sample(parameter_space={'period': (5, 20), 'buy': (20.0, 30.0), 'sell': [70.0, 80.0]}, samples=50, seed=1)
+
+    assert all(isinstance(combination['period'], int) and 5 <= combination['period'] <= 20 for combination in parameters)
+    assert all(20.0 <= combination['buy'] <= 30.0 for combination in parameters)
+    assert {combination['sell'] for combination in parameters} <= {70.0, 80.0}
+    assert parameters == sweep.random_sample(parameter_space={'period': (5, 20), 'buy': (20.0, 30.0), 'sell': [70.0, 80.0]}, samples=50, seed=1)
+
+
+def test_results_are_ranked_and_match_across_processes(stock_frame):
+    parameters = ParameterSweep(price_df=stock_frame).grid(parameter_grid={'period': [5, 10], 'buy': [30.0, 40.0], 'sell': [60.0]})
+
+    in_process_df = ParameterSweep(price_df=stock_frame, max_workers=1).run(parameters=parameters)
+    pool_df = ParameterSweep(price_df=stock_frame, max_workers=2).run(parameters=parameters)
+
+    assert len(in_process_df) == 4
+    assert in_process_df['sharpe_ratio'].is_monotonic_decreasing
+    assert ParameterSweep(price_df=stock_frame, max_workers=1).run(parameters=parameters, rank_by='max_drawdown', ascending=True)['max_drawdown'].is_monotonic_increasing
+    assert in_process_df.equals(pool_df)
+
+
+def test_the_worker_frame_is_backed_by_shared_memory(stock_frame):
+    frame = stock_frame.frame
+    columns = {column: frame[column].to_numpy(dtype=np.float64) for column in optimizer.SHARED_COLUMNS}
+    columns['symbol_code'] = np.asarray(frame.index.codes[0], dtype=np.int32)
+    columns['datetime'] = frame.index.get_level_values('datetime').to_numpy(dtype='datetime64[ns]')
+
+    shared_blocks = {}
+    shared_arrays = {}
+    for column, values in columns.items():
+        shm = shared_memory.SharedMemory(create=True, size=values.nbytes)
+        np.ndarray(shape=values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+        shared_blocks[column] = shm
+        shared_arrays[column] = (shm.name, values.dtype.str, len(values))
+
+    try:
+        optimizer._init_worker(shared_arrays, list(frame.index.levels[0]), '1min', optimizer.rsi_strategy, None, 100000.0)
+        # The view of the block the worker attached to, which is mapped at another address than the one created here
+        attached_close = next(shm for shm in optimizer._worker_state['shared_memory'] if shm.name == shared_blocks['close'].name)
+        shared_close = np.ndarray(shape=(len(frame),), dtype=np.float64, buffer=attached_close.buf)
+
+        assert np.shares_memory(optimizer._worker_state['frame']['close'].to_numpy(), shared_close)
+        assert optimizer._worker_state['frame'].index.equals(frame.index)
+        del shared_close
+    finally:
+        optimizer._release_worker()
+        for shm in shared_blocks.values():
+            shm.close()
+            shm.unlink()
+
+
+def test_a_failed_evaluation_releases_the_worker_state(stock_frame):
+    def failing_strategy(indicator_client, period):
+        indicator_client.sma(period=period)
+        raise RuntimeError('The strategy failed.')
+
+    with pytest.raises(RuntimeError):
+        ParameterSweep(price_df=stock_frame, strategy=failing_strategy, max_workers=1).run(parameters=[{'period': 5}])
+
+    assert optimizer._worker_state == {}
+    # The sweep still runs afterwards
+    assert len(ParameterSweep(price_df=stock_frame, max_workers=1).run(parameters=[{'period': 5, 'buy': 30.0, 'sell': 70.0}])) == 1
@@ -0,0 +1,109 @@
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from types import SimpleNamespace
+
+import pytest
+
+from robot.journal import OrderJournal
+from robot.order_store import OrderStore
+from robot.trader import Trader
+
+# 2021-04-15 14:30:00 UTC
+TS = int(datetime(2021, 4, 15, 14, 30, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def order_record(ts, local_trade_id='L1', trade_id=None, symbol='AAPL', order_status='Not submitted'):
+    return {
+        'ts': ts, 'event': 'order', 'local_trade_id': local_trade_id, 'trade_id': trade_id, 'account': 'U1', 'symbol': symbol,
+        'conid': 265598, 'side': 'BUY', 'quantity': 10, 'price': None, 'order_type': 'MKT', 'asset_type': 'STK',
+        'order_status': order_status, 'total_cost': None
+    }
+
+
+def fill_record(ts, symbol='AAPL', side='BUY', quantity=10, price=100.0, trade_id='1'):
+    return {'ts': ts, 'event': 'fill', 'symbol': symbol, 'side': side, 'quantity': quantity, 'price': price, 'trade_id': trade_id,
+            'asset_type': 'STK', 'order_status': 'Filled'}
+
+
+@pytest.fixture
+def store():
+    order_store = OrderStore(path=':memory:')
+    yield order_store
+    order_store.close()
+
+
+def test_later_records_of_an_order_update_it(store):
+    store.ingest(records=[order_record(ts=TS)])
+    store.ingest(records=[order_record(ts=TS + 1000, trade_id='123', order_status='Filled')])
+
+    orders = store.orders()
+
+    assert len(orders) == 1
+    assert (orders[0]['trade_id'], orders[0]['order_status']) == ('123', 'Filled')
+    assert (orders[0]['created'], orders[0]['updated']) == (TS, TS + 1000)
+    assert store.orders(trade_id='L1') == store.orders(trade_id=123)
+
+
+def test_fills_which_are_already_stored_are_skipped(store):
+    records = [fill_record(ts=TS), fill_record(ts=TS + 1000, side='SELL', quantity=4, price=110.0, trade_id='2')]
+
+    store.ingest(records=records)
+    store.ingest(records=records)
+
+    assert len(store.fills()) == 2
+
+
+def test_orders_are_queried_by_symbol_status_and_time(store):
+    store.ingest(records=[
+        order_record(ts=TS, local_trade_id='L1', symbol='AAPL', order_status='Filled'),
+        order_record(ts=TS + 1000, local_trade_id='L2', symbol='MSFT', order_status='Filled'),
+        order_record(ts=TS + 2000, local_trade_id='L3', symbol='AAPL', order_status='Cancelled')
+    ])
+
+    assert [order['local_trade_id'] for order in store.orders(symbol='AAPL')] == ['L1', 'L3']
+    assert [order['local_trade_id'] for order in store.orders(status='Filled')] == ['L1', 'L2']
+    assert [order['local_trade_id'] for order in store.orders(start=TS + 1000, end=TS + 2000)] == ['L2']
+    assert [order['local_trade_id'] for order in store.orders(start=datetime(2021, 4, 15, tzinfo=timezone.utc))] == ['L1', 'L2', 'L3']
+    #The newest first when limited
+    assert [order['local_trade_id'] for order in store.orders(limit=2)] == ['L3', 'L2']
+
+
+def test_the_daily_report_sums_the_fills_of_the_day(store):
+    store.ingest(records=[
+        fill_record(ts=TS, trade_id='1'),
+        fill_record(ts=TS + 1000, side='SELL', quantity=4, price=110.0, trade_id='2'),
+        fill_record(ts=TS + 2000, symbol='MSFT', quantity=2, price=200.0, trade_id='3'),
+        #The next day
+        fill_record(ts=TS + 86400000, symbol='MSFT', quantity=2, price=200.0, trade_id='4')
+    ])
+
+    report = store.daily_report(day=date(2021, 4, 15))
+
+    assert [summary['symbol'] for summary in report] == ['AAPL', 'MSFT']
+    assert (report[0]['bought'], report[0]['sold'], report[0]['net_quantity'], report[0]['fills']) == (10, 4, 6, 2)
+    assert report[0]['cash_flow'] == pytest.approx(440.0 - 1000.0)
+    assert report[1]['fills'] == 1
+
+
+def test_the_trader_keeps_the_store_up_to_date_from_the_journal(tmp_path):
+    order_journal = OrderJournal(path=tmp_path / 'orders.jsonl')
+    order_journal.record_order(trade_obj=SimpleNamespace(**order_record(ts=TS)))
+    order_journal.flush()
+
+    trader = Trader.__new__(Trader)
+    trader._order_journal = order_journal
+    trader.order_store = None
+    store = trader.create_order_store(path=tmp_path / 'orders.db')
+
+    #Journalled after the store was created
+    order_journal.record_order(trade_obj=SimpleNamespace(**order_record(ts=TS, trade_id='123', order_status='Filled')))
+    order_journal.record_fill(symbol='AAPL', side='BUY', quantity=10, price=100.0, trade_id='123')
+
+    assert [(order['trade_id'], order['order_status']) for order in trader.order_history(symbol='AAPL')] == [('123', 'Filled')]
+    assert len(store.fills(trade_id='123')) == 1
+    assert store.load_journal(path=order_journal.path) == 3
+    assert len(store.fills()) == 1
+
+    order_journal.close()
+    store.close()
@@ -0,0 +1,173 @@
+import pytest
+
+import robot.orders as orders
+from robot.journal import OrderJournal
+from robot.orders import InvalidTransition, OrderManager
+from robot.portfolio import Portfolio
+from robot.trader import Trader
+from robot.trades import Trade
+
+
+def live_order(order_id, status, filled_quantity=0, last_execution=None, **fields):
+    order = {
+        'orderId': order_id,
+        'status': status,
+        'filledQuantity': filled_quantity,
+        'lastExecutionTime_r': last_execution,
+        'conid': 265598,
+        'ticker': 'AAPL',
+        'side': 'BUY',
+        'totalSize': 10
+    }
+    order.update(fields)
+    return order
+
+
+def test_orders_move_through_their_states():
+    changes = []
+    order_manager = OrderManager(on_change=lambda order, previous_state: changes.append((previous_state, order.state)))
+    order_manager.add_order(trade_id='1', conid='265598', symbol='AAPL', side='BUY', quantity=10)
+
+    order_manager.apply_live_orders(live_orders={'orders': [live_order(1, 'Submitted')]})
+    order_manager.apply_live_orders(live_orders={'orders': [live_order(1, 'Submitted', filled_quantity=4, last_execution=1, avgPrice='101.5')]})
+    order = order_manager.get('1')
+
+    assert order.state == orders.PARTIALLY_FILLED
+    assert order.remaining_quantity == 6
+    assert order.average_price == 101.5
+    assert order_manager.open_orders(conid='265598') == [order]
+
+    order_manager.apply_live_orders(live_orders={'orders': [live_order(1, 'Filled', filled_quantity=10, last_execution=2)]})
+
+    assert changes == [
+        (orders.PENDING_SUBMIT, orders.SUBMITTED),
+        (orders.SUBMITTED, orders.PARTIALLY_FILLED),
+        (orders.PARTIALLY_FILLED, orders.FILLED)
+    ]
+    assert not order.is_open
+    assert order_manager.open_orders() == []
+    assert order_manager.orders(conid='265598') == [order]
+
+
+def test_unchanged_live_orders_are_skipped():
+    order_manager = OrderManager()
+    order_manager.add_order(trade_id='1', conid='265598', quantity=10)
+
+    assert order_manager.apply_live_orders(live_orders={'orders': [live_order(1, 'Submitted')]})
+    assert order_manager.apply_live_orders(live_orders={'orders': [live_order(1, 'Submitted')]}) == []
+
+    assert order_manager.updates == 1
+    assert order_manager.skipped_updates == 1
+
+
+def test_stale_updates_cannot_move_a_filled_order_back():
+    order_manager = OrderManager()
+    order_manager.add_order(trade_id='1', conid='265598', quantity=10, state=orders.FILLED)
+
+    assert order_manager.apply_live_order(live_order=live_order(1, 'Submitted')) is None
+    assert order_manager.get('1').state == orders.FILLED
+
+    with pytest.raises(InvalidTransition):
+        order_manager.transition(trade_id='1', state=orders.SUBMITTED)
+
+
+def test_orders_placed_elsewhere_are_tracked():
+    order_manager = OrderManager()
+
+    changed_orders = order_manager.apply_live_orders(live_orders={'orders': [live_order(7, 'PreSubmitted', acct='U2', order_ref='L7')]})
+
+    assert len(changed_orders) == 1
+    order = order_manager.get('7')
+    assert (order.symbol, order.side, order.quantity, order.account, order.local_trade_id) == ('AAPL', 'BUY', 10.0, 'U2', 'L7')
+    assert order.state == orders.SUBMITTED
+    assert order.gateway_status == 'PreSubmitted'
+
+
+def test_pending_cancel_leaves_the_state_as_it_is():
+    order_manager = OrderManager()
+    order_manager.add_order(trade_id='1', quantity=10, state=orders.SUBMITTED)
+
+    order_manager.apply_live_order(live_order=live_order(1, 'PendingCancel'))
+
+    assert order_manager.get('1').state == orders.SUBMITTED
+
+
+def test_transition_raises_for_an_unknown_order():
+    with pytest.raises(KeyError):
+        OrderManager().transition(trade_id='404', state=orders.CANCELLED)
+
+
+class FakeClient():
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete_order(self, account_id, customer_order_id):
+        self.deleted.append((account_id, customer_order_id))
+        return {'order_id': customer_order_id, 'msg': 'Request was submitted'}
+
+
+def make_trade(order_status, tmp_path):
+    trade = Trade()
+    trade.trade_id = '1'
+    trade.account = 'U1'
+    trade.order_status = order_status
+    trade._ib_client = FakeClient()
+    trade._journal = OrderJournal(path=tmp_path / 'orders.jsonl')
+    return trade
+
+
+@pytest.mark.parametrize('order_status', ['PreSubmitted', 'Submitted', 'PendingSubmit', orders.PARTIALLY_FILLED])
+def test_open_orders_can_be_cancelled(order_status, tmp_path):
+    trade = make_trade(order_status=order_status, tmp_path=tmp_path)
+
+    response = trade.cancel_order()
+    trade._journal.close()
+
+    assert response['order_id'] == '1'
+    assert trade._ib_client.deleted == [('U1', '1')]
+    assert trade.order_status == 'Cancelled'
+    assert [record['event'] for record in OrderJournal.read(path=tmp_path / 'orders.jsonl')] == ['cancel']
+
+
+@pytest.mark.parametrize('order_status', ['Filled', 'Cancelled', 'ApiCancelled', 'Inactive', 'Unknown'])
+def test_closed_orders_cannot_be_cancelled(order_status, tmp_path):
+    trade = make_trade(order_status=order_status, tmp_path=tmp_path)
+
+    with pytest.raises(RuntimeError):
+        trade.cancel_order()
+    trade._journal.close()
+
+    assert trade._ib_client.deleted == []
+
+
+class FakeSession():
+
+    def __init__(self, live_orders):
+        self.live_orders = live_orders
+
+    def get_live_orders(self):
+        return {'snapshot': True, 'orders': self.live_orders}
+
+
+def test_live_orders_keep_the_gateway_status_on_the_trade(tmp_path):
+    trade = make_trade(order_status='PendingSubmit', tmp_path=tmp_path)
+    trade.local_trade_id = 'L1'
+
+    trader = Trader.__new__(Trader)
+    trader.session = FakeSession(live_orders=[live_order(1, 'PreSubmitted', order_ref='L1', acct='U1')])
+    trader.order_manager = OrderManager()
+    trader.trades = {'L1': trade}
+    trader.portfolio = Portfolio(account_id='U1')
+    trader.portfolios = {'U1': trader.portfolio}
+    trader.portfolio.add_position(symbol='AAPL', asset_type='STK', purchase_date='2021-01-04', order_status='PendingSubmit', quantity=10, purchase_price=100.0)
+
+    trader.update_order_status()
+
+    assert trade.order_status == 'PreSubmitted'
+    assert trader.portfolio.positions['AAPL']['order_status'] == orders.SUBMITTED
+
+    #The status written by update_order_status() can still be cancelled
+    trade.cancel_order()
+    trade._journal.close()
+    assert trade._ib_client.deleted == [('U1', '1')]
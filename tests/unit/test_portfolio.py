@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from robot.portfolio import Portfolio, RollingCovariance
+from robot.quotes import QuoteStore
+from robot.stock_frame import StockFrame
+
+
+def make_portfolio(quote_store=None):
+    portfolio = Portfolio(account_id='DU123', quote_store=quote_store)
+    portfolio.add_position(symbol='AAPL', asset_type='STK', purchase_date='2021-01-04', order_status='Filled', quantity=10, purchase_price=100.0)
+    portfolio.add_position(symbol='MSFT', asset_type='STK', purchase_date='2021-01-04', order_status='Filled', quantity=5, purchase_price=200.0)
+    portfolio.add_position(symbol='SPY', asset_type='OPT', purchase_date='2021-01-04', order_status='Filled', quantity=2, purchase_price=3.0)
+    return portfolio
+
+
+def test_positions_without_a_price_are_valued_at_their_purchase_price():
+    portfolio = make_portfolio()
+
+    assert portfolio.total_market_value() == pytest.approx(10 * 100.0 + 5 * 200.0 + 2 * 3.0)
+    assert portfolio.unrealized_pnl() == 0.0
+
+
+def test_metrics_read_the_last_prices_from_the_quote_store():
+    quote_store = QuoteStore()
+    portfolio = make_portfolio(quote_store=quote_store)
+    quote_store.update(conid='1', symbol='AAPL', last=110.0)
+    quote_store.update(conid='2', symbol='MSFT', last=190.0)
+
+    metrics = portfolio.portfolio_metrics()
+
+    assert metrics['market_value'] == pytest.approx(1100.0 + 950.0 + 6.0)
+    assert metrics['unrealized_pnl'] == pytest.approx(10 * 10.0 - 5 * 10.0)
+    assert metrics['realized_pnl'] == 0.0
+    assert metrics['positions'] == 3
+    assert portfolio.market_values() == pytest.approx({'AAPL': 1100.0, 'MSFT': 950.0, 'SPY': 6.0})
+    assert portfolio.exposure_by_asset_type() == pytest.approx({'OPT': 6.0, 'STK': 2050.0})
+    assert sum(portfolio.total_allocation().values()) == pytest.approx(1.0)
+
+
+def test_quote_store_prices_track_later_updates():
+    quote_store = QuoteStore()
+    portfolio = make_portfolio(quote_store=quote_store)
+    quote_store.update(conid='1', symbol='AAPL', last=110.0)
+    portfolio.portfolio_metrics()
+
+    quote_store.update(conid='1', last=90.0)
+
+    assert portfolio.unrealized_pnl() == pytest.approx(10 * -10.0)
+
+
+def test_buying_more_moves_the_average_price():
+    portfolio = make_portfolio()
+
+    position = portfolio.update_position(symbol='AAPL', quantity=20, price=120.0)
+
+    assert position['purchase_price'] == pytest.approx(110.0)
+    assert position['quantity'] == 20
+    assert portfolio.realized_pnl() == 0.0
+
+
+def test_selling_realises_the_pnl_against_the_average_price():
+    portfolio = make_portfolio()
+    portfolio.update_position(symbol='AAPL', quantity=20, price=120.0)
+
+    position = portfolio.update_position(symbol='AAPL', quantity=5, price=130.0)
+
+    assert position['purchase_price'] == pytest.approx(110.0)
+    assert portfolio.realized_pnl() == pytest.approx(15 * 20.0)
+
+
+def test_flipping_a_position_closes_it_and_opens_at_the_fill_price():
+    portfolio = make_portfolio()
+
+    position = portfolio.update_position(symbol='AAPL', quantity=-4, price=90.0)
+
+    assert portfolio.realized_pnl() == pytest.approx(10 * -10.0)
+    assert position['purchase_price'] == pytest.approx(90.0)
+    assert position['quantity'] == -4
+
+
+def test_realised_pnl_is_kept_after_a_position_is_removed():
+    portfolio = make_portfolio()
+    portfolio.update_position(symbol='AAPL', quantity=5, price=130.0)
+
+    assert portfolio.remove_position(symbol='AAPL')[0]
+    assert not portfolio.remove_position(symbol='AAPL')[0]
+
+    assert portfolio.realized_pnl() == pytest.approx(5 * 30.0)
+    assert portfolio.positions_count == 2
+    assert portfolio.market_values() == pytest.approx({'MSFT': 1000.0, 'SPY': 6.0})
+
+
+def test_removing_a_row_keeps_the_other_rows_in_step():
+    portfolio = make_portfolio()
+    portfolio.set_price(symbol='SPY', price=4.0)
+
+    portfolio.remove_position(symbol='AAPL')
+
+    frame = portfolio.positions_frame().set_index('symbol')
+    assert frame.loc['SPY', 'last_price'] == 4.0
+    assert frame.loc['SPY', 'market_value'] == pytest.approx(8.0)
+    assert frame.loc['MSFT', 'quantity'] == 5
+    assert np.isnan(frame.loc['MSFT', 'last_price'])
+
+
+def test_update_position_raises_for_an_unknown_symbol():
+    with pytest.raises(KeyError):
+        make_portfolio().update_position(symbol='TSLA', quantity=1, price=1.0)
+
+
+def test_add_positions_grows_the_columns():
+    portfolio = Portfolio(account_id='DU123')
+    positions = [
+        {'symbol': 'S{}'.format(i), 'asset_type': 'STK', 'order_status': 'Filled', 'quantity': 1, 'purchase_price': 1.0, 'last_price': 2.0}
+        for i in range(100)
+    ]
+
+    portfolio.add_positions(positions=positions)
+
+    assert portfolio.positions_count == 100
+    assert portfolio.total_market_value() == pytest.approx(200.0)
+    assert portfolio.unrealized_pnl() == pytest.approx(100.0)
+    with pytest.raises(TypeError):
+        portfolio.add_positions(positions=positions[0])
+
+
+def test_rolling_covariance_matches_the_window():
+    returns = np.random.default_rng(0).normal(0.0, 0.01, size=(250, 3))
+    rolling_covariance = RollingCovariance(symbols=['A', 'B', 'C'], window=60)
+
+    for row in returns:
+        rolling_covariance.update(returns=row)
+
+    np.testing.assert_allclose(rolling_covariance.covariance(), np.cov(returns[-60:], rowvar=False), atol=1e-12)
+    np.testing.assert_allclose(rolling_covariance.history(), returns[-60:])
+
+
+def make_closes(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return {symbol: 100.0 * np.cumprod(1.0 + rng.normal(0.0, 0.01, size=count)) for symbol in ['AAPL', 'MSFT', 'SPY']}
+
+
+def make_bars(closes, start=0):
+    return [
+        {'symbol': symbol, 'datetime': 1600000000000 + (start + i) * 60000, 'open': close, 'close': close, 'high': close, 'low': close, 'volume': 100}
+        for symbol, symbol_closes in closes.items() for i, close in enumerate(symbol_closes)
+    ]
+
+
+def make_risk_portfolio(closes, risk_window=30):
+    portfolio = Portfolio(account_id='DU123', risk_window=risk_window, benchmark='SPY')
+    portfolio.add_position(symbol='AAPL', asset_type='STK', purchase_date='2021-01-04', order_status='Filled', quantity=10, purchase_price=100.0)
+    portfolio.add_position(symbol='MSFT', asset_type='STK', purchase_date='2021-01-04', order_status='Filled', quantity=-5, purchase_price=200.0)
+    portfolio.stock_frame = StockFrame(data=make_bars(closes=closes))
+    return portfolio
+
+
+def test_risk_exposure_matches_the_returns_of_the_window():
+    closes = make_closes(count=100)
+    portfolio = make_risk_portfolio(closes=closes)
+
+    risk_metrics = portfolio.risk_exposure(confidence=0.95)
+
+    returns = pd.DataFrame(closes).pct_change().iloc[-30:]
+    #The positions have no quotes, so they are valued at their purchase price
+    exposures = np.array([10 * 100.0, -5 * 200.0, 0.0])
+    pnls = returns.to_numpy() @ exposures
+    assert risk_metrics['bars'] == 30
+    assert risk_metrics['volatility']['MSFT'] == pytest.approx(returns['MSFT'].std())
+    pd.testing.assert_frame_equal(risk_metrics['correlation'], returns.corr(), atol=1e-10)
+    assert risk_metrics['portfolio_volatility'] == pytest.approx(np.std(pnls, ddof=1))
+    assert risk_metrics['var'] == pytest.approx(-np.quantile(pnls, 0.05))
+    assert risk_metrics['cvar'] >= risk_metrics['var']
+    #The positions cancel each other out, so their total value is 0 and there is no beta
+    assert risk_metrics['beta'] is None
+
+
+def test_beta_is_measured_against_the_benchmark():
+    closes = make_closes(count=100)
+    #AAPL moves twice as much as the benchmark
+    closes['AAPL'] = 100.0 * np.cumprod(1.0 + 2.0 * pd.Series(closes['SPY']).pct_change().fillna(0.0).to_numpy())
+    portfolio = make_risk_portfolio(closes=closes)
+    portfolio.remove_position(symbol='MSFT')
+
+    assert portfolio.risk_exposure()['beta'] == pytest.approx(2.0)
+
+
+def test_new_bars_are_added_to_the_risk_metrics():
+    closes = make_closes(count=130)
+    portfolio = make_risk_portfolio(closes={symbol: symbol_closes[:100] for symbol, symbol_closes in closes.items()})
+    portfolio.risk_exposure()
+
+    portfolio.stock_frame.add_rows(data=make_bars(closes={symbol: symbol_closes[100:] for symbol, symbol_closes in closes.items()}, start=100))
+
+    assert portfolio.update_risk_metrics() == 30
+    assert portfolio.update_risk_metrics() == 0
+    pd.testing.assert_frame_equal(
+        portfolio.risk_exposure()['covariance'],
+        make_risk_portfolio(closes=closes).risk_exposure()['covariance'],
+        atol=1e-12
+    )
+
+
+def test_risk_metrics_need_a_stock_frame():
+    with pytest.raises(ValueError):
+        make_portfolio().risk_exposure()
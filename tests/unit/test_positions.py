@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from robot.portfolio import Portfolio
+from robot.quotes import QuoteStore
+from robot.trader import POSITIONS_PAGE_SIZE
+from robot.trader import Trader
+
+
+class FakeSession:
+    """Serves `count` positions of one account in pages of POSITIONS_PAGE_SIZE."""
+
+    def __init__(self, count, quantity=10):
+        self.count = count
+        self.quantity = quantity
+        self.page_ids = []
+        self.invalidated = []
+        self.lock = threading.Lock()
+
+    def portfolio_account_positions(self, account_id, page_id=0):
+        with self.lock:
+            self.page_ids.append(page_id)
+        first = page_id * POSITIONS_PAGE_SIZE
+        return [
+            {'ticker': 'S%d' % i, 'assetClass': 'STK', 'position': self.quantity, 'mktPrice': 5.0, 'avgPrice': 4.0}
+            for i in range(first, min(self.count, first + POSITIONS_PAGE_SIZE))
+        ]
+
+    def portfolio_positions_invalidate(self, account_id):
+        self.invalidated.append(account_id)
+
+
+def make_trader(session):
+    trader = Trader.__new__(Trader)
+    trader.account = 'U1'
+    trader.session = session
+    trader._position_pages = {}
+    trader._account_symbols = {}
+    trader.portfolio = Portfolio(account_id='U1', quote_store=QuoteStore())
+    return trader
+
+
+def test_every_page_is_loaded_until_a_short_one():
+    trader = make_trader(session=FakeSession(count=200))
+
+    positions = trader.load_positions(max_workers=4)
+
+    assert len(positions) == 200
+    assert len(trader.portfolio.positions) == 200
+    # The first page alone, then waves of 4 until page 6 comes back short
+    assert sorted(trader.session.page_ids) == list(range(9))
+    assert trader._position_pages['U1'] == 7
+    assert trader.portfolio.positions['S0']['purchase_price'] == 4.0
+
+
+def test_the_next_load_starts_with_as_many_pages_as_the_last():
+    trader = make_trader(session=FakeSession(count=200))
+    trader.load_positions(max_workers=4)
+
+    trader.session = FakeSession(count=200)
+    trader.load_positions(max_workers=4)
+
+    assert sorted(trader.session.page_ids) == list(range(7))
+
+
+def test_an_exact_multiple_of_the_page_size_requests_one_more_page():
+    trader = make_trader(session=FakeSession(count=2 * POSITIONS_PAGE_SIZE))
+
+    positions = trader.load_positions(max_workers=1)
+
+    assert len(positions) == 60
+    assert trader.session.page_ids == [0, 1, 2]
+
+
+def test_refresh_applies_the_changes_and_keeps_realised_pnl():
+    trader = make_trader(session=FakeSession(count=200))
+    trader.load_positions()
+    trader.portfolio.update_position(symbol='S1', quantity=5, price=6.0)
+    realized_pnl = trader.portfolio.realized_pnl()
+
+    trader.session = FakeSession(count=150, quantity=20)
+    positions = trader.load_positions(refresh=True)
+
+    assert trader.session.invalidated == ['U1']
+    assert len(positions) == 150
+    assert trader.portfolio.positions['S1']['quantity'] == 20
+    # The positions which are gone are closed, not forgotten
+    assert trader.portfolio.positions['S199']['quantity'] == 0
+    assert trader.portfolio.realized_pnl() == pytest.approx(realized_pnl)
+
+
+def test_a_page_which_is_not_a_list_ends_the_load():
+    class ErrorSession(FakeSession):
+        def portfolio_account_positions(self, account_id, page_id=0):
+            if page_id == 1:
+                return {'error': 'Bad Request'}
+            return super().portfolio_account_positions(account_id=account_id, page_id=page_id)
+
+    trader = make_trader(session=ErrorSession(count=200))
+
+    assert len(trader.load_positions(max_workers=1)) == POSITIONS_PAGE_SIZE
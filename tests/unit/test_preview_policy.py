@@ -0,0 +1,119 @@
+import random
+import threading
+
+import pytest
+
+from robot.orders import OrderManager
+from robot.quotes import QuoteStore
+from robot.trader import Trader
+from robot.trades import PreviewPolicy
+
+
+class FakeTrade():
+
+    def __init__(self, symbol, conid, quantity, preview_error=None, barrier=None):
+        self.symbol = symbol
+        self.conid = conid
+        self.side = 'BUY'
+        self.quantity = quantity
+        self.price = None
+        self.account = 'DU123'
+        self.local_trade_id = symbol
+        self.preview_error = preview_error
+        self.barrier = barrier
+        self.previewed = False
+        self.placed = False
+
+    def preview_order(self):
+        self.previewed = True
+        #Every preview of a concurrent batch has to be running for the barrier to let them through
+        if self.barrier is not None:
+            self.barrier.wait()
+        if self.preview_error is not None:
+            raise self.preview_error
+
+    def place_order(self, ignore_warning=False):
+        self.placed = True
+        return [{'order_id': 'order-' + self.symbol, 'order_status': 'Submitted'}]
+
+
+def make_trader(preview_policy):
+    trader = Trader.__new__(Trader)
+    trader.quote_store = QuoteStore()
+    trader.quote_store.update(conid='1', symbol='AAPL', last=100.0)
+    trader.quote_store.update(conid='2', symbol='MSFT', last=200.0)
+    trader.risk_checker = None
+    trader.preview_policy = preview_policy
+    trader.order_manager = OrderManager()
+    return trader
+
+
+def test_unknown_modes_and_thresholds_are_rejected():
+    with pytest.raises(ValueError):
+        PreviewPolicy(mode='sometimes')
+    with pytest.raises(ValueError):
+        PreviewPolicy(mode='threshold')
+
+
+def test_the_mode_decides_which_orders_are_previewed():
+    assert PreviewPolicy(mode='always').needs_preview(notional=1.0)
+    assert not PreviewPolicy(mode='off').needs_preview(notional=1e9)
+
+    threshold_policy = PreviewPolicy(mode='threshold', notional_threshold=5000)
+    assert threshold_policy.needs_preview(notional=5000)
+    assert not threshold_policy.needs_preview(notional=4999)
+    #An order without a known value is always previewed
+    assert threshold_policy.needs_preview(notional=None)
+
+
+def test_the_sampled_mode_previews_a_share_of_the_orders():
+    random.seed(0)
+    sampled_policy = PreviewPolicy(mode='sampled', sample_rate=0.1)
+
+    previews = sum(sampled_policy.needs_preview() for _ in range(2000))
+
+    assert 150 < previews < 250
+    assert not PreviewPolicy(mode='sampled', sample_rate=0.0).needs_preview()
+    assert PreviewPolicy(mode='sampled', sample_rate=1.0).needs_preview()
+
+
+def test_preview_errors_are_returned_in_the_order_of_the_trades():
+    error = RuntimeError('Rejected by the gateway.')
+    trade_objs = [FakeTrade(symbol='AAPL', conid='1', quantity=1), FakeTrade(symbol='MSFT', conid='2', quantity=1, preview_error=error)]
+
+    assert PreviewPolicy().preview_orders(trade_objs=trade_objs) == [None, error]
+
+
+def test_the_previews_of_a_batch_run_concurrently():
+    barrier = threading.Barrier(parties=3, timeout=5)
+    trade_objs = [FakeTrade(symbol=symbol, conid=str(i), quantity=1, barrier=barrier) for i, symbol in enumerate(['AAPL', 'MSFT', 'NVDA'])]
+
+    #One after the other, the first preview would break the barrier
+    assert PreviewPolicy(concurrent=True, max_workers=3).preview_orders(trade_objs=trade_objs) == [None, None, None]
+
+
+def test_only_orders_over_the_threshold_are_previewed_before_they_are_placed():
+    trader = make_trader(preview_policy=PreviewPolicy(mode='threshold', notional_threshold=1000))
+    trade_objs = [
+        FakeTrade(symbol='AAPL', conid='1', quantity=5),
+        FakeTrade(symbol='MSFT', conid='2', quantity=10, preview_error=RuntimeError('Rejected by the gateway.')),
+        #No quote, so its value isn't known
+        FakeTrade(symbol='NVDA', conid='3', quantity=1)
+    ]
+
+    responses = trader._submit_orders(trade_objs=trade_objs)
+
+    assert [trade_obj.previewed for trade_obj in trade_objs] == [False, True, True]
+    assert [trade_obj.placed for trade_obj in trade_objs] == [True, False, True]
+    assert responses[1] is None
+    assert [order.trade_id for order in trader.order_manager.orders()] == ['order-AAPL', 'order-NVDA']
+
+
+def test_submitted_orders_are_previewed_concurrently():
+    barrier = threading.Barrier(parties=2, timeout=5)
+    trader = make_trader(preview_policy=PreviewPolicy(concurrent=True))
+    trade_objs = [FakeTrade(symbol='AAPL', conid='1', quantity=5, barrier=barrier), FakeTrade(symbol='MSFT', conid='2', quantity=5, barrier=barrier)]
+
+    responses = trader._submit_orders(trade_objs=trade_objs)
+
+    assert all(response is not None for response in responses)
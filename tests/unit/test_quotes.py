@@ -0,0 +1,178 @@
+import time
+
+import numpy as np
+
+from robot.bar_builder import BarBuilder
+from robot.quotes import QuotePoller, QuoteStore
+from robot.trader import Trader
+
+# The start of a minute, in epoch ms
+START = 1600000020000 - 1600000020000 % 60000
+
+
+class FakeSession():
+
+    def __init__(self):
+        self.calls = []
+        self.updated = START
+        self.changed = set()
+
+    def market_data(self, conids, since, fields):
+        self.calls.append((list(conids), since))
+        self.updated += 1000
+
+        #Everything the first time, only the changed conids with since
+        return [
+            {'conid': int(conid), '_updated': self.updated, '55': 'S' + conid, '31': 'C10.5', '7059': '100', '84': '10.4'}
+            for conid in conids if since is None or conid in self.changed
+        ]
+
+
+def test_conids_are_packed_into_as_few_requests_as_allowed():
+    quote_poller = QuotePoller(session=FakeSession(), max_conids=3, max_conids_length=14)
+
+    #Split at 3 conids, or once the joined conids would pass 14 characters
+    assert quote_poller._chunk(conids=['1', '22', '333', '4']) == [['1', '22', '333'], ['4']]
+    assert quote_poller._chunk(conids=['55555', '66666', '77777']) == [['55555', '66666'], ['77777']]
+    assert quote_poller._chunk(conids=[]) == []
+
+
+def test_known_conids_are_only_asked_for_their_changes():
+    session = FakeSession()
+    quote_poller = QuotePoller(session=session, conids=[str(100 + i) for i in range(5)], max_conids=2)
+
+    assert len(quote_poller.poll()) == 5
+    assert session.calls == [(['100', '101'], None), (['102', '103'], None), (['104'], None)]
+
+    session.calls = []
+    session.changed = {'103'}
+    assert quote_poller.poll() == ['103']
+    #Every request asks since the oldest update of its conids
+    assert [since for _, since in session.calls] == [str(START + 1000), str(START + 2000), str(START + 3000)]
+    #103 came back in the fifth request
+    assert quote_poller.last_updated['103'] == START + 5000
+    assert quote_poller.requests == 6
+
+
+def test_new_conids_are_requested_in_full():
+    session = FakeSession()
+    quote_poller = QuotePoller(session=session, conids=['100'])
+    quote_poller.poll()
+
+    session.calls = []
+    quote_poller.add_conid(conid='200')
+    quote_poller.add_conid(conid='200')
+    quote_poller.remove_conid(conid='100')
+    quote_poller.poll()
+
+    assert session.calls == [(['200'], None)]
+    assert quote_poller.conids == ['200']
+    assert '100' not in quote_poller.last_updated
+
+
+def test_snapshots_are_merged_into_the_quote_store():
+    quote_poller = QuotePoller(session=FakeSession(), conids=['100'])
+    quote_poller.poll()
+
+    quote = quote_poller.quote_store.quote(conid='100')
+
+    assert (quote['symbol'], quote['last'], quote['last_size'], quote['bid'], quote['ask']) == ('S100', 10.5, 100.0, 10.4, None)
+    assert quote['updated'] == START + 1000
+
+
+def test_empty_first_snapshots_are_requested_in_full_again():
+    class SubscribingSession(FakeSession):
+        def market_data(self, conids, since, fields):
+            self.calls.append((list(conids), since))
+            return [{'conid': int(conid)} for conid in conids]
+
+    session = SubscribingSession()
+    quote_poller = QuotePoller(session=session, conids=['100'])
+
+    assert quote_poller.poll() == []
+    quote_poller.poll()
+
+    assert session.calls == [(['100'], None), (['100'], None)]
+
+
+def test_trades_in_the_snapshots_are_added_to_the_bar_builder():
+    bar_builder = BarBuilder()
+    quote_poller = QuotePoller(session=FakeSession(), conids=['100'], bar_builder=bar_builder)
+
+    quote_poller.poll()
+
+    assert bar_builder.open_bar(conid='100') == {
+        'symbol': 'S100', 'datetime': START, 'open': 10.5, 'close': 10.5, 'high': 10.5, 'low': 10.5, 'volume': 100.0
+    }
+
+
+def test_the_quote_store_grows_and_keeps_the_rows():
+    quote_store = QuoteStore(capacity=2)
+    for i in range(5):
+        quote_store.update(conid=i, symbol='S{}'.format(i), last=10.0 + i)
+
+    assert len(quote_store) == 5
+    assert '4' in quote_store
+    assert quote_store.price(symbol='S4') == 14.0
+    assert quote_store.price(conid='0', field='bid') is None
+    assert quote_store.symbol_to_conid(symbol='S3') == '3'
+    assert quote_store.conid_to_symbol(conid=3) == 'S3'
+    np.testing.assert_array_equal(quote_store.prices(conids=['1', '99', '4']), [11.0, np.nan, 14.0])
+
+
+def test_updates_only_write_the_fields_they_hold():
+    quote_store = QuoteStore()
+    quote_store.update(conid='1', symbol='AAPL', last=133.11, bid=133.1)
+
+    quote_store.update(conid='1', ask=133.12, bid=None)
+
+    quote = quote_store.quote(symbol='AAPL')
+    assert (quote['last'], quote['bid'], quote['ask']) == (133.11, 133.1, 133.12)
+
+    quote_store.remove(conid='1')
+    assert quote_store.price(conid='1') is None
+    assert quote_store.age(conid='1') == float('inf')
+
+
+def test_stale_quotes_are_not_returned_with_a_max_age():
+    quote_store = QuoteStore()
+    quote_store.update(conid='1', last=10.0, updated=int((time.time() - 60) * 1000))
+
+    assert quote_store.price(conid='1', max_age=5.0) is None
+    assert quote_store.price(conid='1') == 10.0
+    assert quote_store.age(conid='1') >= 60
+
+
+def make_trader(session):
+    trader = Trader.__new__(Trader)
+    trader.session = session
+    trader.quote_poller = None
+    trader.quote_store = QuoteStore()
+    trader.quote_max_age = 10.0
+    return trader
+
+
+def test_current_quotes_hold_every_requested_conid():
+    class PartialSession(FakeSession):
+        def market_data(self, conids, since, fields):
+            self.calls.append((list(conids), since))
+            #Only 100 is known to the gateway and 200 is still subscribing
+            return [{'conid': 100, '_updated': START, '55': 'AAPL', '31': '133.11'}, {'conid': 200}]
+
+    trader = make_trader(session=PartialSession())
+
+    assert trader.get_current_quotes(conids=['100', '200', 300]) == {'AAPL': 133.11, '200': None, '300': None}
+
+
+def test_buy_quantities_are_read_from_the_quote_store():
+    class LiveSession(FakeSession):
+        def market_data(self, conids, since, fields):
+            self.calls.append((list(conids), since))
+            return [{'conid': int(conid), '_updated': int(time.time() * 1000), '55': 'AAPL', '31': 'C125.0'} for conid in conids]
+
+    trader = make_trader(session=LiveSession())
+
+    assert trader.calculate_buy_quantity(ticker='AAPL', conid='265598', buy_cash_quantity=1000) == 8.0
+    assert trader.calculate_buy_quantity(ticker='AAPL', conid='265598', buy_cash_quantity=500) == 4.0
+    #The second quantity didn't need a request
+    assert len(trader.session.calls) == 1
@@ -0,0 +1,85 @@
+import logging
+
+import pytest
+import requests
+
+from ibw.client import IBClient
+
+
+class LoggedResponse():
+    """A response which counts how often its body is turned into text."""
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {'Content-Type': 'application/json'}
+        self.content = body.encode('utf-8')
+        self.text_reads = 0
+
+    @property
+    def text(self):
+        self.text_reads += 1
+        return self.content.decode('utf-8')
+
+
+class StaticTransport():
+
+    def __init__(self, response):
+        self.response = response
+
+    def request(self, method, url, headers=None, params=None, json=None):
+        return self.response
+
+
+def make_client(response):
+    return IBClient(username='IB_PAPER_USERNAME', account='IB_PAPER_ACCOUNT', client_gateway_path='.', transport=StaticTransport(response=response))
+
+
+def test_nothing_is_formatted_without_debug_logging(caplog):
+    caplog.set_level(logging.INFO)
+    response = LoggedResponse(body='{"symbol":"AAPL"}')
+    ib_client = make_client(response=response)
+    ib_client.log_body_sample_rate = 1.0
+
+    assert ib_client._make_request(endpoint='iserver/a', req_type='GET') == {'symbol': 'AAPL'}
+    assert response.text_reads == 0
+    assert not caplog.records
+
+
+def test_debug_logging_writes_one_line_of_timing_fields(caplog):
+    caplog.set_level(logging.DEBUG)
+    response = LoggedResponse(body='{"symbol":"AAPL"}')
+    ib_client = make_client(response=response)
+    ib_client.log_body_sample_rate = 0.0
+
+    ib_client._make_request(endpoint='iserver/a', req_type='GET')
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 1
+    assert messages[0].startswith('method=GET endpoint=iserver/a status=200 latency_ms=')
+    assert messages[0].endswith('bytes=17')
+    #The body isn't sampled, so it is never read
+    assert response.text_reads == 0
+
+
+def test_sampled_bodies_are_cut_at_the_limit(caplog):
+    caplog.set_level(logging.DEBUG)
+    ib_client = make_client(response=LoggedResponse(body='{"data":"' + 'x' * 100 + '"}'))
+    ib_client.log_body_sample_rate = 1.0
+    ib_client.log_body_limit = 10
+
+    ib_client._make_request(endpoint='iserver/a', req_type='GET')
+
+    assert caplog.records[-1].getMessage() == 'method=GET endpoint=iserver/a body={"data":"x... (101 more characters)'
+
+
+def test_failed_requests_log_their_body_as_a_warning(caplog):
+    caplog.set_level(logging.WARNING)
+    ib_client = make_client(response=LoggedResponse(body='{"error":"Bad Request"}', status_code=400))
+    ib_client.log_body_sample_rate = 0.0
+
+    with pytest.raises(requests.HTTPError):
+        ib_client._make_request(endpoint='iserver/a', req_type='GET')
+
+    assert [record.levelno for record in caplog.records] == [logging.WARNING, logging.WARNING]
+    assert caplog.records[-1].getMessage() == 'method=GET endpoint=iserver/a body={"error":"Bad Request"}'
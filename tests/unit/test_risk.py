@@ -0,0 +1,209 @@
+import pytest
+
+from robot.orders import OrderManager
+from robot.portfolio import Portfolio
+from robot.quotes import QuoteStore
+from robot.risk import PreTradeRiskChecker, RiskBatch, RiskLimits
+from robot.trader import Trader
+from robot.trades import PreviewPolicy
+
+
+class Clock():
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_checker(limits, available_cash=20000.0, clock=None):
+    quote_store = QuoteStore()
+    quote_store.update(conid='1', symbol='AAPL', last=100.0)
+    quote_store.update(conid='2', symbol='MSFT', last=200.0)
+
+    portfolio = Portfolio(account_id='DU123', quote_store=quote_store)
+    portfolio.add_position(symbol='AAPL', asset_type='STK', purchase_date='2021-01-04', order_status='Filled', quantity=10, purchase_price=90.0)
+
+    return PreTradeRiskChecker(portfolio=portfolio, limits=limits, available_cash=available_cash, clock=clock or Clock())
+
+
+def test_small_orders_clearly_pass():
+    risk_checker = make_checker(limits=RiskLimits(max_position_quantity=100, max_symbol_notional=10000))
+
+    risk_decision = risk_checker.check(symbol='AAPL', side='BUY', quantity=5)
+
+    assert risk_decision.approved
+    assert risk_decision.clear_pass
+    assert risk_decision.notional == pytest.approx(500.0)
+
+
+def test_orders_close_to_a_limit_pass_but_need_a_preview():
+    risk_checker = make_checker(limits=RiskLimits(max_position_quantity=100))
+
+    risk_decision = risk_checker.check(symbol='AAPL', side='BUY', quantity=60)
+
+    assert risk_decision.approved
+    assert not risk_decision.clear_pass
+
+
+def test_the_position_limit_includes_the_current_position():
+    risk_checker = make_checker(limits=RiskLimits(max_position_quantity=100))
+
+    assert not risk_checker.check(symbol='AAPL', side='BUY', quantity=95)
+    assert risk_checker.check(symbol='AAPL', side='SELL', quantity=95)
+    assert risk_checker.check(symbol='MSFT', side='BUY', quantity=95)
+    assert risk_checker.rejected == 1
+
+
+def test_the_symbol_notional_is_valued_at_the_limit_price():
+    risk_checker = make_checker(limits=RiskLimits(max_symbol_notional=5000))
+
+    assert risk_checker.check(symbol='AAPL', side='BUY', quantity=30, price=100.0)
+    assert not risk_checker.check(symbol='AAPL', side='BUY', quantity=30, price=130.0, conid='1')
+
+
+def test_limit_prices_outside_the_price_band_are_rejected():
+    risk_checker = make_checker(limits=RiskLimits(price_band=0.05))
+
+    assert risk_checker.check(symbol='AAPL', side='BUY', quantity=1, price=104.0)
+    risk_decision = risk_checker.check(symbol='AAPL', side='BUY', quantity=1, price=120.0)
+
+    assert not risk_decision.approved
+    assert 'away from the last price' in risk_decision.reasons[0]
+
+
+def test_buys_are_checked_against_the_available_cash():
+    risk_checker = make_checker(limits=RiskLimits(), available_cash=1000.0)
+
+    assert risk_checker.check(symbol='AAPL', side='BUY', quantity=10)
+    assert not risk_checker.check(symbol='AAPL', side='BUY', quantity=11)
+    assert risk_checker.check(symbol='AAPL', side='SELL', quantity=11)
+
+
+def test_orders_without_a_price_are_approved_without_a_clear_pass():
+    risk_checker = make_checker(limits=RiskLimits(max_symbol_notional=100))
+
+    risk_decision = risk_checker.check(symbol='TSLA', side='BUY', quantity=1000)
+
+    assert risk_decision.approved
+    assert not risk_decision.clear_pass
+    assert risk_decision.notional is None
+
+
+def test_the_order_rate_only_counts_recorded_orders_within_the_window():
+    clock = Clock()
+    risk_checker = make_checker(limits=RiskLimits(max_orders=3, order_rate_window=1.0), clock=clock)
+
+    for _ in range(3):
+        assert risk_checker.check(symbol='AAPL', side='BUY', quantity=1)
+        risk_checker.record_order(symbol='AAPL', side='BUY', quantity=1)
+
+    assert not risk_checker.check(symbol='AAPL', side='BUY', quantity=1)
+
+    clock.now += 1.5
+    assert risk_checker.check(symbol='AAPL', side='BUY', quantity=1)
+
+
+def test_recorded_orders_count_towards_the_bar_notional_and_the_cash():
+    clock = Clock(now=1200.0)
+    risk_checker = make_checker(limits=RiskLimits(max_bar_notional=1000), available_cash=5000.0, clock=clock)
+
+    risk_checker.record_order(symbol='AAPL', side='BUY', quantity=8)
+
+    assert risk_checker.available_cash == pytest.approx(4200.0)
+    assert not risk_checker.check(symbol='AAPL', side='BUY', quantity=3)
+
+    #A new bar starts with no notional
+    clock.now += 60.0
+    assert risk_checker.check(symbol='AAPL', side='BUY', quantity=3)
+
+
+def test_the_orders_of_a_batch_are_checked_against_each_other():
+    risk_checker = make_checker(limits=RiskLimits(max_position_quantity=20, max_orders=5), available_cash=1500.0)
+    risk_batch = RiskBatch()
+
+    risk_decision = risk_checker.check(symbol='AAPL', side='BUY', quantity=8, batch=risk_batch)
+    assert risk_decision
+    risk_batch.add(symbol='AAPL', side='BUY', quantity=8, notional=risk_decision.notional)
+
+    #10 held and 8 in the batch, so 3 more would exceed the position limit
+    assert not risk_checker.check(symbol='AAPL', side='BUY', quantity=3, batch=risk_batch)
+    #800 of the 1500 is taken by the batch
+    assert not risk_checker.check(symbol='MSFT', side='BUY', quantity=4, batch=risk_batch)
+    assert risk_checker.check(symbol='MSFT', side='BUY', quantity=3, batch=risk_batch)
+
+    #Nothing has been recorded yet
+    assert risk_checker.available_cash == 1500.0
+    assert len(risk_checker._order_times) == 0
+
+
+class FakeTrade():
+
+    def __init__(self, symbol, conid, quantity, preview_error=None, place_error=None):
+        self.symbol = symbol
+        self.conid = conid
+        self.side = 'BUY'
+        self.quantity = quantity
+        self.price = None
+        self.account = 'DU123'
+        self.local_trade_id = symbol
+        self.preview_error = preview_error
+        self.place_error = place_error
+        self.placed = False
+
+    def preview_order(self):
+        if self.preview_error is not None:
+            raise self.preview_error
+
+    def place_order(self, ignore_warning=False):
+        if self.place_error is not None:
+            raise self.place_error
+        self.placed = True
+        return [{'order_id': 'order-' + self.symbol, 'order_status': 'Submitted'}]
+
+
+def make_trader(risk_checker, preview_policy):
+    trader = Trader.__new__(Trader)
+    trader.quote_store = risk_checker.quote_store
+    trader.risk_checker = risk_checker
+    trader.preview_policy = preview_policy
+    trader.order_manager = OrderManager()
+    return trader
+
+
+def test_submit_orders_only_records_the_placed_orders():
+    risk_checker = make_checker(limits=RiskLimits(max_bar_notional=5000, max_orders=10), available_cash=2000.0)
+    risk_checker.quote_store.update(conid='3', symbol='NVDA', last=100.0)
+    trader = make_trader(risk_checker=risk_checker, preview_policy=PreviewPolicy(mode='always'))
+
+    trade_objs = [
+        FakeTrade(symbol='AAPL', conid='1', quantity=3),
+        FakeTrade(symbol='NVDA', conid='3', quantity=3, place_error=RuntimeError('The gateway is down.')),
+        FakeTrade(symbol='MSFT', conid='2', quantity=3),
+        #Over the cash left once the orders before it are counted
+        FakeTrade(symbol='AAPL', conid='1', quantity=9)
+    ]
+
+    responses = trader._submit_orders(trade_objs=trade_objs)
+
+    assert [response is not None for response in responses] == [True, False, True, False]
+    assert len(risk_checker._order_times) == 2
+    assert risk_checker.available_cash == pytest.approx(2000.0 - 300.0 - 600.0)
+    assert [order.trade_id for order in trader.order_manager.orders()] == ['order-AAPL', 'order-MSFT']
+
+
+def test_submit_orders_skips_orders_which_fail_their_preview():
+    risk_checker = make_checker(limits=RiskLimits(max_position_quantity=100), available_cash=None)
+    trader = make_trader(risk_checker=risk_checker, preview_policy=PreviewPolicy(mode='always'))
+
+    trade_objs = [
+        FakeTrade(symbol='AAPL', conid='1', quantity=80, preview_error=RuntimeError('Rejected by the gateway.')),
+        FakeTrade(symbol='MSFT', conid='2', quantity=80)
+    ]
+
+    responses = trader._submit_orders(trade_objs=trade_objs)
+
+    assert responses[0] is None and responses[1] is not None
+    assert not trade_objs[0].placed
+    assert len(risk_checker._order_times) == 1
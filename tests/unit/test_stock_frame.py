@@ -0,0 +1,386 @@
+import operator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from robot.indicator import Indicators
+from robot.stock_frame import StockFrame
+from robot.trader import Trader
+
+# 2020-09-13 12:00:00 UTC, the start of an hour
+START = 1600000020000 - 1600000020000 % 3600000
+
+
+def make_bars(symbols=('AAPL','MSFT'), count=17, start=START):
+    return [
+        {'symbol': symbol, 'datetime': start + i * 60000, 'open': 1.0 + i, 'close': 1.5 + i, 'high': 2.0 + i, 'low': 0.5 + i, 'volume': 100}
+        for symbol in symbols for i in range(count)
+    ]
+
+
+def test_bars_are_aggregated_into_larger_timeframes():
+    stock_frame = StockFrame(data=make_bars())
+
+    bars_5min = stock_frame.add_timeframe(timeframe='5min').frame.loc['AAPL']
+
+    assert len(bars_5min) == 4
+    assert bars_5min.iloc[0].tolist() == [1.0, 5.5, 6.0, 0.5, 500]
+    #The last bar only has 2 of its 5 minutes so far
+    assert bars_5min.iloc[-1].tolist() == [16.0, 17.5, 18.0, 15.5, 200]
+    assert stock_frame.timeframes == ['1min', '5min']
+
+
+def test_new_bars_update_the_derived_timeframes():
+    stock_frame = StockFrame(data=make_bars())
+    stock_frame_5min = stock_frame.add_timeframe(timeframe='5min')
+    stock_frame_1h = stock_frame.add_timeframe(timeframe='1h')
+
+    stock_frame.add_rows(data=[
+        {'symbol': 'AAPL', 'datetime': START + 17 * 60000, 'open': 1.0, 'close': 99.0, 'high': 300.0, 'low': 0.1, 'volume': 7},
+        {'symbol': 'AAPL', 'datetime': START + 20 * 60000, 'open': 5.0, 'close': 6.0, 'high': 7.0, 'low': 4.0, 'volume': 1}
+    ])
+
+    bars_5min = stock_frame_5min.frame.loc['AAPL']
+    assert bars_5min.iloc[-2].tolist() == [16.0, 99.0, 300.0, 0.1, 207]
+    assert bars_5min.iloc[-1].tolist() == [5.0, 6.0, 7.0, 4.0, 1]
+    assert stock_frame_1h.frame.loc[('AAPL', pd.Timestamp(START, unit='ms')), 'volume'] == 1708
+
+    #The incremental update gives the same bars as aggregating every bar again
+    expected = stock_frame._aggregate_bars(price_df=stock_frame.frame, timeframe='5min')
+    pd.testing.assert_frame_equal(stock_frame_5min.frame[expected.columns], expected, check_dtype=False)
+
+
+def test_timeframes_must_be_whole_multiples_of_the_base_bars():
+    stock_frame = StockFrame(data=make_bars(), timeframe='5min')
+
+    assert stock_frame.add_timeframe(timeframe='5min') is stock_frame
+    with pytest.raises(ValueError):
+        stock_frame.add_timeframe(timeframe='1min')
+    with pytest.raises(ValueError):
+        stock_frame.add_timeframe(timeframe='2min')
+    with pytest.raises(KeyError):
+        stock_frame.get_timeframe(timeframe='1h')
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_the_store_is_partitioned_by_symbol_and_date(file_format, tmp_path):
+    #Two days of bars
+    stock_frame = StockFrame(data=make_bars(count=2) + make_bars(count=2, start=START + 86400000))
+
+    written_files = stock_frame.save(store_path=tmp_path, file_format=file_format)
+
+    assert sorted(path.name for path in (tmp_path / 'AAPL').iterdir()) == ['2020-09-13' + written_files[0].suffix, '2020-09-14' + written_files[0].suffix]
+    assert len(written_files) == 4
+
+    loaded_frame = StockFrame.load(store_path=tmp_path, file_format=file_format)
+    assert loaded_frame.frame.index.tolist() == stock_frame.frame.index.tolist()
+    np.testing.assert_array_equal(loaded_frame.frame.to_numpy(), stock_frame.frame.to_numpy())
+    assert StockFrame.load(store_path=tmp_path, symbols=['MSFT'], file_format=file_format).symbol_slices == {'MSFT': slice(0, 4)}
+
+
+def test_saving_from_a_start_date_leaves_the_older_partitions(tmp_path):
+    stock_frame = StockFrame(data=make_bars(count=2) + make_bars(count=2, start=START + 86400000))
+
+    written_files = stock_frame.save(store_path=tmp_path, start=pd.Timestamp(START + 86400000 + 60000, unit='ms'))
+
+    assert sorted(path.name for path in written_files) == ['2020-09-14.parquet', '2020-09-14.parquet']
+
+
+def test_loading_a_missing_store_returns_none(tmp_path):
+    assert StockFrame.load(store_path=tmp_path / 'missing') is None
+    with pytest.raises(ValueError):
+        StockFrame.load(store_path=tmp_path, file_format='csv')
+
+
+class FakeSession():
+
+    def __init__(self, now):
+        self.now = now
+        self.periods = []
+
+    def market_data_history(self, conid, period, bar):
+        self.periods.append(period)
+        symbol = {'1': 'AAPL', '2': 'MSFT'}[conid]
+        #The whole period the first time, the bars of the last 5 minutes afterwards
+        count = 30 if period == '1m' else 5
+        candles = [
+            {'t': self.now - (count - 1 - i) * 60000, 'o': 1.0 + i, 'c': 1.5 + i, 'h': 2.0 + i, 'l': 0.5 + i, 'v': 100}
+            for i in range(count)
+        ]
+        return {'symbol': symbol, 'data': candles}
+
+
+def make_trader(session):
+    trader = Trader.__new__(Trader)
+    trader.session = session
+    trader.historical_prices = {}
+    trader.portfolio = None
+    return trader
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_history_is_loaded_from_the_store_and_only_the_tail_is_requested(file_format, tmp_path):
+    now = int(pd.Timestamp.now(tz='UTC').floor('min').timestamp() * 1000)
+    trader = make_trader(session=FakeSession(now=now))
+
+    stock_frame = trader.load_historical_prices(store_path=tmp_path, period='1m', bar='1min', conids=['1', '2'], file_format=file_format)
+    assert len(stock_frame.frame) == 60
+    assert trader.session.periods == ['1m', '1m']
+
+    #The second start only requests the bars since the last stored bar, which are already stored
+    trader.session.now = now + 2 * 60000
+    stock_frame = trader.load_historical_prices(store_path=tmp_path, period='1m', bar='1min', conids=['1', '2'], file_format=file_format)
+    assert trader.session.periods == ['1m', '1m', '2d', '2d']
+    assert len(stock_frame.frame) == 64
+    assert stock_frame.frame.index.is_unique
+    assert len(StockFrame.load(store_path=tmp_path, file_format=file_format).frame) == 64
+
+
+@pytest.mark.parametrize('gap_days,period', [(0.5, '2d'), (3, '1w'), (20, '1m'), (200, '1y'), (400, '2y'), (8000, '15y')])
+def test_the_tail_period_covers_the_gap(gap_days, period):
+    last_timestamp = pd.Timestamp.now(tz='UTC').tz_localize(None) - pd.Timedelta(days=gap_days)
+
+    assert make_trader(session=None)._missing_tail_period(last_timestamp=last_timestamp) == period
+
+
+def test_compact_frames_use_float32_prices_and_int64_volume():
+    bars = make_bars(count=500)
+    stock_frame = StockFrame(data=bars)
+    compact_frame = StockFrame(data=bars, compact=True)
+
+    assert compact_frame.frame[['open','close','high','low']].dtypes.tolist() == [np.float32] * 4
+    assert compact_frame.frame['volume'].dtype == np.int64
+    assert compact_frame.memory_usage()['total_bytes'] < stock_frame.memory_usage()['total_bytes']
+    np.testing.assert_allclose(compact_frame.frame.to_numpy(dtype=np.float64), stock_frame.frame.to_numpy(), atol=1e-4)
+
+    #New bars don't widen the dtypes again
+    compact_frame.add_rows(data=[{'symbol': 'AAPL', 'datetime': START + 500 * 60000, 'open': 1.0, 'close': 2.0, 'high': 3.0, 'low': 0.5, 'volume': 7}])
+    assert compact_frame.frame['close'].dtype == np.float32
+    assert compact_frame.frame['volume'].dtype == np.int64
+
+
+def test_prices_which_lose_precision_stay_float64():
+    bars = make_bars(count=3)
+    bars[0]['close'] = 1234567.891
+
+    compact_frame = StockFrame(data=bars, compact=True)
+
+    assert compact_frame.frame['close'].dtype == np.float64
+    assert compact_frame.frame['open'].dtype == np.float32
+
+
+def test_frames_built_from_columns_are_sorted_by_symbol_and_time():
+    stock_frame = StockFrame.from_columns(
+        symbol=np.array(['MSFT', 'AAPL', 'MSFT', 'AAPL']),
+        t=np.array([START + 60000, START + 60000, START, START]),
+        o=np.array([4.0, 2.0, 3.0, 1.0]),
+        h=np.array([4.0, 2.0, 3.0, 1.0]),
+        l=np.array([4.0, 2.0, 3.0, 1.0]),
+        c=np.array([4.0, 2.0, 3.0, 1.0]),
+        v=np.ones(4)
+    )
+
+    assert stock_frame.frame.index.is_monotonic_increasing
+    assert stock_frame.frame['close'].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert stock_frame.frame.index.get_level_values('symbol').tolist() == ['AAPL', 'AAPL', 'MSFT', 'MSFT']
+
+
+def test_the_bars_of_one_symbol_in_time_order_are_not_copied():
+    close = np.arange(5, dtype=np.float64)
+
+    stock_frame = StockFrame.from_columns(symbol='AAPL', t=START + np.arange(5) * 60000, o=close, h=close, l=close, c=close, v=close)
+
+    assert np.shares_memory(stock_frame.frame['close'].to_numpy(), close)
+    assert stock_frame.frame.index.get_level_values('symbol').unique().tolist() == ['AAPL']
+    assert stock_frame.frame.index.get_level_values('datetime')[0] == pd.Timestamp(START, unit='ms')
+
+
+def test_the_bars_of_one_symbol_out_of_order_are_sorted():
+    close = np.array([3.0, 1.0, 2.0])
+
+    stock_frame = StockFrame.from_columns(symbol='AAPL', t=START + np.array([2, 0, 1]) * 60000, o=close, h=close, l=close, c=close, v=close)
+
+    assert stock_frame.frame['close'].tolist() == [1.0, 2.0, 3.0]
+    assert stock_frame.frame.index.is_monotonic_increasing
+
+
+def test_frames_from_columns_match_frames_from_quotes():
+    bars = make_bars()
+    columns = {column: np.array([bar[column] for bar in bars]) for column in bars[0]}
+
+    from_quotes = StockFrame(data=bars).frame
+    from_columns = StockFrame(data=columns).frame
+
+    #Columns are always stored as float64, like the candles of a history response
+    pd.testing.assert_frame_equal(from_columns, from_quotes.astype(np.float64))
+
+
+def test_historical_prices_build_a_frame_through_the_trader():
+    trader = Trader.__new__(Trader)
+    trader.portfolio = None
+    bars = make_bars()
+    symbol_columns = [
+        (symbol, {column: np.array([bar[column] for bar in bars if bar['symbol'] == symbol]) for column in ['datetime', 'open', 'close', 'high', 'low', 'volume']})
+        for symbol in ['MSFT', 'AAPL']
+    ]
+
+    stock_frame = trader.create_stock_frame(data=trader._join_symbol_columns(symbol_columns=symbol_columns))
+
+    pd.testing.assert_frame_equal(stock_frame.frame, StockFrame(data=bars).frame.astype(np.float64))
+
+
+def make_random_bars(count, start_index=0, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {'symbol': symbol, 'datetime': START + (start_index + i) * 60000, 'open': 100 + rng.normal(), 'close': 100 + rng.normal(),
+         'high': 101.0, 'low': 99.0, 'volume': 100}
+        for symbol in ('AAPL','MSFT') for i in range(count)
+    ]
+
+
+def run_indicators(max_bars=None, trim_batch=20):
+    stock_frame = StockFrame(data=make_random_bars(count=1000))
+    indicators = Indicators(price_df=stock_frame)
+    indicators.sma(period=20)
+    indicators.rsi(period=14)
+    indicators.ema(period=50)
+    indicators.macd()
+    if max_bars is not None:
+        stock_frame.set_retention(max_bars=max_bars, trim_batch=trim_batch)
+
+    for k in range(60):
+        stock_frame.add_rows(data=make_random_bars(count=1, start_index=1000 + k, seed=k + 1))
+        indicators.refresh()
+
+    return stock_frame
+
+
+@pytest.fixture(scope='module')
+def retention_frames():
+    #The same bars with and without a retention policy
+    return run_indicators(max_bars=100), run_indicators()
+
+
+def test_retention_keeps_the_bars_the_indicators_need(retention_frames):
+    stock_frame, expected_frame = retention_frames
+
+    #Only the sma needs a window, the exponentially weighted indicators carry the trimmed bars over
+    assert stock_frame.required_lookback == 20
+    assert len(stock_frame.frame) < 2 * (100 + 20)
+    assert len(expected_frame.frame) == 2 * 1060
+
+    latest = stock_frame.last_rows
+    expected_latest = expected_frame.last_rows
+    np.testing.assert_allclose(latest['sma'], expected_latest['sma'], rtol=1e-12)
+
+
+@pytest.mark.parametrize('column', ['rsi', 'ema', 'macd_fast', 'macd_slow', 'macd', 'macd_signal'])
+def test_trimming_does_not_change_the_exponentially_weighted_indicators(retention_frames, column):
+    stock_frame, expected_frame = retention_frames
+
+    #Every bar which is kept has the value calculated over the whole history, up to rounding
+    trimmed = stock_frame.frame[column]
+    expected = expected_frame.frame.loc[stock_frame.frame.index, column]
+    assert trimmed.notna().all()
+    np.testing.assert_allclose(trimmed, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_the_exponentially_weighted_indicators_match_pandas():
+    stock_frame = StockFrame(data=make_random_bars(count=200))
+    indicators = Indicators(price_df=stock_frame)
+    indicators.ema(period=10)
+    indicators.macd()
+
+    close_groups = stock_frame.frame['close'].groupby(level='symbol')
+    np.testing.assert_allclose(stock_frame.frame['ema'], close_groups.transform(lambda x: x.ewm(span=10).mean()), rtol=1e-12)
+    np.testing.assert_allclose(
+        stock_frame.frame['macd_slow'],
+        close_groups.transform(lambda x: x.ewm(span=26, min_periods=26).mean()),
+        rtol=1e-12
+    )
+
+
+def test_trim_listeners_get_the_bars_being_dropped():
+    stock_frame = StockFrame(data=make_random_bars(count=50))
+    stock_frame.set_retention(max_bars=45, trim_batch=1)
+    trimmed_frames = []
+    stock_frame.add_trim_listener(listener=trimmed_frames.append)
+
+    expected = stock_frame.frame.groupby(level='symbol').head(5)
+    stock_frame.trim()
+
+    assert len(trimmed_frames) == 1
+    pd.testing.assert_frame_equal(trimmed_frames[0], expected)
+
+
+def test_bars_are_only_dropped_in_batches():
+    stock_frame = StockFrame(data=make_random_bars(count=50))
+    stock_frame.register_lookback(column_name='sma', lookback=10)
+    stock_frame.set_retention(max_bars=45, trim_batch=20)
+
+    assert stock_frame.trim() == 0
+    assert stock_frame.trim(force=True) == 10
+    assert stock_frame.symbol_slices == {'AAPL': slice(0, 45), 'MSFT': slice(45, 90)}
+
+
+def test_max_age_is_measured_from_the_latest_bar_of_every_symbol():
+    stock_frame = StockFrame(data=make_random_bars(count=180))
+    stock_frame.set_retention(max_age='1h', trim_batch=1)
+
+    assert stock_frame.trim() == 2 * 119
+    assert len(stock_frame.get_symbol_frame(symbol='MSFT')) == 61
+
+
+def test_columns_depending_on_the_whole_history_stop_the_trimming():
+    stock_frame = StockFrame(data=make_random_bars(count=50))
+    Indicators(price_df=stock_frame).vwap()
+    stock_frame.set_retention(max_bars=10, trim_batch=1)
+
+    assert stock_frame.required_lookback is None
+    assert stock_frame.trim(force=True) == 0
+    with pytest.raises(ValueError):
+        stock_frame.set_retention(max_bars=0)
+
+
+def test_symbol_groups_are_cached_until_the_rows_change():
+    stock_frame = StockFrame(data=make_bars(symbols=('MSFT','AAPL','TSLA'), count=5))
+    symbol_groups = stock_frame.symbol_groups
+
+    assert stock_frame.symbol_groups is symbol_groups
+    assert stock_frame.symbol_slices == {'AAPL': slice(0, 5), 'MSFT': slice(5, 10), 'TSLA': slice(10, 15)}
+
+    stock_frame.add_rows(data=[{'symbol': 'AAPL', 'datetime': START + 5 * 60000, 'open': 1.0, 'close': 2.0, 'high': 3.0, 'low': 0.5, 'volume': 7}])
+
+    assert stock_frame.symbol_groups is not symbol_groups
+    assert stock_frame.symbol_slices == {'AAPL': slice(0, 6), 'MSFT': slice(6, 11), 'TSLA': slice(11, 16)}
+    assert stock_frame.get_symbol_frame(symbol='AAPL')['close'].iloc[-1] == 2.0
+    assert stock_frame.symbol_groups.size()['size'].tolist() == [6, 5, 5]
+
+
+def test_last_rows_holds_the_latest_bar_of_every_symbol():
+    stock_frame = StockFrame(data=make_bars(symbols=('MSFT','AAPL'), count=5))
+
+    last_rows = stock_frame.last_rows
+
+    assert last_rows.index.get_level_values('symbol').tolist() == ['AAPL', 'MSFT']
+    assert last_rows['close'].tolist() == [5.5, 5.5]
+    with pytest.raises(KeyError):
+        stock_frame.get_symbol_frame(symbol='TSLA')
+
+
+def test_signals_are_checked_on_the_latest_bars():
+    bars = make_bars(symbols=('MSFT','AAPL'), count=5)
+    for bar in bars:
+        if bar['symbol'] == 'AAPL':
+            bar['close'] -= 5.0
+    stock_frame = StockFrame(data=bars)
+    indicators = Indicators(price_df=stock_frame)
+    indicators.sma(period=2)
+    indicators.set_indicator_signal(indicator='sma', buy=4.0, sell=4.0, condition_buy=operator.gt, condition_sell=operator.lt)
+
+    signals = indicators.check_signals()
+
+    #Only the symbols which meet a condition are returned
+    assert signals['buys'].index.get_level_values('symbol').tolist() == ['MSFT']
+    assert signals['sells'].index.get_level_values('symbol').tolist() == ['AAPL']
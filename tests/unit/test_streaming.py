@@ -0,0 +1,140 @@
+import json
+import time
+
+import pytest
+
+from ibw.websocket import decode_frame
+from ibw.websocket import encode_frame
+from ibw.websocket import OPCODE_TEXT
+from robot.quotes import QuoteStore
+from robot.stock_frame import StockFrame
+from robot.streaming import MarketDataStream
+from robot.streaming import parse_field
+from robot.trader import Trader
+from tests.market_data_server import MarketDataServer
+
+# The start of a minute, in epoch ms
+START = 1600000020000 - 1600000020000 % 60000
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting for the stream.')
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def market_data_server():
+    server = MarketDataServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('133.10', 133.1), ('C133.10', 133.1), ('H12', 12.0), ('1,200', 1200.0), ('1.2K', 1200.0), ('3M', 3e6), (7, 7.0), ('', None), ('n/a', None), (None, None)
+])
+def test_fields_are_parsed_from_the_gateway_format(value, expected):
+    assert parse_field(value) == expected
+
+
+@pytest.mark.parametrize('size', [0, 125, 126, 65535, 65536])
+def test_frames_survive_a_round_trip(size):
+    payload = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+    buffer = bytearray(encode_frame(payload=payload, opcode=OPCODE_TEXT, mask=True))
+
+    #Nothing is decoded until the whole frame has arrived
+    assert decode_frame(buffer[:-1] if size else buffer[:1]) is None
+    fin, opcode, decoded, frame_size = decode_frame(buffer + b'next')
+
+    assert (fin, opcode, decoded, frame_size) == (True, OPCODE_TEXT, payload, len(buffer))
+
+
+def test_quotes_and_bars_are_streamed(market_data_server):
+    stock_frame = StockFrame(data=[{'symbol': 'AAPL', 'datetime': START - 60000, 'open': 1.0, 'close': 1.0, 'high': 1.0, 'low': 1.0, 'volume': 1}])
+    quote_store = QuoteStore()
+    stream = MarketDataStream(conids={'265598': 'AAPL'}, price_df=stock_frame, url=market_data_server.url, session_provider=lambda: 'abc',
+        poll_interval=0.05, quote_store=quote_store)
+    stream.start()
+    try:
+        wait_until(lambda: market_data_server.subscribers(conid='265598') == 1)
+        assert json.loads(market_data_server.received[0]) == {'session': 'abc'}
+        assert market_data_server.received[1].startswith('smd+265598+')
+
+        market_data_server.push(conid='265598', fields={'31': '10.0', '7059': '100', '84': 'C9.9', '86': '10.1'}, updated=START + 1000)
+        market_data_server.push(conid='265598', fields={'31': '12.0', '7059': '1.2K'}, updated=START + 30000)
+        wait_until(lambda: stream.messages == 2)
+
+        assert stream.quote(conid='265598') == {
+            'last': 12.0, 'last_size': 1200.0, 'bid': 9.9, 'bid_size': None, 'ask': 10.1, 'ask_size': None, 'updated': START + 30000
+        }
+        assert stream.live_bar(conid='265598')['volume'] == 1300.0
+
+        market_data_server.push(conid='265598', fields={'31': '11.0', '7059': '5'}, updated=START + 61000)
+        wait_until(lambda: stream.messages == 3)
+
+        #Both bars are long past their grace period, so they are added to the frame as soon as they are flushed
+        assert len(stream.bar_builder.flush()) == 2
+        with stream.frame_lock:
+            assert stock_frame.frame.loc['AAPL'].iloc[1].tolist() == [10.0, 12.0, 12.0, 10.0, 1300.0]
+            assert len(stock_frame.frame) == 3
+        assert quote_store.price(conid='265598') == 11.0
+    finally:
+        stream.stop()
+
+    assert not stream.is_connected
+
+
+def test_the_stream_reconnects_and_subscribes_again(market_data_server):
+    stream = MarketDataStream(conids={'265598': 'AAPL'}, url=market_data_server.url, poll_interval=0.05, reconnect_delay=0.05)
+    stream.start()
+    try:
+        wait_until(lambda: market_data_server.subscribers(conid='265598') == 1)
+        stream.subscribe(conid='272093', symbol='MSFT')
+        wait_until(lambda: market_data_server.subscribers(conid='272093') == 1)
+
+        market_data_server.drop_connections()
+
+        wait_until(lambda: market_data_server.connections == 2)
+        wait_until(lambda: market_data_server.subscribed_conids() == {'265598', '272093'})
+        assert stream.reconnects == 1
+
+        stream.unsubscribe(conid='265598')
+        wait_until(lambda: market_data_server.subscribed_conids() == {'272093'})
+        market_data_server.push(conid='272093', fields={'31': '200.0'})
+        wait_until(lambda: stream.quote(conid='272093') is not None)
+        assert stream.quote(conid='265598') is None
+    finally:
+        stream.stop()
+
+
+def test_messages_of_other_topics_and_conids_are_ignored():
+    stream = MarketDataStream(conids={'265598': 'AAPL'})
+
+    stream._handle_message(message='not json')
+    stream._handle_message(message=json.dumps({'topic': 'sbd+265598', 'conid': 265598, '31': '1.0'}))
+    stream._handle_message(message=json.dumps({'topic': 'smd+1', 'conid': 1, '31': '1.0'}))
+
+    assert stream.quote(conid='265598') is None
+    assert stream.quote(conid='1') is None
+    assert stream.live_bar(conid='1') is None
+
+
+def test_the_trader_streams_into_its_stock_frame_and_quotes():
+    class TickleSession:
+        def tickle(self):
+            return {'session': 'abc'}
+
+    trader = Trader.__new__(Trader)
+    trader.session = TickleSession()
+    trader.quote_store = QuoteStore()
+    trader.stock_frame = StockFrame(data=[{'symbol': 'AAPL', 'datetime': START, 'open': 1.0, 'close': 1.0, 'high': 1.0, 'low': 1.0, 'volume': 1}])
+
+    stream = trader.create_market_data_stream(conids={'265598': 'AAPL'}, url='ws://127.0.0.1:1/v1/api/ws')
+
+    assert trader.market_data_stream is stream
+    assert stream.bar_builder.price_df is trader.stock_frame
+    assert stream.quote_store is trader.quote_store
+    assert stream.session_provider() == 'abc'
@@ -0,0 +1,129 @@
+import json
+import time
+
+import pytest
+
+from ibw.client import IBClient
+from ibw.transport import RecordingTransport, ReplayTransport
+
+GATEWAY_URL = 'https://localhost:5000/v1/api/'
+
+
+class FakeResponse():
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {'Content-Type': 'application/json'}
+        self.content = body.encode('utf-8')
+
+
+class CountingTransport():
+
+    def __init__(self):
+        self.requests = 0
+
+    def request(self, method, url, headers=None, params=None, json=None):
+        self.requests += 1
+        return FakeResponse(body='{{"n":{n}}}'.format(n=self.requests))
+
+
+def record_session(record_path):
+    recording_transport = RecordingTransport(record_path=record_path, transport=CountingTransport())
+    recording_transport.request(method='GET', url=GATEWAY_URL + 'iserver/a', params={'x': 1})
+    recording_transport.request(method='GET', url=GATEWAY_URL + 'iserver/a', params={'x': 2})
+    recording_transport.request(method='POST', url=GATEWAY_URL + 'iserver/b', json={'order': 1})
+    recording_transport.close()
+
+
+def test_every_exchange_is_recorded_as_a_line(tmp_path):
+    record_path = tmp_path / 'recordings' / 'session.jsonl'
+
+    record_session(record_path=record_path)
+
+    records = [json.loads(line) for line in record_path.read_text().splitlines()]
+    assert [(record['method'], record['path'], record['params'], record['json']) for record in records] == [
+        ('GET', '/v1/api/iserver/a', {'x': 1}, None),
+        ('GET', '/v1/api/iserver/a', {'x': 2}, None),
+        ('POST', '/v1/api/iserver/b', None, {'order': 1})
+    ]
+    assert [record['body'] for record in records] == ['{"n":1}', '{"n":2}', '{"n":3}']
+    assert all(record['status'] == 200 for record in records)
+
+
+def test_requests_are_served_the_exact_match_only(tmp_path):
+    record_path = tmp_path / 'session.jsonl'
+    record_session(record_path=record_path)
+
+    replay_transport = ReplayTransport(record_path=record_path, speed=None)
+
+    assert replay_transport.request(method='GET', url='https://other/v1/api/iserver/a', params={'x': 2}).json() == {'n': 2}
+    #A response recorded for other parameters or another payload is never served
+    with pytest.raises(LookupError):
+        replay_transport.request(method='GET', url='https://other/v1/api/iserver/a', params={'x': 9})
+    with pytest.raises(LookupError):
+        replay_transport.request(method='POST', url='https://other/v1/api/iserver/b', json={'order': 5})
+    assert replay_transport.request(method='GET', url='https://other/v1/api/iserver/a', params={'x': 1}).json() == {'n': 1}
+
+
+def test_matching_on_the_path_is_opt_in(tmp_path):
+    record_path = tmp_path / 'session.jsonl'
+    record_session(record_path=record_path)
+
+    replay_transport = ReplayTransport(record_path=record_path, speed=None, match='path')
+
+    assert replay_transport.request(method='GET', url='https://other/v1/api/iserver/a', params={'x': 2}).json() == {'n': 2}
+    #No exact match left, so the next response of the endpoint is served
+    assert replay_transport.request(method='GET', url='https://other/v1/api/iserver/a', params={'x': 9}).json() == {'n': 1}
+    assert replay_transport.request(method='POST', url='https://other/v1/api/iserver/b', json={'order': 5}).json() == {'n': 3}
+
+    with pytest.raises(LookupError):
+        replay_transport.request(method='GET', url='https://other/v1/api/iserver/a', params={'x': 1})
+    with pytest.raises(ValueError):
+        ReplayTransport(record_path=record_path, match='method')
+
+
+def test_a_torn_last_line_is_skipped(tmp_path):
+    record_path = tmp_path / 'session.jsonl'
+    record_session(record_path=record_path)
+    with open(record_path, mode='a') as record_file:
+        record_file.write('{"t":1.0,"method":"GE')
+
+    replay_transport = ReplayTransport(record_path=record_path, speed=None)
+
+    assert len(replay_transport._records) == 3
+
+
+def test_responses_are_held_until_their_recorded_time(tmp_path):
+    record_path = tmp_path / 'session.jsonl'
+    record = {'t': 0.2, 'elapsed': 0.1, 'method': 'GET', 'path': '/v1/api/iserver/a', 'params': None, 'json': None,
+              'status': 200, 'content_type': 'application/json', 'body': '{}'}
+    record_path.write_text(json.dumps(record) + '\n' + json.dumps(record) + '\n')
+
+    start_time = time.monotonic()
+    ReplayTransport(record_path=record_path, speed=None).request(method='GET', url=GATEWAY_URL + 'iserver/a')
+    assert time.monotonic() - start_time < 0.1
+
+    start_time = time.monotonic()
+    ReplayTransport(record_path=record_path, speed=2.0).request(method='GET', url=GATEWAY_URL + 'iserver/a')
+    assert time.monotonic() - start_time >= 0.14
+
+
+def test_the_client_can_run_on_a_recording(tmp_path):
+    record_path = tmp_path / 'session.jsonl'
+    candles = {'symbol': 'AAPL', 'data': [{'t': 1600000020000, 'o': 1.0, 'c': 1.5, 'h': 2.0, 'l': 0.5, 'v': 100}]}
+    record = {'t': 0.0, 'elapsed': 0.0, 'method': 'GET', 'path': '/v1/portal/iserver/marketdata/history',
+              'params': {'conid': '265598', 'period': '1d', 'bar': '1min'}, 'json': None,
+              'status': 200, 'content_type': 'application/json', 'body': json.dumps(candles)}
+    record_path.write_text(json.dumps(record) + '\n')
+
+    ib_client = IBClient(
+        username='IB_PAPER_USERNAME',
+        account='IB_PAPER_ACCOUNT',
+        client_gateway_path=str(tmp_path),
+        transport=ReplayTransport(record_path=record_path, speed=None)
+    )
+
+    assert ib_client.market_data_history(conid='265598', period='1d', bar='1min') == candles
+    metrics = ib_client.metrics.snapshot()[('GET', 'iserver/marketdata/history')]
+    assert (metrics['requests'], metrics['errors'], metrics['bytes_received']) == (1, 0, len(json.dumps(candles)))